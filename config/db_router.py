@@ -0,0 +1,117 @@
+"""
+Primary/replica routing.
+
+Everything goes to the primary except the reads of code running under `use_replica`:
+the catalog, search, offers and export endpoints and the export task. Those reads
+stay on the primary anyway
+
+- inside a transaction on the primary, so a block that writes reads its own writes,
+  and the primary's row locks and snapshots are not mixed with the replica's;
+- for REPLICA_PIN_TIMEOUT seconds after a user changed the catalog (`pin_primary`),
+  so the user does not read the catalog from before the change while the replica catches up;
+- under `use_primary`, for data that is cached for longer than the replication lag.
+
+Without a REPLICA_DATABASE alias in DATABASES everything goes to the primary.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica = ContextVar('use_replica', default=False)
+
+
+def _pin_key(user):
+    return f'db:primary:{user.pk}'
+
+
+def pin_primary(user):
+    """
+    Send the catalog reads of `user` to the primary for the next REPLICA_PIN_TIMEOUT seconds.
+    """
+    if user.is_authenticated:
+        cache.set(_pin_key(user), True, settings.REPLICA_PIN_TIMEOUT)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user)) is not None
+
+
+@contextmanager
+def _reads(replica):
+    token = _replica.set(replica)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def use_replica(user=None):
+    """
+    Let the reads in this block go to the replica, unless `user` is pinned to the primary.
+    """
+    return _reads(user is None or not is_pinned(user))
+
+
+def use_primary():
+    """
+    Send the reads in this block to the primary, also within `use_replica`.
+    """
+    return _reads(False)
+
+
+def replica_reads(view_method):
+    """
+    Run a view method under `use_replica` for the request user.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        with use_replica(request.user):
+            return view_method(self, request, *args, **kwargs)
+    return wrapper
+
+
+def iter_replica(iterable, user=None):
+    """
+    Iterate under `use_replica`, for generators that run after the view returned, like streamed responses.
+    """
+    if user is not None and is_pinned(user):
+        return iter(iterable)
+    return _iter_replica(iterable)
+
+
+def _iter_replica(iterable):
+    iterator = iter(iterable)
+    while True:
+        # set around every step, a streamed response may be iterated from several threads
+        with use_replica():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = settings.REPLICA_DATABASE
+        if (
+            _replica.get() and replica in settings.DATABASES
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema by replication
+        return db == DEFAULT_DB_ALIAS
@@ -38,8 +38,10 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
+    'rest_framework.authtoken',
     'drf_yasg',
 
     'core',
@@ -47,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +59,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per request query and latency stats, see core.instrumentation
+INSTRUMENTATION_SAMPLE_SIZE = 1000
+INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = 10
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -88,25 +95,97 @@ DATABASES = {
         'NAME': 'nyan_db',
         'USER': 'nyan_user',
         'PASSWORD': 'nyan_password',
+        # persistent connections, checked before reuse by the first query of every request
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# A streaming replica of the primary for catalog, search and export reads, see config.db_router.
+# Locally it is the same database; tests use it as a mirror of the primary.
+DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# how long catalog reads of a user who changed the catalog stay on the primary, above the replication lag
+REPLICA_PIN_TIMEOUT = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
     }
 }
 
+CATALOG_CACHE_TIMEOUT = 60 * 10
+
+# Resolved API tokens, see security.authentication
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 5
+AUTH_TOKEN_LOCAL_TIMEOUT = 10
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # session first, so unauthenticated requests keep getting 403 rather than 401
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'security.authentication.CachedTokenAuthentication',
+    ],
+}
+
+SWAGGER_SETTINGS = {
+    'SECURITY_DEFINITIONS': {
+        'Token': {'type': 'apiKey', 'name': 'Authorization', 'in': 'header'},
+    },
+}
+
+
+# Celery
+# https://docs.celeryq.dev/en/stable/django/first-steps-with-django.html
+
+CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
+CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
+CELERY_RESULT_EXPIRES = 60 * 60 * 24
+CELERY_TASK_TRACK_STARTED = True
+CELERY_RESULT_EXTENDED = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# price lists downloaded by URL are cut off at this size, see core.services.downloads
+PRICE_LIST_MAX_SIZE = 100 * 1024 * 1024
+
+TEST_RUNNER = 'config.test_runner.CeleryEagerTestRunner'
+
+
+# Email
+# https://docs.djangoproject.com/en/4.1/topics/email/
+
+DEFAULT_FROM_EMAIL = 'orders@nyan.local'
+# administrators fulfilling the orders, they get the invoices of core.services.invoices
+INVOICE_RECIPIENTS = ['admin@nyan.local']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
 AUTH_PASSWORD_VALIDATORS = [
     {
-        'NAME': 'django.contrib.security.password_validation.UserAttributeSimilarityValidator',
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
     },
     {
-        'NAME': 'django.contrib.security.password_validation.MinimumLengthValidator',
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
     },
     {
-        'NAME': 'django.contrib.security.password_validation.CommonPasswordValidator',
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
     },
     {
-        'NAME': 'django.contrib.security.password_validation.NumericPasswordValidator',
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
 
@@ -129,3 +208,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded price lists and export files
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class CeleryEagerTestRunner(DiscoverRunner):
+    """
+    Run celery tasks in the calling process, so tests need neither a broker nor a worker.
+    Like EMAIL_BACKEND, the settings are switched before the celery app reads them.
+
+    Connections are not kept between requests: the connections of threads started by tests
+    (async views, concurrent checkouts) would keep the test database open when it is dropped.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        for database in settings.DATABASES.values():
+            database['CONN_MAX_AGE'] = 0
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.CELERY_TASK_EAGER_PROPAGATES = True
+        settings.CELERY_TASK_STORE_EAGER_RESULT = True
+        settings.CELERY_RESULT_BACKEND = 'cache+memory://'
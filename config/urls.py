@@ -41,6 +41,7 @@ swagger_urlpatterns = [
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/auth/', include(('security.urls', 'security.urls'))),
     path('api/', include(('core.urls', 'core.urls'))),
 ] + swagger_urlpatterns
 
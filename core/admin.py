@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.contrib.admin import register
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
 
-from core.models import Shop, Category, Product, Parameter, ProductParameter
+from core import tasks
+from core.models import Shop, Category, Product, Parameter, ProductParameter, Order, ItemInOrder
+from core.services import order_status
 
 
 admin.site.register(Parameter)
@@ -54,4 +58,65 @@ class ProductAdmin(admin.ModelAdmin):
 
     inlines = [
         ProductParameterTabularInline,
-    ]
\ No newline at end of file
+    ]
+
+
+class ItemInOrderTabularInline(admin.TabularInline):
+    model = ItemInOrder
+    extra = 0
+    raw_id_fields = ['product_info', 'shop']
+
+
+def _order_items():
+    return ItemInOrder.objects.filter(order=OuterRef('pk')).order_by().values('order')
+
+
+@register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'number', 'user', 'status', 'item_count', 'total', 'created_at']
+    list_display_links = ['id', 'number']
+    list_filter = ['status']
+    list_select_related = ['user']
+    search_fields = ['=user__email']
+    ordering = ['-id']
+    raw_id_fields = ['user']
+    # the unfiltered count is a scan of all orders, the filtered one is enough
+    show_full_result_count = False
+    actions = ['mark_delivered', 'mark_not_delivered']
+
+    inlines = [
+        ItemInOrderTabularInline,
+    ]
+
+    def get_queryset(self, request):
+        # correlated subqueries instead of joins with GROUP BY: they are computed for the rows
+        # of the page only, and PostgreSQL leaves them out of the changelist count
+        return super().get_queryset(request).annotate(
+            item_count=Subquery(_order_items().annotate(count=Count('*')).values('count')),
+            total=Subquery(
+                _order_items().annotate(total=Sum(F('quantity') * F('price'))).values('total'),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+    @admin.display(description='items')
+    def item_count(self, order):
+        return order.item_count or 0
+
+    @admin.display(description='total')
+    def total(self, order):
+        return order.total or 0
+
+    def set_status(self, request, queryset, status):
+        with transaction.atomic():
+            order_ids = order_status.set_status(queryset, status)
+            transaction.on_commit(lambda: tasks.queue_status_notifications(order_ids))
+        self.message_user(request, f'{len(order_ids)} orders changed to "{Order.StatusChoices(status).label}".')
+
+    @admin.action(description='Mark selected orders as delivered')
+    def mark_delivered(self, request, queryset):
+        self.set_status(request, queryset, Order.StatusChoices.DELIVERED)
+
+    @admin.action(description='Mark selected orders as not delivered')
+    def mark_not_delivered(self, request, queryset):
+        self.set_status(request, queryset, Order.StatusChoices.NOT_DELIVERED)
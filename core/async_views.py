@@ -0,0 +1,147 @@
+"""
+Async variants of the catalog, offers and basket read endpoints, for ASGI deployments.
+
+The ORM of this Django version is synchronous, and its async query methods run one
+at a time on a single thread. So queries run in worker threads through `run_query`,
+each thread with its own database connection, and the independent queries of a
+request (a catalog page and its facets, offers and the product check) are awaited
+together. Cached catalog pages and paused shops are read with the async cache client.
+
+The responses and errors are those of the sync views in core.views.
+"""
+import asyncio
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound, ParseError
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from config.db_router import is_pinned, use_replica
+from core.instrumentation import recorded_queries
+from core.models import ItemInShoppingBasket, Product
+from core.pagination import KeysetPagination
+from core.serializers.fast import BASKET_ITEM_FIELDS, serialize_basket, serialize_products
+from core.serializers.products import ProductFilterSerializer, ProductOffersRequestSerializer
+from core.services import catalog_cache, catalog_entries, shop_state
+from core.services.facets import get_facets
+from core.services.offers import compare_offers
+
+
+def _call(func, args):
+    try:
+        with recorded_queries():
+            return func(*args)
+    finally:
+        # the connection of the worker thread is closed when it outlived CONN_MAX_AGE
+        close_old_connections()
+
+
+async def run_query(func, *args):
+    """
+    Run `func(*args)` in a worker thread with its own database connection.
+    """
+    return await sync_to_async(_call, thread_sensitive=False)(func, args)
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def _authenticate(request, check_pin):
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    return drf_request.user, check_pin and is_pinned(drf_request.user)
+
+
+def async_api(*methods, replica_reads=False):
+    """
+    Allow `methods`, require an authenticated user and turn API exceptions into responses, as APIView does.
+    Session authenticated requests are still checked for a CSRF token by SessionAuthentication.
+    With `replica_reads` the view reads from the replica, see config.db_router.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return _json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                request.user, pinned = await run_query(_authenticate, request, replica_reads)
+                if not request.user.is_authenticated:
+                    raise NotAuthenticated()
+                if replica_reads and not pinned:
+                    with use_replica():
+                        return await view(request, *args, **kwargs)
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                # the first authentication class is the session one, which has no WWW-Authenticate challenge
+                status = 403 if isinstance(exc, (AuthenticationFailed, NotAuthenticated)) else exc.status_code
+                detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                return _json(detail, status=status)
+        # csrf_exempt of this Django version wraps the view in a sync function
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api('GET', replica_reads=True)
+async def products(request):
+    filters = ProductFilterSerializer(data=request.GET)
+    filters.is_valid(raise_exception=True)
+    params = filters.validated_data
+    facets = params.pop('facets', False)
+    data = await catalog_cache.aget_or_set(
+        request,
+        lambda: get_page_data(request, params, facets),
+        shops=[params['shop']] if 'shop' in params else (),
+        categories=[params['category']] if 'category' in params else (),
+    )
+    return _json(data)
+
+
+async def get_page_data(request, params, facets=False):
+    paused_shops = await shop_state.aget_paused_shop_ids(shared=True)
+    products, rows = catalog_entries.get_catalog_rows(params, paused_shops)
+    paginator = KeysetPagination()
+
+    def get_page():
+        page = paginator.paginate_queryset(rows, Request(request))
+        return paginator.get_paginated_response(serialize_products(page)).data
+
+    if not facets:
+        return await run_query(get_page)
+    data, data_facets = await asyncio.gather(
+        run_query(get_page), run_query(get_facets, products if paused_shops or any(params.values()) else None),
+    )
+    data['facets'] = data_facets
+    return data
+
+
+@async_api('GET', replica_reads=True)
+async def product_offers(request, pk):
+    # the product is checked alongside the offers instead of after them, for one round trip of latency
+    (data,), exists = await asyncio.gather(
+        run_query(compare_offers, [pk]), run_query(Product.objects.filter(pk=pk).exists),
+    )
+    if not data['offers'] and not exists:
+        raise NotFound()
+    return _json(data)
+
+
+@async_api('POST', replica_reads=True)
+async def product_offers_batch(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError as exc:
+        raise ParseError(f'JSON parse error - {exc}') from exc
+    serializer = ProductOffersRequestSerializer(data=body)
+    serializer.is_valid(raise_exception=True)
+    return _json(await run_query(compare_offers, serializer.validated_data['products']))
+
+
+@async_api('GET')
+async def basket(request):
+    items = ItemInShoppingBasket.objects.filter(shopping_basket__user=request.user).with_totals().order_by('id')
+    return _json(await run_query(lambda: serialize_basket(items.values_list(*BASKET_ITEM_FIELDS))))
@@ -0,0 +1,160 @@
+"""
+Benchmarks of the API hot paths on a synthetic catalog (see core.benchmarks.data):
+catalog pages, the basket, price list import and export.
+
+Every benchmark reports the latency of the timed runs, and the query count and peak
+Python memory of one extra traced run. Results are plain dicts that are written
+as JSON, so two runs can be compared with `compare`.
+"""
+import base64
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+import django
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+
+from core.benchmarks import data
+from core.instrumentation import RequestRecord, percentiles
+from core.models import Category, ProductCatalogEntry, Shop
+from core.services.price_list_export import JSONL, iter_export
+from core.services.price_list_import import import_price_list
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+DEFAULT_SCALES = [1_000, 100_000, 1_000_000]
+BASKET_LINES = 20
+BUYERS = 10
+# slower by more than this share is reported as a regression
+REGRESSION_TOLERANCE = 0.2
+
+
+def measure(func, repeat):
+    """
+    Latency percentiles of `repeat` runs, plus query count and peak memory of a traced run.
+    """
+    record = RequestRecord()
+    tracemalloc.start()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(record))
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'latency_ms': {'min': round(min(timings), 3), **{k: round(v, 3) for k, v in percentiles(timings).items()}},
+        'queries': record.queries,
+        'peak_memory_kb': peak // 1024,
+    }
+
+
+def _get(client, url, params=None):
+    def request():
+        # the catalog cache is cleared, so the lists are computed every time
+        cache.clear()
+        response = client.get(url, params)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+    return request
+
+
+def _cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, ensure_ascii=False).encode()).decode()
+
+
+def run_scale(products, repeat=5, seed=0):
+    """
+    Load a catalog of `products` products and run the benchmarks on it.
+    The data is created in a transaction that is rolled back afterwards.
+    """
+    # a process-local cache that can be cleared between requests, and the host of the test client
+    settings = override_settings(CACHES=LOCMEM_CACHES, ALLOWED_HOSTS=['testserver'])
+    with tempfile.TemporaryDirectory() as directory, settings, transaction.atomic():
+        paths = data.write_price_lists(directory, products, seed=seed)
+        started = time.perf_counter()
+        for path in paths:
+            with open(path, 'rb') as stream:
+                import_price_list(stream)
+        load_seconds = time.perf_counter() - started
+        users = data.create_baskets(BUYERS, BASKET_LINES, seed=seed)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        client = Client()
+        client.force_login(users[0])
+        shop = Shop.objects.get(name='Бенчмарк 0')
+        category = Category.objects.filter(name=data.get_categories(products)[0]['name']).get()
+        middle = ProductCatalogEntry.objects.order_by('name', 'product_id').values_list('name', 'product_id')[
+            products // 2
+        ]
+
+        def reimport():
+            with open(paths[0], 'rb') as stream:
+                import_price_list(stream)
+
+        benchmarks = {
+            'products_first_page': _get(client, '/api/products/'),
+            'products_deep_page': _get(client, '/api/products/', {'cursor': _cursor(list(middle))}),
+            'products_category': _get(client, '/api/products/', {'category': category.pk}),
+            'products_shop_in_stock': _get(client, '/api/products/', {'shop': shop.pk, 'in_stock': 'true'}),
+            'products_facets': _get(client, '/api/products/', {'facets': 'true', 'category': category.pk}),
+            'basket': _get(client, '/api/basket/'),
+            'export_jsonl': lambda: sum(len(chunk) for chunk in iter_export(shop, JSONL)),
+            'import': reimport,
+        }
+        result = {
+            'scale': products,
+            'shops': len(paths),
+            'load_seconds': round(load_seconds, 3),
+            'benchmarks': {
+                # import and export go through every good of a shop, they are timed once
+                name: measure(func, 1 if name in ('import', 'export_jsonl') else repeat)
+                for name, func in benchmarks.items()
+            },
+        }
+        transaction.set_rollback(True)
+    return result
+
+
+def run(scales=DEFAULT_SCALES, repeat=5, seed=0):
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.display_name,
+        'seed': seed,
+        'results': [run_scale(scale, repeat=repeat, seed=seed) for scale in scales],
+    }
+
+
+def compare(previous, current, tolerance=REGRESSION_TOLERANCE):
+    """
+    (scale, benchmark, previous p50, current p50, ratio, regressed) of the benchmarks of both runs.
+    """
+    previous_results = {
+        (result['scale'], name): benchmark
+        for result in previous['results'] for name, benchmark in result['benchmarks'].items()
+    }
+    rows = []
+    for result in current['results']:
+        for name, benchmark in result['benchmarks'].items():
+            before = previous_results.get((result['scale'], name))
+            if before is None:
+                continue
+            old, new = before['latency_ms']['p50'], benchmark['latency_ms']['p50']
+            ratio = new / old if old else float('inf')
+            rows.append((result['scale'], name, old, new, ratio, ratio > 1 + tolerance))
+    return rows
@@ -0,0 +1,138 @@
+"""
+The sync views under WSGI against their async variants under ASGI, under concurrent load.
+
+Both sides are driven in process, without a network server: the sync views by test
+clients from a pool of `concurrency` threads, like a threaded WSGI server, the async
+views by `concurrency` tasks of one event loop with an ASGI test client, whose
+queries run in a pool of as many threads. Every workload sends requests whose
+responses are not cached: product offers, baskets and catalog pages with facets,
+each filtered by its own price. Results are requests per second and latency percentiles.
+
+The catalog is committed, because the threads use their own connections, and deleted afterwards.
+"""
+import asyncio
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from core.benchmarks import data
+from core.instrumentation import percentiles
+from core.models import Category, Product, Shop
+from core.services.price_list_import import import_price_list
+
+User = get_user_model()
+
+DEFAULT_CONCURRENCY = [1, 8, 32]
+BASKET_LINES = 20
+
+
+def _summary(latencies, elapsed):
+    return {
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {k: round(v * 1000, 3) for k, v in percentiles(latencies).items()},
+    }
+
+
+def run_sync(requests, concurrency):
+    """
+    Send (path, params, headers) requests to the sync views from `concurrency` threads.
+    """
+    def send(request):
+        path, params, headers = request
+        started = time.perf_counter()
+        response = Client().get(path, params, **{f"HTTP_{name.upper()}": value for name, value in headers.items()})
+        latency = time.perf_counter() - started
+        # as a WSGI server would at the end of the request
+        close_old_connections()
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+        return latency
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(send, requests))
+    return _summary(latencies, time.perf_counter() - started)
+
+
+async def _run_async(requests, concurrency):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(concurrency))
+    client = AsyncClient()
+    pending = iter(requests)
+    latencies = []
+
+    async def worker():
+        for path, params, headers in pending:
+            started = time.perf_counter()
+            response = await client.get(path, params, **headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f'GET {path} returned {response.status_code}')
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summary(latencies, time.perf_counter() - started)
+
+
+def run_async(requests, concurrency):
+    """
+    Send (path, params, headers) requests to the async views from `concurrency` tasks.
+    """
+    return asyncio.run(_run_async(requests, concurrency))
+
+
+def _workloads(headers, product_ids, count, offset):
+    # every catalog request filters by its own price, so none is answered from the catalog cache
+    step = max(len(product_ids) // count, 1)
+    return {
+        'product_offers': [
+            (f'products/{product_id}/offers/', {}, auth)
+            for product_id, auth in zip(islice(cycle(product_ids[::step]), count), cycle(headers))
+        ],
+        'basket': [('basket/', {}, auth) for auth in islice(cycle(headers), count)],
+        'products_facets': [
+            ('products/', {'price_min': 1000 + offset + i, 'facets': 'true'}, auth)
+            for i, auth in zip(range(count), cycle(headers))
+        ],
+    }
+
+
+MODES = [('sync', '/api/', run_sync), ('async', '/api/async/', run_async)]
+
+
+def run(products=1000, requests=500, concurrency=DEFAULT_CONCURRENCY, seed=0):
+    existing_categories = set(Category.objects.values_list('pk', flat=True))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = data.write_price_lists(directory, products, seed=seed)
+        for path in paths:
+            with open(path, 'rb') as stream:
+                import_price_list(stream)
+    shops = Shop.objects.filter(name__in=[f'Бенчмарк {shop}' for shop in range(len(paths))])
+    product_ids = list(
+        Product.objects.filter(product_infos__shop__in=shops).distinct().order_by('pk').values_list('pk', flat=True)
+    )
+    users = []
+    try:
+        users = data.create_baskets(max(concurrency), BASKET_LINES, seed=seed)
+        headers = [{'authorization': f'Token {Token.objects.create(user=user).key}'} for user in users]
+        results = {}
+        offset = 0
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for workers in concurrency:
+                for mode, prefix, send in MODES:
+                    workloads = _workloads(headers, product_ids, requests, offset)
+                    offset += requests
+                    for name, workload in workloads.items():
+                        result = results.setdefault((name, workers), {'workload': name, 'concurrency': workers})
+                        result[mode] = send([(prefix + path, *rest) for path, *rest in workload], workers)
+        return {'products': products, 'requests': requests, 'results': list(results.values())}
+    finally:
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        Product.objects.filter(pk__in=product_ids).delete()
+        shops.delete()
+        Category.objects.exclude(pk__in=existing_categories).filter(products=None).delete()
@@ -0,0 +1,74 @@
+"""
+Concurrent checkouts of one hot offer.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from core.models import ItemInShoppingBasket, Product, ProductInfo, Shop, ShoppingBasket
+from core.services.checkout import OutOfStock, place_order
+
+User = get_user_model()
+
+
+def checkout_concurrently(users, workers):
+    """
+    Place orders for all users from a pool of threads.
+    Returns the number of placed and rejected orders and the elapsed time.
+    """
+    def checkout(user):
+        try:
+            place_order(user)
+            return True
+        except OutOfStock:
+            return False
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(checkout, users))
+    return results.count(True), results.count(False), time.perf_counter() - started
+
+
+def create_buyers(product_info, count, quantity=1, prefix='buyer'):
+    users = User.objects.bulk_create([User(email=f'{prefix}{i}@mail.local', username=f'{prefix}{i}') for i in range(count)])
+    baskets = ShoppingBasket.objects.bulk_create([ShoppingBasket(user=user) for user in users])
+    ItemInShoppingBasket.objects.bulk_create([
+        ItemInShoppingBasket(shopping_basket=basket, product_info=product_info, shop_id=product_info.shop_id,
+                             quantity=quantity)
+        for basket in baskets
+    ])
+    return users
+
+
+def run(buyers=200, stock=100, workers=16):
+    """
+    Let `buyers` users check out one unit of an offer with `stock` units from `workers` threads.
+    The data is committed, because every thread uses its own connection, and deleted afterwards.
+    """
+    shop = Shop.objects.create(name='bench checkout shop')
+    product = Product.objects.create(name='bench checkout product', price_rrc=Decimal('100.00'))
+    product_info = ProductInfo.objects.create(shop=shop, product=product, external_id=1,
+                                              price=Decimal('90.00'), quantity=stock)
+    users = create_buyers(product_info, buyers, prefix='bench-buyer')
+    try:
+        placed, rejected, elapsed = checkout_concurrently(users, workers)
+        product_info.refresh_from_db()
+        return {
+            'buyers': buyers,
+            'stock': stock,
+            'workers': workers,
+            'placed': placed,
+            'rejected': rejected,
+            'left_in_stock': product_info.quantity,
+            'seconds': elapsed,
+            'checkouts_per_second': buyers / elapsed,
+        }
+    finally:
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        shop.delete()
+        product.delete()
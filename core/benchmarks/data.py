@@ -0,0 +1,136 @@
+"""
+Deterministic synthetic catalog in the price list schema of `data/shop1.yaml`.
+
+Everything is derived from the product number and the seed, so the same arguments
+always give the same price lists. Every product is offered by `offers_per_product`
+neighbouring shops, each at its own price and stock.
+"""
+import os
+
+import yaml
+from django.contrib.auth import get_user_model
+from django.db.models import Max, Min
+
+from core.models import ItemInShoppingBasket, ProductInfo, ShoppingBasket
+
+User = get_user_model()
+
+KINDS = ['Смартфон', 'Телевизор', 'Ноутбук', 'Планшет', 'Наушники', 'Колонка', 'Монитор', 'Фотоаппарат']
+BRANDS = ['Apple', 'Samsung', 'Xiaomi', 'Sony', 'LG', 'Huawei', 'Asus', 'Lenovo']
+COLORS = ['черный', 'белый', 'красный', 'синий', 'золотистый', 'серебристый']
+MEMORY = [32, 64, 128, 256, 512]
+DIAGONALS = [5.8, 6.1, 6.5, 13.3, 15.6, 27, 55, 65]
+
+CHUNK_SIZE = 1000
+
+_Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+def _hash(*values):
+    # Knuth multiplicative hashing, stable between runs unlike hash()
+    result = 0
+    for value in values:
+        result = ((result ^ value) * 2654435761) % 2 ** 32
+    return result
+
+
+def shop_count(products):
+    return min(max(products // 5000, 2), 50)
+
+
+def category_count(products):
+    return min(max(products // 1000, 3), 200)
+
+
+def get_categories(products):
+    return [{'id': i + 1, 'name': f'{KINDS[i % len(KINDS)]}ы {i // len(KINDS) + 1}'}
+            for i in range(category_count(products))]
+
+
+def make_good(i, shop, products, seed=0):
+    """
+    The offer of product `i` of a catalog of `products` by shop number `shop`.
+    """
+    h = _hash(seed, i)
+    kind = KINDS[h % len(KINDS)]
+    brand = BRANDS[(h >> 3) % len(BRANDS)]
+    price_rrc = 1000 + (h >> 6) % 200_000
+    return {
+        'id': i,
+        'category': (h >> 4) % category_count(products) + 1,
+        'model': f'{brand.lower()}/{kind}/{i}',
+        'name': f'{kind} {brand} {i}',
+        'price': price_rrc * (85 + _hash(seed, i, shop) % 15) // 100,
+        'price_rrc': price_rrc,
+        'quantity': _hash(seed, shop, i) % 20,
+        'parameters': {
+            'Цвет': COLORS[(h >> 8) % len(COLORS)],
+            'Встроенная память (Гб)': MEMORY[(h >> 11) % len(MEMORY)],
+            'Диагональ (дюйм)': DIAGONALS[(h >> 14) % len(DIAGONALS)],
+        },
+    }
+
+
+def iter_shop_goods(products, shop, offers_per_product=2, seed=0):
+    """
+    Goods of shop number `shop`: product i is offered by shops i, i + 1, ... modulo the number of shops.
+    """
+    shops = shop_count(products)
+    for offset in range(min(offers_per_product, shops)):
+        for i in range((shop - offset) % shops, products, shops):
+            yield make_good(i, shop, products, seed)
+
+
+def _dump(data):
+    return yaml.dump(data, Dumper=_Dumper, allow_unicode=True, sort_keys=False, default_flow_style=False)
+
+
+def write_price_lists(directory, products, offers_per_product=2, seed=0):
+    """
+    Write one YAML price list per shop into `directory` and return their paths.
+    Goods are written in chunks, so the memory use does not depend on the number of products.
+    """
+    paths = []
+    for shop in range(shop_count(products)):
+        path = os.path.join(directory, f'shop{shop}.yaml')
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(_dump({'shop': f'Бенчмарк {shop}', 'categories': get_categories(products)}))
+            stream.write('\ngoods:\n')
+            chunk = []
+            for good in iter_shop_goods(products, shop, offers_per_product, seed):
+                chunk.append(good)
+                if len(chunk) == CHUNK_SIZE:
+                    stream.write(_dump(chunk))
+                    chunk = []
+            if chunk:
+                stream.write(_dump(chunk))
+        paths.append(path)
+    return paths
+
+
+def create_baskets(buyers, lines, seed=0):
+    """
+    Baskets of `lines` offers for `buyers` new users, offers picked deterministically.
+    """
+    users = User.objects.bulk_create([
+        User(email=f'bench-buyer{i}@mail.local', username=f'bench-buyer{i}') for i in range(buyers)
+    ])
+    baskets = ShoppingBasket.objects.bulk_create([ShoppingBasket(user=user) for user in users])
+    # offers are picked from the primary key range instead of being loaded, bulk inserted keys have no gaps
+    bounds = ProductInfo.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    span = bounds['last'] - bounds['first'] + 1
+    picked = {
+        basket.pk: {bounds['first'] + _hash(seed, b, line) % span for line in range(lines)}
+        for b, basket in enumerate(baskets)
+    }
+    shops = dict(
+        ProductInfo.objects.filter(pk__in=set().union(*picked.values())).values_list('pk', 'shop_id')
+    )
+    items = [
+        ItemInShoppingBasket(shopping_basket_id=basket_id, product_info_id=pk, shop_id=shops[pk], quantity=pk % 3 + 1)
+        for basket_id, pks in picked.items()
+        for pk in sorted(pks)
+        if pk in shops
+    ]
+    ItemInShoppingBasket.objects.bulk_create(items, batch_size=5000)
+    return users
@@ -0,0 +1,52 @@
+"""
+Product search over the stored tsvector compared with an ILIKE scan of the names.
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from core.benchmarks.serializers import best_of
+from core.models import Product
+from core.services.product_search import search_products, update_search_vectors
+
+WORDS = ['смартфон', 'телевизор', 'ноутбук', 'планшет', 'наушники', 'колонка', 'apple', 'samsung', 'xiaomi',
+         'sony', 'lg', 'huawei', 'черный', 'белый', 'красный', 'синий', 'золотистый', 'pro', 'max', 'mini']
+
+
+def create_products(rows, seed=0):
+    rng = random.Random(seed)
+    batch_size = 10_000
+    for start in range(0, rows, batch_size):
+        products = Product.objects.bulk_create([
+            Product(
+                name=' '.join(rng.sample(WORDS, 4)) + f' {i}',
+                model=f'model-{i}',
+                price_rrc=Decimal('100.00'),
+            )
+            for i in range(start, min(start + batch_size, rows))
+        ])
+        update_search_vectors(product.pk for product in products)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE core_product')
+
+
+def run(sizes, repeat=3, limit=20):
+    """
+    Time the first page of search results for a rare and a common word.
+    The data is created in a transaction that is rolled back afterwards.
+    """
+    results = []
+    for size in sizes:
+        with transaction.atomic():
+            create_products(size)
+            rare = f'{size // 2}'
+            results.append({
+                'rows': size,
+                'ilike': best_of(lambda: list(Product.objects.filter(name__icontains=rare).values('id')[:limit]), repeat),
+                'search_rare': best_of(lambda: list(search_products(f'model-{size // 2}').values('id')[:limit]), repeat),
+                'search_common': best_of(lambda: list(search_products('золотистый').values('id')[:limit]), repeat),
+            })
+            transaction.set_rollback(True)
+    return results
@@ -0,0 +1,80 @@
+"""
+Compare the DRF serializers with the read-only row serializers from core.serializers.fast.
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core.models import Category, ItemInShoppingBasket, Product, ProductInfo, Shop, ShoppingBasket
+from core.serializers.fast import BASKET_ITEM_FIELDS, PRODUCT_FIELDS, serialize_basket, serialize_products
+from core.serializers.products import PREFETCH_CATEGORIES, ProductSerializer
+from core.serializers.shopping_basket import BasketSerializer
+
+User = get_user_model()
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def create_rows(rows):
+    categories = Category.objects.bulk_create([Category(name=f'bench category {i}') for i in range(10)])
+    shop = Shop.objects.create(name='bench shop')
+    products = Product.objects.bulk_create(
+        [Product(name=f'bench product {i}', model=f'model {i}', price_rrc=Decimal('100.00') + i) for i in range(rows)],
+        batch_size=5000,
+    )
+    Product.categories.through.objects.bulk_create(
+        [Product.categories.through(product_id=product.pk, category_id=categories[i % 10].pk)
+         for i, product in enumerate(products)],
+        batch_size=5000,
+    )
+    product_infos = ProductInfo.objects.bulk_create(
+        [ProductInfo(shop=shop, product=product, external_id=i, price=Decimal('90.00') + i, quantity=5)
+         for i, product in enumerate(products)],
+        batch_size=5000,
+    )
+    shopping_basket = ShoppingBasket.objects.create(user=User.objects.create(email='bench@mail.local'))
+    ItemInShoppingBasket.objects.bulk_create(
+        [ItemInShoppingBasket(shopping_basket=shopping_basket, product_info=product_info, shop=shop, quantity=2)
+         for product_info in product_infos],
+        batch_size=5000,
+    )
+    return shopping_basket
+
+
+def run(sizes, repeat=3):
+    """
+    Serialize `size` products and a basket of `size` lines both ways.
+    The data is created in a transaction that is rolled back afterwards.
+    """
+    results = []
+    for size in sizes:
+        with transaction.atomic():
+            shopping_basket = create_rows(size)
+            products = Product.objects.order_by('id')
+            items = ItemInShoppingBasket.objects.filter(shopping_basket=shopping_basket).with_totals().order_by('id')
+            timings = {
+                'products_drf': best_of(
+                    lambda: ProductSerializer(products.prefetch_related(PREFETCH_CATEGORIES), many=True).data, repeat,
+                ),
+                'products_fast': best_of(lambda: serialize_products(products.values(*PRODUCT_FIELDS)), repeat),
+                'basket_drf': best_of(
+                    lambda: BasketSerializer(
+                        ShoppingBasket.objects.prefetch_related('items__product_info__product', 'items__product_info__shop')
+                        .get(pk=shopping_basket.pk)
+                    ).data,
+                    repeat,
+                ),
+                'basket_fast': best_of(lambda: serialize_basket(items.values_list(*BASKET_ITEM_FIELDS)), repeat),
+            }
+            transaction.set_rollback(True)
+        results.append({'rows': size, **timings})
+    return results
@@ -0,0 +1,246 @@
+"""
+Request instrumentation: the number and time of database queries, the serializer time
+and the total latency of every request, aggregated per URL name.
+
+Queries are counted by a `connection.execute_wrapper` installed for the request;
+async views run their queries in worker threads, under `recorded_queries`.
+Serializer time is the time spent in functions decorated with `timed_serializer`
+plus the rendering of DRF responses. A request running the same statement shape
+more than N_PLUS_ONE_THRESHOLD times is flagged as an N+1 pattern and logged.
+
+Samples are kept per process in bounded ring buffers and percentiles are computed
+only when the stats are read, so the cost per request is a few counters.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_SIZE = 1000
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+PERCENTILES = (50, 95, 99)
+# flagged statement shapes kept per URL name
+MAX_SHAPES = 20
+
+_current = ContextVar('instrumentation_record', default=None)
+
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def statement_shape(sql):
+    """
+    The statement with numbers and placeholder lists of any length collapsed.
+    """
+    return _NUMBER.sub('?', _PLACEHOLDER_LIST.sub('(...)', sql))
+
+
+class RequestRecord:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_shapes(self, threshold):
+        """
+        Statement shapes run more than `threshold` times, with their counts.
+        """
+        if self.queries <= threshold:
+            return {}
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[statement_shape(sql)] += count
+        return {shape: count for shape, count in shapes.items() if count > threshold}
+
+
+def timed_serializer(func):
+    """
+    Count the time spent in `func` as serializer time of the current request.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        record = _current.get()
+        if record is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record.serializer_time += time.perf_counter() - started
+    return wrapper
+
+
+@contextmanager
+def recorded_queries():
+    """
+    Count the queries run in this thread for the current request. Connections are per thread,
+    so a request running queries outside its own thread (async views) records them with this.
+    """
+    record = _current.get()
+    with ExitStack() as stack:
+        if record is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+        yield
+
+
+def percentiles(values):
+    # nearest rank
+    values = sorted(values)
+    return {
+        f'p{percentile}': values[max(math.ceil(len(values) * percentile / 100), 1) - 1]
+        for percentile in PERCENTILES
+    }
+
+
+class EndpointStats:
+    def __init__(self, sample_size):
+        # (latency ms, queries, db ms, serializer ms) of the latest requests
+        self.samples = deque(maxlen=sample_size)
+        self.requests = 0
+        self.n_plus_one = 0
+        self.shapes = Counter()
+
+    def snapshot(self):
+        samples = list(self.samples)
+        data = {
+            'requests': self.requests,
+            'samples': len(samples),
+            'n_plus_one': self.n_plus_one,
+            'n_plus_one_statements': [
+                {'sql': shape, 'requests': count} for shape, count in self.shapes.most_common()
+            ],
+        }
+        for i, name in enumerate(('latency_ms', 'queries', 'db_ms', 'serializer_ms')):
+            data[name] = percentiles([sample[i] for sample in samples]) if samples else None
+        return data
+
+
+class Stats:
+    """
+    Per URL name stats of this process.
+    """
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, record, latency, repeated_shapes, sample_size):
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            with self._lock:
+                endpoint = self._endpoints.setdefault(name, EndpointStats(sample_size))
+        endpoint.samples.append((
+            round(latency * 1000, 3), record.queries, round(record.db_time * 1000, 3),
+            round(record.serializer_time * 1000, 3),
+        ))
+        endpoint.requests += 1
+        if repeated_shapes:
+            endpoint.n_plus_one += 1
+            with self._lock:
+                for shape in repeated_shapes:
+                    if shape in endpoint.shapes or len(endpoint.shapes) < MAX_SHAPES:
+                        endpoint.shapes[shape] += 1
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = dict(self._endpoints)
+        return {
+            'pid': os.getpid(),
+            'endpoints': {name: endpoints[name].snapshot() for name in sorted(endpoints)},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+
+stats = Stats()
+
+
+class InstrumentationMiddleware:
+    """
+    Put it first in MIDDLEWARE, so the latency covers the other middleware too.
+    Under ASGI it runs as async middleware and only counts the queries of `recorded_queries` blocks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_size = getattr(settings, 'INSTRUMENTATION_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE)
+        self.threshold = getattr(settings, 'INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, record, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, record, time.perf_counter() - started)
+        return response
+
+    def record(self, request, record, latency):
+        match = request.resolver_match
+        if match is not None:
+            name = match.url_name or match.route
+            repeated_shapes = record.repeated_shapes(self.threshold)
+            for shape, count in repeated_shapes.items():
+                logger.warning('N+1 queries in %s: %d x %s', name, count, shape)
+            stats.record(name, record, latency, repeated_shapes, self.sample_size)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, rendering counts as serializer time
+        record = _current.get()
+        if record is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                record.serializer_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,96 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import api, asgi, checkout, search, serializers
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against the configured database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=['serializers', 'checkout', 'search', 'api', 'asgi'])
+        parser.add_argument(
+            '--rows', type=int, nargs='+',
+            help='Table sizes, or catalog sizes in products for the api and asgi targets '
+                 '(default 1000 100000 1000000, and 1000 for asgi).',
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per workload of the asgi target.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=asgi.DEFAULT_CONCURRENCY)
+        parser.add_argument('--output', help='Write the api results to this JSON file.')
+        parser.add_argument('--compare', help='Compare the api results with a previous JSON file.')
+
+    def handle(self, *args, **options):
+        if options['rows'] is None:
+            options['rows'] = {'api': api.DEFAULT_SCALES, 'asgi': [1000]}.get(options['target'], [10_000, 100_000])
+        getattr(self, f"run_{options['target']}")(options)
+
+    def run_checkout(self, options):
+        result = checkout.run(buyers=options['buyers'], stock=options['stock'], workers=options['workers'])
+        self.stdout.write(
+            f"{result['buyers']} buyers, {result['stock']} in stock, {result['workers']} workers: "
+            f"{result['placed']} placed, {result['rejected']} rejected, {result['left_in_stock']} left, "
+            f"{result['checkouts_per_second']:.1f} checkouts/s"
+        )
+
+    def run_serializers(self, options):
+        results = serializers.run(options['rows'], repeat=options['repeat'])
+        for result in results:
+            self.stdout.write(
+                f"{result['rows']:>8} rows: "
+                f"products {result['products_drf']:.3f}s -> {result['products_fast']:.3f}s "
+                f"(x{result['products_drf'] / result['products_fast']:.1f}), "
+                f"basket {result['basket_drf']:.3f}s -> {result['basket_fast']:.3f}s "
+                f"(x{result['basket_drf'] / result['basket_fast']:.1f})"
+            )
+
+    def run_search(self, options):
+        for result in search.run(options['rows'], repeat=options['repeat']):
+            self.stdout.write(
+                f"{result['rows']:>8} rows: ILIKE {result['ilike'] * 1000:.1f}ms, "
+                f"search (rare) {result['search_rare'] * 1000:.1f}ms, "
+                f"search (common) {result['search_common'] * 1000:.1f}ms"
+            )
+
+    def run_api(self, options):
+        results = api.run(options['rows'], repeat=options['repeat'])
+        for result in results['results']:
+            self.stdout.write(f"{result['scale']} products, {result['shops']} shops, loaded in {result['load_seconds']}s")
+            for name, benchmark in result['benchmarks'].items():
+                latency = benchmark['latency_ms']
+                self.stdout.write(
+                    f"  {name:<24} p50 {latency['p50']:>10.1f}ms  p99 {latency['p99']:>10.1f}ms  "
+                    f"{benchmark['queries']:>6} queries  {benchmark['peak_memory_kb']:>8} KiB"
+                )
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(results, stream, indent=2)
+        if options['compare']:
+            with open(options['compare']) as stream:
+                previous = json.load(stream)
+            for scale, name, old, new, ratio, regressed in api.compare(previous, results):
+                line = f"{scale:>8} {name:<24} {old:>10.1f}ms -> {new:>10.1f}ms (x{ratio:.2f})"
+                self.stdout.write(self.style.WARNING(line) if regressed else line)
+
+    def run_asgi(self, options):
+        runs = []
+        for products in options['rows']:
+            results = asgi.run(products, requests=options['requests'], concurrency=options['concurrency'])
+            runs.append(results)
+            self.stdout.write(f"{products} products, {results['requests']} requests per run")
+            for result in results['results']:
+                line = f"  {result['workload']:<16} x{result['concurrency']:<4}"
+                for mode in ('sync', 'async'):
+                    latency = result[mode]['latency_ms']
+                    line += (
+                        f"  {mode} {result[mode]['requests_per_second']:>7.1f} req/s "
+                        f"p50 {latency['p50']:>6.1f} p95 {latency['p95']:>6.1f} p99 {latency['p99']:>6.1f}ms"
+                    )
+                self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(runs, stream, indent=2)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from yaml import YAMLError
+
+from core.services.price_list_import import DEFAULT_BATCH_SIZE, MISSING_DELETE, MISSING_ZERO, import_price_list
+
+
+class Command(BaseCommand):
+    help = 'Import a shop price list in the data/shop1.yaml format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the YAML price list.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only write goods that changed since the previous import and remove the missing ones.',
+        )
+        parser.add_argument(
+            '--missing', choices=[MISSING_ZERO, MISSING_DELETE], default=MISSING_ZERO,
+            help='What to do with goods missing from the price list in incremental mode.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as stream:
+                stats = import_price_list(
+                    stream,
+                    batch_size=options['batch_size'],
+                    incremental=options['incremental'],
+                    missing=options['missing'],
+                )
+        except (OSError, ValueError, YAMLError) as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.goods} goods for shop "{stats.shop}" in {stats.batches} batches: '
+            f'{stats.inserted} inserted, {stats.updated} updated, {stats.unchanged} unchanged, {stats.removed} removed.'
+        ))
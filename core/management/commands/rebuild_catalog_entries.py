@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.models import ProductCatalogEntry
+from core.services.catalog_entries import DEFAULT_BATCH_SIZE, rebuild_entries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the catalog entries of all products, e.g. after changing the data with raw SQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        rebuild_entries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {ProductCatalogEntry.objects.count()} catalog entries.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services.invoices import DEFAULT_BATCH_SIZE, send_invoices
+
+
+class Command(BaseCommand):
+    help = 'Send the invoices of the orders not invoiced yet to the administrators.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stats = send_invoices(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {stats.invoices} invoices for {stats.orders} orders.'))
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0005_alter_category_options_alter_parameter_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemInShoppingBasket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShoppingBasket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.RenameModel(
+            old_name='OrderItem',
+            new_name='ItemInOrder',
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name', 'model'), name='unique_product'),
+        ),
+        migrations.AddField(
+            model_name='shoppingbasket',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_basket', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='iteminshoppingbasket',
+            name='product_info',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.productinfo'),
+        ),
+        migrations.AddField(
+            model_name='iteminshoppingbasket',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.shop'),
+        ),
+        migrations.AddField(
+            model_name='iteminshoppingbasket',
+            name='shopping_basket',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core.shoppingbasket'),
+        ),
+        migrations.AddConstraint(
+            model_name='iteminshoppingbasket',
+            constraint=models.UniqueConstraint(fields=('shopping_basket', 'product_info'), name='item_in_shopping_basket_unique_product_info_basket'),
+        ),
+        migrations.AddConstraint(
+            model_name='iteminshoppingbasket',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 1)), name='item_in_shopping_basket_check_quantity'),
+        ),
+    ]
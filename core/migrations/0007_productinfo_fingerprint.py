@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_iteminshoppingbasket_shoppingbasket_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_productinfo_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['product', 'price'], name='product_info_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product', 'price'], name='product_info_in_stock_idx'),
+        ),
+    ]
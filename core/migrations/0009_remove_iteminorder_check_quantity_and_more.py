@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_product_product_name_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='iteminorder',
+            name='check_quantity',
+        ),
+        migrations.AddConstraint(
+            model_name='iteminorder',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 1)), name='check_quantity'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0009_remove_iteminorder_check_quantity_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shop', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
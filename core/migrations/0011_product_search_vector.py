@@ -0,0 +1,61 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:32
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm is a contrib extension, typo-tolerant search is skipped where it is not shipped
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON core_product USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+
+
+def fill_search_vectors(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductParameter = apps.get_model('core', 'ProductParameter')
+    parameter_values = (
+        ProductParameter.objects.filter(product=models.OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(values=StringAgg('value', ' '))
+        .values('values')
+    )
+    Product.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('model', weight='B', config='russian')
+        + SearchVector(models.Subquery(parameter_values), weight='C', config='russian')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_shop_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+CREATE_FACETS = '''
+CREATE MATERIALIZED VIEW core_parameter_facet AS
+SELECT row_number() OVER (ORDER BY parameter_id, value) AS id, parameter_id, value, count(*) AS product_count
+FROM core_productparameter
+GROUP BY parameter_id, value;
+CREATE UNIQUE INDEX core_parameter_facet_value_idx ON core_parameter_facet (parameter_id, value);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100)),
+                ('product_count', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'core_parameter_facet',
+                'managed': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product'], name='product_parameter_facet_idx'),
+        ),
+        migrations.RunSQL(CREATE_FACETS, 'DROP MATERIALIZED VIEW core_parameter_facet'),
+    ]
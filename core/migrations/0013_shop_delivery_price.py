@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_parameter_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='delivery_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+    ]
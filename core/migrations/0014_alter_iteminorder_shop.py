@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # separate from the backfill, which may leave deferred foreign key checks pending in its transaction
+
+    dependencies = [
+        ('core', '0014_iteminorder_shop'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='iteminorder',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ordered_items', to='core.shop'),
+        ),
+        migrations.AddIndex(
+            model_name='iteminorder',
+            index=models.Index(fields=['shop', 'order'], name='item_in_order_shop_order_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_shop_delivery_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='iteminorder',
+            name='shop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ordered_items', to='core.shop'),
+        ),
+        migrations.RunSQL(
+            'UPDATE core_iteminorder SET shop_id = core_productinfo.shop_id FROM core_productinfo '
+            'WHERE core_productinfo.id = core_iteminorder.product_info_id',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_alter_iteminorder_shop'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='accepts_orders',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:44
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+FILL_ENTRIES = '''
+INSERT INTO core_productcatalogentry (
+    product_id, name, model, price_rrc, categories, category_ids, parameters,
+    min_price, max_price, total_stock, shop_ids, shop_count, updated_at
+)
+SELECT p.id, p.name, p.model, p.price_rrc,
+       COALESCE(c.names, '[]'), COALESCE(c.ids, '{}'), COALESCE(pp.parameters, '{}'),
+       o.min_price, o.max_price, COALESCE(o.total_stock, 0), COALESCE(o.shop_ids, '{}'), o.shop_count,
+       now()
+FROM core_product p
+LEFT JOIN LATERAL (
+    SELECT jsonb_agg(c.name ORDER BY c.name) AS names, array_agg(c.id ORDER BY c.id) AS ids
+    FROM core_product_categories pc JOIN core_category c ON c.id = pc.category_id
+    WHERE pc.product_id = p.id
+) c ON true
+LEFT JOIN LATERAL (
+    SELECT jsonb_object_agg(parameter_id::text, value) AS parameters
+    FROM core_productparameter
+    WHERE product_id = p.id
+) pp ON true
+LEFT JOIN LATERAL (
+    SELECT min(price) AS min_price, max(price) AS max_price, sum(quantity) AS total_stock,
+           array_agg(DISTINCT shop_id) AS shop_ids, count(DISTINCT shop_id) AS shop_count
+    FROM core_productinfo
+    WHERE product_id = p.id
+) o ON true
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_shop_accepts_orders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCatalogEntry',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='core.product')),
+                ('name', models.CharField(max_length=255)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('price_rrc', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('categories', models.JSONField(default=list)),
+                ('category_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None)),
+                ('parameters', models.JSONField(default=dict)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=8, null=True)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=8, null=True)),
+                ('total_stock', models.PositiveIntegerField(default=0)),
+                ('shop_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None)),
+                ('shop_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated')),
+            ],
+            options={
+                'verbose_name': 'Catalog entry',
+                'verbose_name_plural': 'Catalog entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productcatalogentry',
+            index=models.Index(fields=['name', 'product'], name='catalog_entry_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcatalogentry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['category_ids'], name='catalog_entry_categories_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcatalogentry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['shop_ids'], name='catalog_entry_shops_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcatalogentry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['parameters'], name='catalog_entry_parameters_idx', opclasses=['jsonb_path_ops']),
+        ),
+        migrations.RunSQL(FILL_ENTRIES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_product_catalog_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoiced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # orders placed before the invoice job are not sent again
+        migrations.RunSQL('UPDATE core_order SET invoiced_at = created_at', migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('invoiced_at', None)), fields=['id'], name='order_not_invoiced_idx'),
+        ),
+    ]
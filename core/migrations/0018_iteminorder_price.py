@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_order_invoiced_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='iteminorder',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True),
+        ),
+        # the prices of the offers are the best guess for the orders placed before
+        migrations.RunSQL(
+            'UPDATE core_iteminorder SET price = core_productinfo.price FROM core_productinfo '
+            'WHERE core_productinfo.id = core_iteminorder.product_info_id',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_iteminorder_price'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='iteminorder',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=8),
+        ),
+    ]
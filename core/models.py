@@ -1,4 +1,7 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 User = get_user_model()
@@ -19,6 +22,9 @@ class Shop(TimeStampModel):
     name = models.CharField(max_length=100, unique=True)
     url = models.URLField(blank=True, null=True)
     filename = models.CharField(max_length=100, blank=True, null=True)
+    user = models.OneToOneField(User, related_name='shop', blank=True, null=True, on_delete=models.SET_NULL)
+    delivery_price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    accepts_orders = models.BooleanField(default=True)
 
     class Meta:
         verbose_name = 'Shop'
@@ -42,6 +48,49 @@ class Category(TimeStampModel):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def filter_catalog(self, category=None, shop=None, price_min=None, price_max=None, in_stock=False,
+                       parameters=None, exclude_shops=()):
+        """
+        Catalog filters. Offer conditions are checked together in one EXISTS subquery,
+        so they must hold for the same offer.
+
+        `parameters` maps parameter ids to lists of accepted values: a product must have
+        one of the values of every given parameter. Each parameter is one EXISTS subquery
+        answered from the (parameter, value, product) index, not a self-join of the EAV rows.
+
+        Offers of `exclude_shops` are ignored, and products offered by those shops only are hidden.
+        """
+        queryset = self
+        if category is not None:
+            queryset = queryset.filter(categories=category)
+        for parameter_id, values in (parameters or {}).items():
+            queryset = queryset.filter(models.Exists(ProductParameter.objects.filter(
+                product=models.OuterRef('pk'), parameter_id=parameter_id, value__in=values,
+            )))
+        offers = {}
+        if shop is not None:
+            offers['shop'] = shop
+        if price_min is not None:
+            offers['price__gte'] = price_min
+        if price_max is not None:
+            offers['price__lte'] = price_max
+        if in_stock:
+            offers['quantity__gt'] = 0
+        product_infos = ProductInfo.objects.filter(product=models.OuterRef('pk'))
+        if offers:
+            offered = product_infos.filter(**offers)
+            if exclude_shops:
+                offered = offered.exclude(shop__in=exclude_shops)
+            queryset = queryset.filter(models.Exists(offered))
+        elif exclude_shops:
+            queryset = queryset.filter(
+                models.Exists(product_infos.exclude(shop__in=exclude_shops))
+                | ~models.Exists(product_infos.filter(shop__in=exclude_shops))
+            )
+        return queryset
+
+
 class Product(TimeStampModel):
     """
     Product information. One product can belong to several categories or be uncategorized.
@@ -50,6 +99,10 @@ class Product(TimeStampModel):
     categories = models.ManyToManyField(Category, related_name='products', blank=True)
     model = models.CharField(max_length=100, blank=True)
     price_rrc = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='recommended price')
+    # name, model and parameter values, kept up to date by core.services.product_search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Product'
@@ -57,6 +110,11 @@ class Product(TimeStampModel):
         ordering = ('-name',)
         constraints = [
             models.CheckConstraint(check=models.Q(price_rrc__gt=0), name='price_rrc_is_positive'),
+            models.UniqueConstraint(fields=['name', 'model'], name='unique_product'),
+        ]
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
         ]
 
     def __str__(self):
@@ -72,6 +130,7 @@ class ProductInfo(TimeStampModel):
     shop = models.ForeignKey(Shop, related_name='product_detail', on_delete=models.CASCADE)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     quantity = models.PositiveIntegerField()
+    fingerprint = models.CharField(max_length=32, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Product Information'
@@ -80,6 +139,11 @@ class ProductInfo(TimeStampModel):
             models.CheckConstraint(check=models.Q(price__gt=0), name='price_is_positive'),
             models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_product_info')
         ]
+        indexes = [
+            models.Index(fields=['product', 'price'], name='product_info_price_idx'),
+            models.Index(fields=['product', 'price'], condition=models.Q(quantity__gt=0),
+                         name='product_info_in_stock_idx'),
+        ]
 
 
 class Parameter(models.Model):
@@ -107,6 +171,85 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            models.Index(fields=['parameter', 'value', 'product'], name='product_parameter_facet_idx'),
+        ]
+
+
+class ParameterFacet(models.Model):
+    """
+    Number of products for every parameter value, a materialized view refreshed after imports.
+    """
+    parameter = models.ForeignKey(Parameter, related_name='+', on_delete=models.DO_NOTHING)
+    value = models.CharField(max_length=100)
+    product_count = models.PositiveIntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'core_parameter_facet'
+
+
+class ProductCatalogEntryQuerySet(models.QuerySet):
+    def filter_catalog(self, category=None, shop=None, price_min=None, price_max=None, in_stock=False,
+                       parameters=None, exclude_shops=()):
+        """
+        The catalog filters of ProductQuerySet.filter_catalog answered from the entry row alone.
+        Offer conditions are checked against the offer aggregates, which is exact only for
+        one offer condition and no excluded shops, see core.services.catalog_entries.can_filter.
+        """
+        queryset = self
+        if category is not None:
+            queryset = queryset.filter(category_ids__contains=[category])
+        for parameter_id, values in (parameters or {}).items():
+            condition = models.Q()
+            for value in values:
+                condition |= models.Q(parameters__contains={str(parameter_id): value})
+            queryset = queryset.filter(condition)
+        if shop is not None:
+            queryset = queryset.filter(shop_ids__contains=[shop])
+        if price_min is not None:
+            queryset = queryset.filter(max_price__gte=price_min)
+        if price_max is not None:
+            queryset = queryset.filter(min_price__lte=price_max)
+        if in_stock:
+            queryset = queryset.filter(total_stock__gt=0)
+        if exclude_shops:
+            queryset = queryset.exclude(shop_ids__contained_by=list(exclude_shops), shop_count__gt=0)
+        return queryset
+
+
+class ProductCatalogEntry(models.Model):
+    """
+    Denormalized catalog row of a product: its categories, parameters and offer aggregates,
+    so a catalog page is read from one table. Kept up to date by core.services.catalog_entries.
+    """
+    product = models.OneToOneField(Product, primary_key=True, related_name='catalog_entry', on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    model = models.CharField(max_length=100, blank=True)
+    price_rrc = models.DecimalField(max_digits=8, decimal_places=2)
+    # category names ordered by name, as they are serialized
+    categories = models.JSONField(default=list)
+    category_ids = ArrayField(models.BigIntegerField(), default=list)
+    # {parameter id: value}
+    parameters = models.JSONField(default=dict)
+    min_price = models.DecimalField(max_digits=8, decimal_places=2, null=True)
+    max_price = models.DecimalField(max_digits=8, decimal_places=2, null=True)
+    total_stock = models.PositiveIntegerField(default=0)
+    shop_ids = ArrayField(models.BigIntegerField(), default=list)
+    shop_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField('updated', auto_now=True)
+
+    objects = ProductCatalogEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Catalog entry'
+        verbose_name_plural = 'Catalog entries'
+        indexes = [
+            models.Index(fields=['name', 'product'], name='catalog_entry_name_idx'),
+            GinIndex(fields=['category_ids'], name='catalog_entry_categories_idx'),
+            GinIndex(fields=['shop_ids'], name='catalog_entry_shops_idx'),
+            GinIndex(fields=['parameters'], opclasses=['jsonb_path_ops'], name='catalog_entry_parameters_idx'),
+        ]
 
 
 class Order(TimeStampModel):
@@ -122,6 +265,14 @@ class Order(TimeStampModel):
     status = models.CharField(max_length=50, choices=StatusChoices.choices, default=StatusChoices.NOT_DELIVERED)
     number = models.IntegerField()
     delivered_at = models.DateTimeField(blank=True, null=True)
+    # set when the order was sent to the administrators in an invoice, see core.services.invoices
+    invoiced_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # the orders waiting for an invoice, a small part of all orders
+            models.Index(fields=['id'], condition=models.Q(invoiced_at=None), name='order_not_invoiced_idx'),
+        ]
 
 
 class ItemInOrder(models.Model):
@@ -130,12 +281,19 @@ class ItemInOrder(models.Model):
     """
     order = models.ForeignKey(Order, related_name='ordered_items',on_delete=models.CASCADE)
     product_info = models.ForeignKey(ProductInfo, on_delete=models.CASCADE)
+    # copy of product_info.shop, so the orders of a shop are found without joining the offers
+    shop = models.ForeignKey(Shop, related_name='ordered_items', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # unit price of the offer at checkout, later price lists do not change placed orders
+    price = models.DecimalField(max_digits=8, decimal_places=2)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'order'], name='unique_order_product_info'),
-            models.CheckConstraint(check=models.Q(quantity__gt=1), name='check_quantity'),
+            models.CheckConstraint(check=models.Q(quantity__gte=1), name='check_quantity'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'order'], name='item_in_order_shop_order_idx'),
         ]
 
 
@@ -145,6 +303,26 @@ class ShoppingBasket(models.Model):
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='shopping_basket')
 
+class ItemInShoppingBasketQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate every line with its price and total and with the totals of the whole selection,
+        so a basket is read with one query.
+        """
+        line_price = models.ExpressionWrapper(
+            models.F('product_info__price') * models.F('quantity'),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        )
+        return self.annotate(
+            name=models.F('product_info__product__name'),
+            shop_name=models.F('product_info__shop__name'),
+            price=models.F('product_info__price'),
+            line_price=line_price,
+            basket_quantity=models.Window(models.Sum('quantity')),
+            basket_price=models.Window(models.Sum(line_price)),
+        )
+
+
 class ItemInShoppingBasket(models.Model):
     """
     The position of the product in the basket includes information
@@ -154,6 +332,9 @@ class ItemInShoppingBasket(models.Model):
     product_info = models.ForeignKey(ProductInfo, on_delete=models.CASCADE)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+
+    objects = ItemInShoppingBasketQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['shopping_basket', 'product_info'],
@@ -0,0 +1,13 @@
+from rest_framework.permissions import BasePermission
+
+from security.models import User
+
+
+class IsShop(BasePermission):
+    """
+    Allow access to suppliers only.
+    """
+    message = 'Only shops can do this'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.type == User.TypeChoices.SHOP)
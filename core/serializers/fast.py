@@ -0,0 +1,78 @@
+"""
+Read-only serialization straight from `.values()` rows.
+
+The output is the same as ProductSerializer and BasketSerializer give,
+without building a DRF field tree and calling `to_representation` for every object.
+"""
+from collections import defaultdict
+
+from core.instrumentation import timed_serializer
+from core.models import Product
+
+PRODUCT_FIELDS = ('id', 'name', 'model', 'price_rrc')
+CATALOG_ENTRY_FIELDS = ('name', 'model', 'price_rrc', 'categories')
+BASKET_ITEM_FIELDS = ('name', 'shop_name', 'price', 'quantity', 'line_price', 'basket_quantity', 'basket_price')
+
+
+def format_decimal(value):
+    return '{:.2f}'.format(value)
+
+
+def get_category_names(product_ids):
+    category_names = defaultdict(list)
+    rows = (
+        Product.categories.through.objects.filter(product_id__in=product_ids)
+        .order_by('category__name')
+        .values_list('product_id', 'category__name')
+    )
+    for product_id, name in rows:
+        category_names[product_id].append(name)
+    return category_names
+
+
+@timed_serializer
+def serialize_products(rows):
+    """
+    Serialize product rows having PRODUCT_FIELDS like ProductSerializer(many=True) does.
+    Category names are taken from the rows when they have them, as catalog entries do,
+    otherwise the names of all products are fetched with one query.
+    """
+    rows = list(rows)
+    if rows and 'categories' in rows[0]:
+        category_names = {row['id']: row['categories'] for row in rows}
+    else:
+        category_names = get_category_names([row['id'] for row in rows])
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'model': row['model'],
+            'price_rrc': format_decimal(row['price_rrc']),
+            'categories': category_names.get(row['id'], []),
+        }
+        for row in rows
+    ]
+
+
+@timed_serializer
+def serialize_basket(rows):
+    """
+    Serialize basket item tuples of BASKET_ITEM_FIELDS, as annotated by
+    ItemInShoppingBasket.objects.with_totals(), like BasketSerializer does.
+    """
+    items = []
+    total_quantity = 0
+    total_price = 0
+    for name, shop, price, quantity, line_price, total_quantity, total_price in rows:
+        items.append({
+            'name': name,
+            'shop': shop,
+            'price': format_decimal(price),
+            'quantity': quantity,
+            'total_price': format_decimal(line_price),
+        })
+    return {
+        'items': items,
+        'total_quantity': total_quantity,
+        'total_price': format_decimal(total_price),
+    }
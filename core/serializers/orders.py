@@ -0,0 +1,28 @@
+from rest_framework import serializers
+
+from core.models import ItemInOrder, Order
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['id', 'number', 'status', 'created_at']
+
+
+class SupplierOrderItemSerializer(serializers.ModelSerializer):
+    external_id = serializers.IntegerField(source='product_info.external_id')
+    name = serializers.CharField(source='product_info.product.name')
+    model = serializers.CharField(source='product_info.product.model')
+
+    class Meta:
+        model = ItemInOrder
+        fields = ['product_info', 'external_id', 'name', 'model', 'price', 'quantity']
+
+
+class SupplierOrderSerializer(serializers.ModelSerializer):
+    buyer = serializers.EmailField(source='user.email')
+    items = SupplierOrderItemSerializer(source='shop_items', many=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'number', 'status', 'created_at', 'buyer', 'items']
@@ -1,7 +1,11 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from core.models import Product, Category
 
+# category names in the database collation, as the catalog entries and core.serializers.fast have them
+PREFETCH_CATEGORIES = Prefetch('categories', queryset=Category.objects.order_by('name'))
+
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,6 +20,58 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'model', 'price_rrc', 'categories']
 
     def get_categories(self, instance):
-        return list(instance.categories.values_list('name', flat=True))
+        # lists of products are prefetched with PREFETCH_CATEGORIES, which orders them already
+        categories = instance.categories.all()
+        if not categories.ordered:
+            categories = categories.order_by('name')
+        return [category.name for category in categories]
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    shop = serializers.IntegerField(required=False)
+    price_min = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    in_stock = serializers.BooleanField(required=False)
+    param = serializers.ListField(
+        child=serializers.RegexField(r'^\d+:.+$'), required=False,
+        help_text='Parameter value as "<parameter id>:<value>". Values of one parameter are alternatives.',
+    )
+    facets = serializers.BooleanField(required=False, help_text='Add parameter value counts to the response.')
+
+    def validate(self, attrs):
+        parameters = {}
+        for param in attrs.pop('param', []):
+            parameter_id, value = param.split(':', 1)
+            parameters.setdefault(int(parameter_id), []).append(value)
+        if parameters:
+            attrs['parameters'] = parameters
+        return attrs
+
+
+class ProductSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class OfferShopSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class OfferSerializer(serializers.Serializer):
+    id = serializers.IntegerField(help_text='Product info id, used to add the offer to the basket.')
+    shop = OfferShopSerializer()
+    price = serializers.DecimalField(max_digits=8, decimal_places=2)
+    quantity = serializers.IntegerField()
+
+
+class ProductOffersSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    best = OfferSerializer(allow_null=True)
+    offers = OfferSerializer(many=True)
 
 
+class ProductOffersRequestSerializer(serializers.Serializer):
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                     max_length=5000)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from core.models import ItemInShoppingBasket, Shop, ProductInfo, ShoppingBasket
+from core.services.basket import MAX_QUANTITY
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -58,3 +59,44 @@ class BasketSerializer(serializers.ModelSerializer):
         total_price = sum([i.total_price for i in instance.items.all()])
         return '{:.2f}'.format(total_price)
 
+
+class BasketLineSerializer(serializers.Serializer):
+    product_info = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY)
+
+
+class BasketLinesSerializer(serializers.Serializer):
+    items = BasketLineSerializer(many=True, allow_empty=False)
+
+
+class BasketRemoveSerializer(serializers.Serializer):
+    items = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class ProductQuantitySerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY)
+
+
+class BasketOptimizeSerializer(serializers.Serializer):
+    items = ProductQuantitySerializer(many=True, required=False, allow_empty=False,
+                                      help_text='Products to buy; the products in the basket when omitted.')
+    apply = serializers.BooleanField(default=False, help_text='Replace the basket lines with the chosen offers.')
+    time_budget = serializers.FloatField(min_value=0.01, max_value=5, default=0.5)
+
+
+class AllocationSerializer(serializers.Serializer):
+    product = serializers.IntegerField(source='product_id')
+    product_info = serializers.IntegerField(source='product_info_id')
+    shop = serializers.IntegerField(source='shop_id')
+    price = serializers.DecimalField(max_digits=8, decimal_places=2)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY)
+
+
+class BasketPlanSerializer(serializers.Serializer):
+    items = AllocationSerializer(source='allocations', many=True)
+    shops = serializers.ListField(source='shop_ids', child=serializers.IntegerField())
+    items_price = serializers.DecimalField(max_digits=14, decimal_places=2)
+    delivery_price = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total_price = serializers.DecimalField(max_digits=14, decimal_places=2)
+    optimal = serializers.BooleanField(help_text='False when the time budget ran out or the search was heuristic.')
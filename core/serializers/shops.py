@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+from core.models import Shop
+
+
+class ShopStateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Shop
+        fields = ['id', 'name', 'accepts_orders']
+        read_only_fields = ['id', 'name']
+        extra_kwargs = {'accepts_orders': {'required': True}}
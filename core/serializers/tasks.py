@@ -0,0 +1,30 @@
+from django.core.validators import URLValidator
+from rest_framework import serializers
+
+from core.services.downloads import SCHEMES
+from core.services.price_list_export import EXPORT_FORMATS, YAML
+from core.services.price_list_import import MISSING_DELETE, MISSING_ZERO
+
+
+class PriceListImportSerializer(serializers.Serializer):
+    url = serializers.URLField(required=False, validators=[URLValidator(schemes=SCHEMES)])
+    file = serializers.FileField(required=False)
+    incremental = serializers.BooleanField(default=False)
+    missing = serializers.ChoiceField(choices=[MISSING_ZERO, MISSING_DELETE], default=MISSING_ZERO)
+
+    def validate(self, attrs):
+        if ('url' in attrs) == ('file' in attrs):
+            raise serializers.ValidationError('Either url or file must be given')
+        return attrs
+
+
+class PriceListExportSerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default=YAML)
+
+
+class TaskSerializer(serializers.Serializer):
+    id = serializers.CharField()
+    state = serializers.CharField()
+    progress = serializers.DictField(required=False)
+    result = serializers.DictField(required=False)
+    error = serializers.CharField(required=False)
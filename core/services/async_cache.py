@@ -0,0 +1,62 @@
+"""
+Async access to the default cache, for async views.
+
+With the Redis backend the commands are sent by a redis.asyncio client of the running
+event loop, with the keys and the serialization of Django's RedisCache, so sync and
+async code share the same entries. Other backends are called through their own
+async methods (thread pool wrappers around the sync ones).
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+
+# a redis.asyncio client is bound to the event loop it was first used on
+_clients = weakref.WeakKeyDictionary()
+_serializer = RedisSerializer()
+
+
+def _get_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        from redis import asyncio as aioredis
+
+        location = settings.CACHES['default']['LOCATION']
+        if not isinstance(location, str):
+            location = location[0]
+        # the first server is the one RedisCache writes to
+        client = _clients[loop] = aioredis.Redis.from_url(location.split(',')[0])
+    return client
+
+
+def _redis_cache():
+    cache = caches['default']
+    return cache if isinstance(cache, RedisCache) else None
+
+
+async def get_many(keys):
+    cache = _redis_cache()
+    if cache is None:
+        return await caches['default'].aget_many(keys)
+    values = await _get_client().mget([cache.make_and_validate_key(key) for key in keys])
+    return {key: _serializer.loads(value) for key, value in zip(keys, values) if value is not None}
+
+
+async def get(key):
+    return (await get_many([key])).get(key)
+
+
+async def set(key, value, timeout):
+    cache = _redis_cache()
+    if cache is None:
+        await caches['default'].aset(key, value, timeout)
+        return
+    client = _get_client()
+    key = cache.make_and_validate_key(key)
+    if timeout is None:
+        await client.set(key, _serializer.dumps(value))
+    else:
+        await client.set(key, _serializer.dumps(value), ex=max(int(timeout), 1))
@@ -0,0 +1,103 @@
+from django.db import models, transaction
+from django.db.models.functions import Least
+
+from core.models import ItemInShoppingBasket, ProductInfo, ShoppingBasket
+from core.services.shop_state import check_accepting_orders
+
+# the most of an offer one basket line holds, far below the column limit, so adding to a full line cannot overflow it
+MAX_QUANTITY = 1_000_000
+
+
+class UnknownOffers(Exception):
+    def __init__(self, product_info_ids):
+        self.product_info_ids = sorted(product_info_ids)
+        super().__init__(f'Unknown offers {self.product_info_ids}')
+
+
+def _lock_basket(user):
+    """
+    Get or lazily create the user's basket and lock it, so mutations of one basket are serialized.
+    """
+    shopping_basket, _ = ShoppingBasket.objects.select_for_update().get_or_create(user=user)
+    return shopping_basket
+
+
+def _get_shops(product_info_ids):
+    shops = dict(ProductInfo.objects.filter(pk__in=product_info_ids).values_list('pk', 'shop_id'))
+    unknown = set(product_info_ids) - shops.keys()
+    if unknown:
+        raise UnknownOffers(unknown)
+    check_accepting_orders(shops.values())
+    return shops
+
+
+def _new_lines(shopping_basket, quantities, shops):
+    return [
+        ItemInShoppingBasket(shopping_basket=shopping_basket, product_info_id=product_info_id,
+                             shop_id=shops[product_info_id], quantity=quantity)
+        for product_info_id, quantity in quantities.items()
+    ]
+
+
+def add_items(user, quantities):
+    """
+    Add {product_info_id: quantity} to the basket. Quantities of lines already
+    in the basket are incremented in the database, up to MAX_QUANTITY, the other lines are inserted.
+    """
+    with transaction.atomic():
+        shopping_basket = _lock_basket(user)
+        shops = _get_shops(quantities)
+        increment = models.Case(
+            *[models.When(product_info_id=pk, then=models.Value(quantity)) for pk, quantity in quantities.items()],
+            output_field=models.PositiveIntegerField(),
+        )
+        ItemInShoppingBasket.objects.filter(
+            shopping_basket=shopping_basket, product_info_id__in=quantities,
+        ).update(quantity=Least(models.F('quantity') + increment, MAX_QUANTITY))
+        # lines updated above conflict and are skipped
+        ItemInShoppingBasket.objects.bulk_create(_new_lines(shopping_basket, quantities, shops), ignore_conflicts=True)
+
+
+def set_items(user, quantities):
+    """
+    Set the quantities of {product_info_id: quantity} lines, adding the missing ones.
+    """
+    with transaction.atomic():
+        shopping_basket = _lock_basket(user)
+        shops = _get_shops(quantities)
+        ItemInShoppingBasket.objects.bulk_create(
+            _new_lines(shopping_basket, quantities, shops),
+            update_conflicts=True,
+            unique_fields=['shopping_basket', 'product_info'],
+            update_fields=['quantity'],
+        )
+
+
+def remove_items(user, product_info_ids):
+    ItemInShoppingBasket.objects.filter(
+        shopping_basket__user=user, product_info_id__in=product_info_ids,
+    ).delete()
+
+
+def replace_items(user, quantities):
+    """
+    Replace the whole basket with {product_info_id: quantity} lines.
+    """
+    with transaction.atomic():
+        shopping_basket = _lock_basket(user)
+        shops = _get_shops(quantities)
+        ItemInShoppingBasket.objects.filter(shopping_basket=shopping_basket).delete()
+        ItemInShoppingBasket.objects.bulk_create(_new_lines(shopping_basket, quantities, shops))
+
+
+def get_product_quantities(user):
+    """
+    Quantities of the products in the user's basket, whichever shops they are taken from.
+    """
+    return dict(
+        ItemInShoppingBasket.objects.filter(shopping_basket__user=user)
+        .values('product_info__product_id')
+        .annotate(quantity=models.Sum('quantity'))
+        .order_by('product_info__product_id')
+        .values_list('product_info__product_id', 'quantity')
+    )
@@ -0,0 +1,170 @@
+"""
+Split a purchase across shops so that the price of the goods plus the delivery
+price of every shop used is minimal.
+
+For a fixed set of shops the cheapest allocation is found product by product,
+taking the cheapest offers of those shops first until the quantity is covered.
+What is left is choosing the set of shops: all subsets are checked when there are
+few candidate shops, otherwise a drop/add local search starts from all shops and
+runs until no move helps or the time budget is spent.
+"""
+import itertools
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from core.models import ProductInfo
+from core.services.shop_state import get_paused_shop_ids
+
+DEFAULT_TIME_BUDGET = 0.5
+
+# exhaustive search while (number of subsets) * (number of products) stays below this
+EXACT_SEARCH_LIMIT = 50_000
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f'Not enough stock for products {self.product_ids}')
+
+
+@dataclass
+class Allocation:
+    product_id: int
+    product_info_id: int
+    shop_id: int
+    price: Decimal
+    quantity: int
+
+
+@dataclass
+class Plan:
+    allocations: list = field(default_factory=list)
+    items_price: Decimal = Decimal('0.00')
+    delivery_price: Decimal = Decimal('0.00')
+    optimal: bool = True
+
+    @property
+    def total_price(self):
+        return self.items_price + self.delivery_price
+
+    @property
+    def shop_ids(self):
+        return sorted({allocation.shop_id for allocation in self.allocations})
+
+
+def _cents(value):
+    return int(value * 100)
+
+
+class _Problem:
+    def __init__(self, quantities, offers, delivery):
+        # offers: {product_id: [(price in cents, shop_id, stock, product_info_id), ...]} cheapest first
+        self.quantities = quantities
+        self.offers = offers
+        self.delivery = delivery
+
+    def cost(self, shops):
+        """
+        Total price in cents and shops actually used, or (None, None) if the shops lack stock.
+        """
+        total = 0
+        used = set()
+        for product_id, quantity in self.quantities.items():
+            left = quantity
+            for price, shop_id, stock, _ in self.offers[product_id]:
+                if shop_id in shops:
+                    take = min(stock, left)
+                    total += take * price
+                    used.add(shop_id)
+                    left -= take
+                    if not left:
+                        break
+            if left:
+                return None, None
+        return total + sum(self.delivery[shop_id] for shop_id in used), frozenset(used)
+
+    def allocate(self, shops):
+        allocations = []
+        for product_id, quantity in self.quantities.items():
+            left = quantity
+            for price, shop_id, stock, product_info_id in self.offers[product_id]:
+                if shop_id in shops and left:
+                    take = min(stock, left)
+                    allocations.append(Allocation(product_id, product_info_id, shop_id, Decimal(price) / 100, take))
+                    left -= take
+        return allocations
+
+
+def _exact(problem, shops, deadline):
+    best_cost, best_shops = problem.cost(shops)
+    for size in range(1, len(shops)):
+        for subset in itertools.combinations(sorted(shops), size):
+            if time.monotonic() > deadline:
+                return best_shops, False
+            if sum(problem.delivery[shop_id] for shop_id in subset) >= best_cost:
+                continue
+            cost, used = problem.cost(frozenset(subset))
+            if cost is not None and cost < best_cost:
+                best_cost, best_shops = cost, used
+    return best_shops, True
+
+
+def _local_search(problem, shops, deadline):
+    best_cost, best_shops = problem.cost(shops)
+    improved = True
+    while improved:
+        improved = False
+        moves = [best_shops - {shop_id} for shop_id in best_shops]
+        moves += [best_shops | {shop_id} for shop_id in shops - best_shops]
+        for candidate in moves:
+            if time.monotonic() > deadline:
+                return best_shops
+            cost, used = problem.cost(candidate)
+            if cost is not None and cost < best_cost:
+                best_cost, best_shops = cost, used
+                improved = True
+    return best_shops
+
+
+def optimize(quantities, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Choose offers for {product_id: quantity} minimizing the goods plus delivery price.
+    Offers are read with one query, offers of shops not accepting orders are skipped.
+    Raises InsufficientStock if all shops together lack stock.
+    """
+    deadline = time.monotonic() + time_budget
+    offers = {product_id: [] for product_id in quantities}
+    delivery = {}
+    product_infos = ProductInfo.objects.filter(product_id__in=quantities, quantity__gt=0)
+    paused = get_paused_shop_ids()
+    if paused:
+        product_infos = product_infos.exclude(shop__in=paused)
+    rows = (
+        product_infos
+        .order_by('product_id', 'price', 'id')
+        .values_list('product_id', 'id', 'shop_id', 'price', 'quantity', 'shop__delivery_price')
+    )
+    for product_id, pk, shop_id, price, stock, delivery_price in rows:
+        offers[product_id].append((_cents(price), shop_id, stock, pk))
+        delivery[shop_id] = _cents(delivery_price)
+    problem = _Problem(quantities, offers, delivery)
+
+    shops = frozenset(delivery)
+    if problem.cost(shops)[0] is None:
+        raise InsufficientStock(
+            product_id for product_id, quantity in quantities.items()
+            if sum(stock for _, _, stock, _ in offers[product_id]) < quantity
+        )
+    if 2 ** len(shops) * len(quantities) <= EXACT_SEARCH_LIMIT:
+        best, optimal = _exact(problem, shops, deadline)
+    else:
+        best, optimal = _local_search(problem, shops, deadline), False
+
+    allocations = problem.allocate(best)
+    return Plan(
+        allocations=allocations,
+        items_price=sum((allocation.price * allocation.quantity for allocation in allocations), Decimal('0.00')),
+        delivery_price=Decimal(sum(delivery[shop_id] for shop_id in best)) / 100,
+        optimal=optimal,
+    )
@@ -0,0 +1,112 @@
+"""
+Versioned cache of catalog responses.
+
+Every cached response is keyed on its URL and on the generation counters of the
+shops/categories it was filtered by (or the global counter for unfiltered lists).
+Writers bump the counters after commit, which makes the old keys unreachable,
+so readers never get stale data and nothing has to be deleted. For REPLICA_PIN_TIMEOUT
+seconds after a bump, lists are computed from the primary: a replica may not have
+the change yet, and a list computed from it would be cached under the new counters.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from config.db_router import use_primary
+from core.services import async_cache
+
+CHANGED_KEY = 'catalog:changed'
+
+GLOBAL = 'all'
+SHOP = 'shop'
+CATEGORY = 'category'
+
+
+def generation_key(scope, pk=None):
+    if pk is None:
+        return f'catalog:generation:{scope}'
+    return f'catalog:generation:{scope}:{pk}'
+
+
+def _scope_keys(shops=(), categories=()):
+    keys = [generation_key(SHOP, pk) for pk in shops] + [generation_key(CATEGORY, pk) for pk in categories]
+    return keys or [generation_key(GLOBAL)]
+
+
+def get_generations(keys):
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        # an evicted counter restarts from the clock, never from a value that was already used
+        seed = time.time_ns()
+        for key in missing:
+            cache.add(key, seed, timeout=None)
+        generations.update(cache.get_many(missing))
+    return [generations[key] for key in keys]
+
+
+def bump(shops=(), categories=()):
+    """
+    Invalidate the unfiltered catalog and the lists filtered by the given shops and categories.
+    """
+    keys = [generation_key(GLOBAL)]
+    keys += [generation_key(SHOP, pk) for pk in shops]
+    keys += [generation_key(CATEGORY, pk) for pk in categories]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+    cache.set(CHANGED_KEY, True, settings.REPLICA_PIN_TIMEOUT)
+
+
+def bump_on_commit(shops=(), categories=()):
+    transaction.on_commit(lambda: bump(shops=shops, categories=categories))
+
+
+def _response_key(request, generations):
+    fingerprint = ':'.join([request.build_absolute_uri(), *map(str, generations)])
+    return f'catalog:response:{hashlib.sha1(fingerprint.encode()).hexdigest()}'
+
+
+def get_or_set(request, compute, shops=(), categories=()):
+    """
+    Return the cached data for this request URL or compute and cache it.
+    """
+    key = _response_key(request, get_generations(_scope_keys(shops, categories)))
+    data = cache.get(key)
+    if data is None:
+        if cache.get(CHANGED_KEY) is None:
+            data = compute()
+        else:
+            with use_primary():
+                data = compute()
+        cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+    return data
+
+
+async def aget_or_set(request, compute, shops=(), categories=()):
+    """
+    get_or_set for async views, `compute` is a coroutine function.
+    """
+    keys = _scope_keys(shops, categories)
+    generations = await async_cache.get_many(keys)
+    if len(generations) < len(keys):
+        # counters are seeded by the sync code, which does it atomically with cache.add
+        generations = await sync_to_async(get_generations)(keys)
+    else:
+        generations = [generations[key] for key in keys]
+    key = _response_key(request, generations)
+    data = await async_cache.get(key)
+    if data is None:
+        if await async_cache.get(CHANGED_KEY) is None:
+            data = await compute()
+        else:
+            with use_primary():
+                data = await compute()
+        await async_cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+    return data
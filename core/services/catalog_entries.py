@@ -0,0 +1,121 @@
+"""
+The catalog read model: one ProductCatalogEntry row per product.
+
+Entries are rebuilt from the normalized tables with one INSERT ... ON CONFLICT
+statement per set of products: by the price list importer and checkout for the
+goods they touched, and by the signals in core.signals for single-object changes.
+Rows of deleted products go away with the product.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+from django.db.models import F
+
+from core.models import Product, ProductCatalogEntry
+from core.serializers.fast import CATALOG_ENTRY_FIELDS, PRODUCT_FIELDS
+
+DEFAULT_BATCH_SIZE = 1000
+
+_batch_refresh = ContextVar('batch_refresh', default=False)
+
+UPSERT_ENTRIES = '''
+INSERT INTO core_productcatalogentry (
+    product_id, name, model, price_rrc, categories, category_ids, parameters,
+    min_price, max_price, total_stock, shop_ids, shop_count, updated_at
+)
+SELECT p.id, p.name, p.model, p.price_rrc,
+       COALESCE(c.names, '[]'), COALESCE(c.ids, '{}'), COALESCE(pp.parameters, '{}'),
+       o.min_price, o.max_price, COALESCE(o.total_stock, 0), COALESCE(o.shop_ids, '{}'), o.shop_count,
+       now()
+FROM core_product p
+LEFT JOIN LATERAL (
+    SELECT jsonb_agg(c.name ORDER BY c.name) AS names, array_agg(c.id ORDER BY c.id) AS ids
+    FROM core_product_categories pc JOIN core_category c ON c.id = pc.category_id
+    WHERE pc.product_id = p.id
+) c ON true
+LEFT JOIN LATERAL (
+    SELECT jsonb_object_agg(parameter_id::text, value) AS parameters
+    FROM core_productparameter
+    WHERE product_id = p.id
+) pp ON true
+LEFT JOIN LATERAL (
+    SELECT min(price) AS min_price, max(price) AS max_price, sum(quantity) AS total_stock,
+           array_agg(DISTINCT shop_id) AS shop_ids, count(DISTINCT shop_id) AS shop_count
+    FROM core_productinfo
+    WHERE product_id = p.id
+) o ON true
+WHERE p.id = ANY(%s::bigint[])
+ON CONFLICT (product_id) DO UPDATE SET
+    name = EXCLUDED.name, model = EXCLUDED.model, price_rrc = EXCLUDED.price_rrc,
+    categories = EXCLUDED.categories, category_ids = EXCLUDED.category_ids, parameters = EXCLUDED.parameters,
+    min_price = EXCLUDED.min_price, max_price = EXCLUDED.max_price, total_stock = EXCLUDED.total_stock,
+    shop_ids = EXCLUDED.shop_ids, shop_count = EXCLUDED.shop_count, updated_at = EXCLUDED.updated_at
+'''
+
+
+def refresh_entries(product_ids):
+    """
+    Rebuild the entries of the given products with one statement.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_ENTRIES, [product_ids])
+
+
+@contextmanager
+def batch_refresh():
+    """
+    Declare that the code in this block refreshes the entries and bumps the catalog lists
+    of the offers it deletes as a queryset itself, so the signals skip those deletes.
+    """
+    token = _batch_refresh.set(True)
+    try:
+        yield
+    finally:
+        _batch_refresh.reset(token)
+
+
+def in_batch_refresh():
+    return _batch_refresh.get()
+
+
+def rebuild_entries(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the entries of all products, `batch_size` products per statement.
+    """
+    product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+    batch = []
+    for product_id in product_ids.iterator(chunk_size=batch_size):
+        batch.append(product_id)
+        if len(batch) == batch_size:
+            refresh_entries(batch)
+            batch = []
+    refresh_entries(batch)
+
+
+def can_filter(shop=None, price_min=None, price_max=None, in_stock=False, exclude_shops=(), **filters):
+    """
+    Whether the entries answer these catalog filters exactly.
+
+    Offer conditions must hold for the same offer, which the offer aggregates of an entry
+    can only tell for a single condition; and the aggregates include the offers of
+    excluded shops. Other filters go to ProductQuerySet.filter_catalog.
+    """
+    offer_conditions = sum([shop is not None, price_min is not None, price_max is not None, bool(in_stock)])
+    return offer_conditions == 0 or (offer_conditions == 1 and not exclude_shops)
+
+
+def get_catalog_rows(params, exclude_shops=()):
+    """
+    The filtered products and their `.values()` rows for serialize_products: read from
+    the catalog entries when they answer the filters exactly, from the normalized tables otherwise.
+    """
+    if can_filter(**params, exclude_shops=exclude_shops):
+        # one scan of the catalog entries, category names included
+        products = ProductCatalogEntry.objects.filter_catalog(**params, exclude_shops=exclude_shops)
+        return products, products.values(*CATALOG_ENTRY_FIELDS, id=F('product_id'))
+    products = Product.objects.filter_catalog(**params, exclude_shops=exclude_shops)
+    return products, products.values(*PRODUCT_FIELDS)
@@ -0,0 +1,85 @@
+from django.db import transaction
+
+from core.models import ItemInOrder, ItemInShoppingBasket, Order, Product, ProductInfo
+from core.services.catalog_cache import bump_on_commit
+from core.services.catalog_entries import refresh_entries
+from core.services.shop_state import check_accepting_orders
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyBasket(CheckoutError):
+    def __init__(self):
+        super().__init__('The basket is empty')
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, product_info_ids):
+        self.product_info_ids = sorted(product_info_ids)
+        super().__init__(f'Not enough stock for offers {self.product_info_ids}')
+
+
+def place_order(user):
+    """
+    Turn the user's basket into an order in one transaction.
+
+    The basket lines and then the offers are locked with SELECT ... FOR UPDATE,
+    offers in primary key order so parallel checkouts cannot deadlock. Stock is
+    checked and decremented while the locks are held, so a hot offer is never oversold.
+    The number of queries does not depend on the number of basket lines.
+    """
+    with transaction.atomic():
+        lines = list(
+            ItemInShoppingBasket.objects.select_for_update()
+            .filter(shopping_basket__user=user)
+            .values_list('id', 'product_info_id', 'quantity', 'shop_id')
+        )
+        if not lines:
+            raise EmptyBasket()
+        check_accepting_orders({shop_id for _, _, _, shop_id in lines}, shared=True)
+        offers = list(
+            ProductInfo.objects.select_for_update()
+            .filter(pk__in=[product_info_id for _, product_info_id, _, _ in lines])
+            .order_by('pk')
+            .values_list('pk', 'quantity', 'product_id', 'price')
+        )
+        stock = {pk: quantity for pk, quantity, _, _ in offers}
+        prices = {pk: price for pk, _, _, price in offers}
+        out_of_stock = {
+            product_info_id for _, product_info_id, quantity, _ in lines
+            if stock.get(product_info_id, 0) < quantity
+        }
+        if out_of_stock:
+            raise OutOfStock(out_of_stock)
+
+        product_infos = [
+            ProductInfo(pk=product_info_id, quantity=stock[product_info_id] - quantity)
+            for _, product_info_id, quantity, _ in lines
+        ]
+        ProductInfo.objects.bulk_update(product_infos, ['quantity'])
+        refresh_entries({product_id for _, _, product_id, _ in offers})
+
+        order = Order.objects.create(user=user, number=0)
+        # the order number is the order id
+        order.number = order.pk
+        order.save(update_fields=['number'])
+        ItemInOrder.objects.bulk_create([
+            ItemInOrder(order=order, product_info_id=product_info_id, shop_id=shop_id, quantity=quantity,
+                        price=prices[product_info_id])
+            for _, product_info_id, quantity, shop_id in lines
+        ])
+        ItemInShoppingBasket.objects.filter(pk__in=[pk for pk, _, _, _ in lines]).delete()
+
+        sold_out = [product_info.pk for product_info in product_infos if product_info.quantity == 0]
+        if sold_out:
+            # offers that ran out drop from the in-stock catalog lists
+            bump_on_commit(
+                shops=list(ProductInfo.objects.filter(pk__in=sold_out).values_list('shop_id', flat=True).distinct()),
+                categories=list(
+                    Product.categories.through.objects.filter(product__product_infos__in=sold_out)
+                    .values_list('category_id', flat=True).distinct()
+                ),
+            )
+    return order
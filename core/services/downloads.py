@@ -0,0 +1,144 @@
+"""
+Downloads of the price lists suppliers give by URL.
+
+The URL comes from the supplier, so only http and https are fetched, from
+public addresses only. The host of every connection is resolved and all of its
+addresses are checked before one is connected to, so neither a redirect nor a
+DNS answer that changed since the URL was validated reaches the internal
+network: Redis, PostgreSQL, cloud metadata endpoints. Proxies from the
+environment are not used, they would be the only address checked. The response
+is cut off at `max_size` bytes.
+
+A rejected URL raises ForbiddenURL, a ValueError, so the import task does not retry it.
+"""
+import http.client
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+from urllib.request import (
+    HTTPDefaultErrorHandler, HTTPErrorProcessor, HTTPHandler, HTTPRedirectHandler, HTTPSHandler, OpenerDirector,
+)
+
+SCHEMES = ('http', 'https')
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+
+class ForbiddenURL(ValueError):
+    pass
+
+
+class TooLarge(ValueError):
+    def __init__(self, max_size):
+        super().__init__(f'The price list is larger than {max_size} bytes')
+
+
+def check_url(url):
+    if urlsplit(url).scheme.lower() not in SCHEMES:
+        raise ForbiddenURL(f'Only {", ".join(SCHEMES)} URLs can be fetched: {url}')
+
+
+def check_address(host):
+    address = ipaddress.ip_address(host.split('%', 1)[0])
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    if not address.is_global or address.is_multicast:
+        raise ForbiddenURL(f'{address} is not a public address')
+
+
+def _create_public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    # socket.create_connection over addresses checked before connecting, so no internal port is even probed
+    host, port = address
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for *_, sockaddr in addresses:
+        check_address(sockaddr[0])
+    error = None
+    for family, socktype, proto, _, sockaddr in addresses:
+        sock = socket.socket(family, socktype, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as exc:
+            error = exc
+            sock.close()
+    raise error or OSError(f'{host} has no address')
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class _PublicHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _RedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _build_opener():
+    opener = OpenerDirector()
+    for handler in (_PublicHTTPHandler(), _PublicHTTPSHandler(), _RedirectHandler(), HTTPDefaultErrorHandler(),
+                    HTTPErrorProcessor()):
+        opener.add_handler(handler)
+    return opener
+
+
+class LimitedStream:
+    """
+    A file-like response that raises TooLarge once more than `max_size` bytes were read.
+    """
+    def __init__(self, stream, max_size):
+        self._stream = stream
+        self._max_size = max_size
+        self._read = 0
+
+    def read(self, size=-1):
+        left = self._max_size - self._read + 1
+        data = self._stream.read(left if size is None or size < 0 else min(size, left))
+        self._read += len(data)
+        if self._read > self._max_size:
+            raise TooLarge(self._max_size)
+        return data
+
+    def close(self):
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_url(url, timeout, max_size=DEFAULT_MAX_SIZE):
+    """
+    Open `url` for reading, see the module docstring for what is rejected.
+    """
+    check_url(url)
+    response = _build_opener().open(url, timeout=timeout)
+    length = response.headers.get('Content-Length')
+    if length is not None and length.isdigit() and int(length) > max_size:
+        response.close()
+        raise TooLarge(max_size)
+    return LimitedStream(response, max_size)
@@ -0,0 +1,43 @@
+"""
+Facet counts of product parameters: how many products have each parameter value.
+
+Counts over the whole catalog are read from the core_parameter_facet materialized
+view, which the price list importer refreshes after every import that changed goods.
+The view counts every product, so the catalog views use it only while no shop is paused.
+Counts over a filtered selection are grouped in one query over the products of the selection.
+"""
+from django.db import connection, models
+
+from core.models import ParameterFacet, ProductParameter
+
+
+def refresh_facets():
+    with connection.cursor() as cursor:
+        cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY core_parameter_facet')
+
+
+def _group(rows):
+    facets = {}
+    for parameter_id, name, value, count in rows:
+        facet = facets.setdefault(parameter_id, {'parameter': parameter_id, 'name': name, 'values': []})
+        facet['values'].append({'value': value, 'count': count})
+    return list(facets.values())
+
+
+def get_facets(products=None):
+    """
+    Facets of the products of a queryset, or of the whole catalog when it is None.
+    Parameters are ordered by name and their values by descending count.
+    """
+    if products is None:
+        rows = ParameterFacet.objects.annotate(count=models.F('product_count'))
+    else:
+        rows = (
+            ProductParameter.objects.filter(product__in=products.order_by().values('pk'))
+            .values('parameter_id', 'value')
+            .annotate(count=models.Count('product_id'))
+        )
+    return _group(
+        rows.order_by('parameter__name', 'parameter_id', '-count', 'value')
+        .values_list('parameter_id', 'parameter__name', 'value', 'count')
+    )
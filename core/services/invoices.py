@@ -0,0 +1,113 @@
+"""
+Invoices for the administrators: the lines of the orders to fulfil, one invoice per shop.
+
+Orders are invoiced in batches of `batch_size` in primary key order. A batch costs a
+fixed number of queries whatever its size: the orders with their users, their
+items with the offers, products and shops, and one UPDATE marking them invoiced.
+The invoice template is rendered once per shop of a batch, with all its lines,
+and the messages of the whole run are sent over one SMTP connection.
+
+Orders are marked after their invoices went out, so a failed run sends the
+unsent batches again when it is retried. The invoices of a batch are sent one
+by one, and when one fails the orders whose invoices all went out before it are
+marked, so a retry sends an invoice again only for the orders it shares with
+an unsent one.
+
+A batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED and its transaction
+is committed after the orders are marked, so runs that overlap, like a retry
+started while a scheduled run is still sending, never send the same orders.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import get_template
+from django.utils import timezone
+
+from core.models import ItemInOrder, Order
+
+DEFAULT_BATCH_SIZE = 1000
+
+INVOICE_TEMPLATE = 'core/email/invoice.txt'
+
+
+@dataclass
+class InvoiceStats:
+    orders: int = 0
+    invoices: int = 0
+
+
+def get_orders(queryset):
+    return queryset.select_related('user').prefetch_related(Prefetch(
+        'ordered_items',
+        queryset=ItemInOrder.objects.select_related('product_info__product', 'shop').order_by('id'),
+    ))
+
+
+def render_invoices(orders, template=None):
+    """
+    (shop, invoice text) of every shop with lines in `orders`, orders with prefetched items.
+    """
+    template = template or get_template(INVOICE_TEMPLATE)
+    shops = {}
+    for order in orders:
+        items_by_shop = {}
+        for item in order.ordered_items.all():
+            items_by_shop.setdefault(item.shop_id, []).append(item)
+        for items in items_by_shop.values():
+            invoice = shops.setdefault(items[0].shop_id, {'shop': items[0].shop, 'orders': [], 'total': 0})
+            subtotal = sum(item.price * item.quantity for item in items)
+            invoice['orders'].append({'order': order, 'items': items, 'total': subtotal})
+            invoice['total'] += subtotal
+    return [(invoice['shop'], template.render(invoice)) for invoice in shops.values()]
+
+
+def _mark_invoiced(orders):
+    if orders:
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(invoiced_at=timezone.now())
+
+
+def send_invoices(order_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Send the invoices of the orders not invoiced yet, all of them or those of `order_ids`.
+    """
+    pending = Order.objects.filter(invoiced_at=None)
+    if order_ids is not None:
+        pending = pending.filter(pk__in=order_ids)
+    template = get_template(INVOICE_TEMPLATE)
+    stats = InvoiceStats()
+    last_pk = 0
+    with get_connection() as connection:
+        while True:
+            error = None
+            with transaction.atomic():
+                orders = list(get_orders(
+                    pending.filter(pk__gt=last_pk).order_by('pk').select_for_update(skip_locked=True, of=('self',))
+                )[:batch_size])
+                if not orders:
+                    break
+                sent_shop_ids = set()
+                try:
+                    for shop, text in render_invoices(orders, template):
+                        connection.send_messages([EmailMessage(f'Invoice: {shop.name}', text,
+                                                               to=settings.INVOICE_RECIPIENTS)])
+                        sent_shop_ids.add(shop.pk)
+                except Exception as exc:
+                    error = exc
+                    # committed with the claim, the error is raised once the transaction is over
+                    _mark_invoiced([
+                        order for order in orders
+                        if {item.shop_id for item in order.ordered_items.all()} <= sent_shop_ids
+                    ])
+                else:
+                    _mark_invoiced(orders)
+            if error is not None:
+                raise error
+            stats.orders += len(orders)
+            stats.invoices += len(sent_shop_ids)
+            if len(orders) < batch_size:
+                break
+            last_pk = orders[-1].pk
+    return stats
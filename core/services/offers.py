@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models.functions import RowNumber
+
+from core.models import ProductInfo
+from core.serializers.fast import format_decimal
+from core.services.shop_state import get_paused_shop_ids
+
+
+def get_offers(product_ids):
+    """
+    In-stock offers of the given products, cheapest first, read with one query.
+    Returns {product_id: [offer, ...]}; the first offer of a product is its best one.
+    Offers of shops that do not accept orders are left out.
+    """
+    product_infos = ProductInfo.objects.filter(product_id__in=product_ids, quantity__gt=0)
+    paused = get_paused_shop_ids()
+    if paused:
+        product_infos = product_infos.exclude(shop__in=paused)
+    rows = (
+        product_infos
+        .annotate(rank=models.Window(
+            RowNumber(), partition_by=models.F('product_id'), order_by=[models.F('price'), models.F('id')],
+        ))
+        .order_by('product_id', 'rank')
+        .values_list('product_id', 'id', 'shop_id', 'shop__name', 'price', 'quantity')
+    )
+    offers = {product_id: [] for product_id in product_ids}
+    for product_id, pk, shop_id, shop_name, price, quantity in rows:
+        offers[product_id].append({
+            'id': pk,
+            'shop': {'id': shop_id, 'name': shop_name},
+            'price': format_decimal(price),
+            'quantity': quantity,
+        })
+    return offers
+
+
+def compare_offers(product_ids):
+    """
+    Offers of every product with the cheapest one picked out, in the order of `product_ids`.
+    """
+    offers = get_offers(product_ids)
+    return [
+        {'product': product_id, 'best': offers[product_id][0] if offers[product_id] else None,
+         'offers': offers[product_id]}
+        for product_id in dict.fromkeys(product_ids)
+    ]
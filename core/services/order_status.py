@@ -0,0 +1,31 @@
+"""
+Order status changes in bulk, for the order admin.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from core.models import Order
+
+SET_STATUS = '''
+UPDATE core_order SET status = %s, delivered_at = %s, updated_at = %s
+WHERE id IN ({orders}) AND status <> %s
+RETURNING id
+'''
+
+
+def set_status(orders, status):
+    """
+    Set the status of the orders of a queryset and return the ids of the orders that changed,
+    whose clients are to be notified. The orders are selected, locked and changed by one
+    UPDATE ... RETURNING, which sends no list of ids whatever the number of orders. An order
+    changed by two admins at once is changed, and so notified, by the first one only:
+    the second UPDATE checks the status again once the first one committed.
+    """
+    now = timezone.now()
+    sql, params = orders.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SET_STATUS.format(orders=sql),
+            [status, now if status == Order.StatusChoices.DELIVERED else None, now, *params, status],
+        )
+        return [order_id for order_id, in cursor.fetchall()]
@@ -0,0 +1,156 @@
+"""
+Export of a shop's catalog in the price list schema of `data/shop1.yaml`,
+as YAML, JSON Lines or CSV.
+
+Goods are read with `.iterator(chunk_size=...)` and written chunk by chunk,
+so the memory use does not depend on the size of the shop.
+"""
+import csv
+import json
+from decimal import Decimal
+
+import yaml
+from django.db.models import Prefetch
+
+from core.models import Category, ProductInfo, ProductParameter
+
+DEFAULT_CHUNK_SIZE = 2000
+
+YAML = 'yaml'
+JSONL = 'jsonl'
+CSV = 'csv'
+
+CSV_FIELDS = ('id', 'shop', 'category', 'category_name', 'model', 'name', 'price', 'price_rrc', 'quantity',
+              'parameters')
+
+_Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+def _number(value):
+    """
+    Prices are written like in the source price lists: integers when they are whole.
+    """
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+def get_categories(shop):
+    return list(shop.categories.order_by('id').values('id', 'name'))
+
+
+def iter_goods(shop, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the shop's goods as price list items, ordered by their external id.
+    """
+    category_ids = set(shop.categories.values_list('id', flat=True))
+    product_infos = (
+        ProductInfo.objects.filter(shop=shop)
+        .select_related('product')
+        .prefetch_related(
+            Prefetch('product__categories', queryset=Category.objects.only('id')),
+            Prefetch('product__product_parameters',
+                     queryset=ProductParameter.objects.select_related('parameter').order_by('parameter__name')),
+        )
+        .order_by('external_id')
+    )
+    for product_info in product_infos.iterator(chunk_size=chunk_size):
+        product = product_info.product
+        category = next(
+            (category.pk for category in product.categories.all() if category.pk in category_ids), None,
+        )
+        yield {
+            'id': product_info.external_id,
+            'category': category,
+            'model': product.model,
+            'name': product.name,
+            'price': _number(Decimal(product_info.price)),
+            'price_rrc': _number(Decimal(product.price_rrc)),
+            'quantity': product_info.quantity,
+            'parameters': {
+                product_parameter.parameter.name: product_parameter.value
+                for product_parameter in product.product_parameters.all()
+            },
+        }
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _dump(data):
+    return yaml.dump(data, Dumper=_Dumper, allow_unicode=True, sort_keys=False, default_flow_style=False)
+
+
+def iter_yaml(shop, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the price list as YAML text chunks.
+    """
+    yield _dump({'shop': shop.name, 'categories': get_categories(shop)})
+    empty = True
+    for goods in _chunks(iter_goods(shop, chunk_size), chunk_size):
+        if empty:
+            yield '\ngoods:\n'
+            empty = False
+        yield _dump(goods)
+    if empty:
+        yield '\ngoods: []\n'
+
+
+def _iter_flat_goods(shop, chunk_size):
+    """
+    Goods of the flat formats are self-contained: every row has the shop and category names.
+    """
+    category_names = {category['id']: category['name'] for category in get_categories(shop)}
+    for good in iter_goods(shop, chunk_size):
+        good = {'id': good.pop('id'), 'shop': shop.name, **good}
+        good['category_name'] = category_names.get(good['category'])
+        yield good
+
+
+def iter_jsonl(shop, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the price list as JSON Lines chunks, one good per line.
+    """
+    for goods in _chunks(_iter_flat_goods(shop, chunk_size), chunk_size):
+        yield ''.join(json.dumps(good, ensure_ascii=False) + '\n' for good in goods)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(shop, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the price list as CSV chunks. Parameters are written as a JSON object.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for goods in _chunks(_iter_flat_goods(shop, chunk_size), chunk_size):
+        yield ''.join(
+            writer.writerow([
+                json.dumps(good[field], ensure_ascii=False) if field == 'parameters' else good[field]
+                for field in CSV_FIELDS
+            ])
+            for good in goods
+        )
+
+
+EXPORT_FORMATS = {
+    YAML: (iter_yaml, 'application/x-yaml; charset=utf-8'),
+    JSONL: (iter_jsonl, 'application/x-ndjson; charset=utf-8'),
+    CSV: (iter_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def iter_export(shop, export_format=YAML, chunk_size=DEFAULT_CHUNK_SIZE):
+    iter_chunks, _ = EXPORT_FORMATS[export_format]
+    return iter_chunks(shop, chunk_size)
@@ -0,0 +1,341 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from decimal import Decimal
+
+import yaml
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from yaml.events import MappingEndEvent, MappingStartEvent, ScalarEvent, SequenceEndEvent, SequenceStartEvent
+from yaml.nodes import ScalarNode
+
+from core.models import Category, ItemInOrder, Parameter, Product, ProductInfo, ProductParameter, Shop
+from core.services.catalog_cache import bump_on_commit
+from core.services.catalog_entries import batch_refresh, refresh_entries
+from core.services.facets import refresh_facets
+from core.services.product_search import update_search_vectors
+
+DEFAULT_BATCH_SIZE = 1000
+
+MISSING_ZERO = 'zero'
+MISSING_DELETE = 'delete'
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _construct(loader, event):
+    """
+    Build a python object from the events of one node without keeping the node tree in memory.
+    """
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        return constructor(loader, ScalarNode(tag, event.value, style=event.style))
+    if isinstance(event, SequenceStartEvent):
+        items = []
+        while not loader.check_event(SequenceEndEvent):
+            items.append(_construct(loader, loader.get_event()))
+        loader.get_event()
+        return items
+    if isinstance(event, MappingStartEvent):
+        mapping = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _construct(loader, loader.get_event())
+            mapping[key] = _construct(loader, loader.get_event())
+        loader.get_event()
+        return mapping
+    raise ValueError(f'Unsupported price list element: {event}')
+
+
+def iter_price_list(stream):
+    """
+    Parse a price list as a stream of (section, value) pairs.
+    Items of the `categories` and `goods` sections are yielded one by one.
+    """
+    loader = _Loader(stream)
+    try:
+        loader.get_event()
+        loader.get_event()
+        if not loader.check_event(MappingStartEvent):
+            raise ValueError('Price list must be a mapping')
+        loader.get_event()
+        while not loader.check_event(MappingEndEvent):
+            key = _construct(loader, loader.get_event())
+            if key in ('categories', 'goods') and loader.check_event(SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(SequenceEndEvent):
+                    yield key, _construct(loader, loader.get_event())
+                loader.get_event()
+            else:
+                yield key, _construct(loader, loader.get_event())
+    finally:
+        loader.dispose()
+
+
+def fingerprint(good, category_name=None):
+    # the category of a good is a price list id, its name is hashed too so a renamed category is written
+    row = json.dumps([good, category_name], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(row.encode()).hexdigest()
+
+
+@dataclass
+class ImportStats:
+    shop: Shop = None
+    goods: int = 0
+    batches: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+
+
+class PriceListImporter:
+    """
+    Loads a shop price list (see data/shop1.yaml) in batches.
+    Categories and parameters are resolved from in-memory name -> id maps,
+    so every batch costs the same bounded number of queries.
+
+    In incremental mode goods whose fingerprint did not change are skipped,
+    and goods missing from the price list are zeroed out or deleted. Goods that
+    were ordered are zeroed out in both cases, their offers are kept for the orders.
+
+    When `user` is given, the shop must belong to that user (or be new).
+    `progress` is called with the stats after every batch.
+    """
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, incremental=False, missing=MISSING_ZERO,
+                 user=None, progress=None):
+        if missing not in (MISSING_ZERO, MISSING_DELETE):
+            raise ValueError(f'Unknown missing goods policy: {missing}')
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.missing = missing
+        self.user = user
+        self.progress = progress
+        self.stats = ImportStats()
+        self._pending_categories = []
+        self._category_ids = {}
+        self._category_names = {}
+        self._parameter_ids = {}
+        self._seen_external_ids = set()
+
+    @property
+    def shop(self):
+        return self.stats.shop
+
+    def run(self, stream):
+        batch = []
+        for key, value in iter_price_list(stream):
+            if key == 'shop':
+                self.stats.shop = self._get_shop(value)
+            elif key == 'categories':
+                self._pending_categories.append(value)
+            elif key == 'goods':
+                batch.append(value)
+                if len(batch) >= self.batch_size:
+                    self._save_batch(batch)
+                    batch = []
+        self._save_batch(batch)
+        if self.incremental:
+            self._remove_missing()
+        if self.stats.inserted or self.stats.updated or self.stats.removed:
+            refresh_facets()
+            # unfiltered lists carry the facets, they are cached again once the view is fresh
+            bump_on_commit()
+        return self.stats
+
+    def _get_shop(self, name):
+        if self.user is None:
+            shop, _ = Shop.objects.get_or_create(name=name)
+            return shop
+        shop = Shop.objects.filter(user=self.user).first()
+        if shop is not None and shop.name != name:
+            raise ValueError(f'The user already has shop "{shop.name}"')
+        shop, _ = Shop.objects.get_or_create(name=name, defaults={'user': self.user})
+        if shop.user_id != self.user.pk:
+            raise ValueError(f'Shop "{name}" belongs to another user')
+        return shop
+
+    def _save_batch(self, goods):
+        if self.shop is None:
+            raise ValueError('Price list must start with a shop name')
+        with transaction.atomic():
+            self._save_categories()
+            if not goods:
+                return
+            # the same row must not be upserted twice within one statement
+            goods = list({good['id']: good for good in goods}.values())
+            fingerprints = {
+                good['id']: fingerprint(good, self._category_names.get(good.get('category'))) for good in goods
+            }
+            existing = {
+                external_id: (old_fingerprint, product_id)
+                for external_id, old_fingerprint, product_id
+                in ProductInfo.objects.filter(shop=self.shop, external_id__in=fingerprints)
+                .values_list('external_id', 'fingerprint', 'product_id')
+            }
+            changed = []
+            for good in goods:
+                old_fingerprint, _ = existing.get(good['id'], (None, None))
+                if old_fingerprint is None:
+                    self.stats.inserted += 1
+                elif old_fingerprint != fingerprints[good['id']]:
+                    self.stats.updated += 1
+                else:
+                    self.stats.unchanged += 1
+                    if self.incremental:
+                        continue
+                changed.append(good)
+            if changed:
+                product_ids = self._save_goods(changed, fingerprints)
+                # an offer may have moved to another product, the entry of the old one changes too
+                product_ids.update(existing[good['id']][1] for good in changed if good['id'] in existing)
+                refresh_entries(product_ids)
+                bump_on_commit(
+                    shops=[self.shop.pk],
+                    categories={self._category_ids[good['category']] for good in changed
+                                if good.get('category') in self._category_ids},
+                )
+            if self.incremental:
+                self._seen_external_ids.update(fingerprints)
+            self.stats.goods += len(goods)
+            self.stats.batches += 1
+        if self.progress is not None:
+            self.progress(self.stats)
+
+    def _remove_missing(self):
+        missing = [
+            (pk, product_id)
+            for pk, external_id, product_id in ProductInfo.objects.filter(shop=self.shop)
+            .values_list('id', 'external_id', 'product_id')
+            .iterator(chunk_size=self.batch_size * 10)
+            if external_id not in self._seen_external_ids
+        ]
+        if not missing:
+            return
+        with transaction.atomic():
+            bump_on_commit(
+                shops=[self.shop.pk],
+                categories=list(self.shop.categories.values_list('id', flat=True)),
+            )
+            for i in range(0, len(missing), self.batch_size):
+                batch = missing[i:i + self.batch_size]
+                product_infos = ProductInfo.objects.filter(pk__in=[pk for pk, _ in batch])
+                if self.missing == MISSING_DELETE:
+                    # deleting an ordered offer would delete the order lines with it
+                    with batch_refresh():
+                        _, deleted = product_infos.exclude(
+                            Exists(ItemInOrder.objects.filter(product_info=OuterRef('pk'))),
+                        ).delete()
+                    self.stats.removed += deleted.get(ProductInfo._meta.label, 0)
+                # the fingerprint is reset so the good is written again when it comes back
+                self.stats.removed += product_infos.exclude(quantity=0, fingerprint='').update(
+                    quantity=0, fingerprint='',
+                )
+                refresh_entries({product_id for _, product_id in batch})
+
+    def _save_categories(self):
+        if not self._pending_categories:
+            return
+        names = {category['name'] for category in self._pending_categories}
+        ids = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - ids.keys()
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            ids.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        linked = set(
+            Category.shops.through.objects.filter(shop_id=self.shop.pk, category_id__in=ids.values())
+            .values_list('category_id', flat=True)
+        )
+        Category.shops.through.objects.bulk_create(
+            [Category.shops.through(category_id=pk, shop_id=self.shop.pk) for pk in ids.values() if pk not in linked],
+            ignore_conflicts=True,
+        )
+        for category in self._pending_categories:
+            self._category_ids[category['id']] = ids[category['name']]
+            self._category_names[category['id']] = category['name']
+        self._pending_categories = []
+
+    def _resolve_parameters(self, names):
+        missing = set(names) - self._parameter_ids.keys()
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in missing], ignore_conflicts=True)
+            self._parameter_ids.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+        return self._parameter_ids
+
+    def _save_goods(self, goods, fingerprints):
+        """
+        Upsert the goods with their products, categories and parameters; returns the product ids.
+        """
+        products = {
+            (good['name'], good.get('model', '')): Product(
+                name=good['name'],
+                model=good.get('model', ''),
+                price_rrc=Decimal(str(good['price_rrc'])),
+            )
+            for good in goods
+        }
+        Product.objects.bulk_create(
+            products.values(),
+            update_conflicts=True,
+            unique_fields=['name', 'model'],
+            update_fields=['price_rrc', 'updated_at'],
+        )
+        product_ids = {
+            (name, model): pk
+            for pk, name, model in Product.objects.order_by()
+            .filter(name__in={name for name, _ in products})
+            .values_list('id', 'name', 'model')
+            if (name, model) in products
+        }
+
+        product_infos = []
+        product_categories = []
+        product_parameters = {}
+        parameter_ids = self._resolve_parameters(
+            {name for good in goods for name in (good.get('parameters') or {})}
+        )
+        for good in goods:
+            product_id = product_ids[(good['name'], good.get('model', ''))]
+            product_infos.append(ProductInfo(
+                shop=self.shop,
+                external_id=good['id'],
+                product_id=product_id,
+                price=Decimal(str(good['price'])),
+                quantity=good['quantity'],
+                fingerprint=fingerprints[good['id']],
+            ))
+            category_id = self._category_ids.get(good.get('category'))
+            if category_id is not None:
+                product_categories.append(
+                    Product.categories.through(product_id=product_id, category_id=category_id)
+                )
+            for name, value in (good.get('parameters') or {}).items():
+                parameter_id = parameter_ids[name]
+                product_parameters[(product_id, parameter_id)] = ProductParameter(
+                    product_id=product_id, parameter_id=parameter_id, value=str(value),
+                )
+
+        ProductInfo.objects.bulk_create(
+            product_infos,
+            update_conflicts=True,
+            unique_fields=['shop', 'external_id'],
+            update_fields=['product', 'price', 'quantity', 'fingerprint', 'updated_at'],
+        )
+        Product.categories.through.objects.bulk_create(product_categories, ignore_conflicts=True)
+        ProductParameter.objects.bulk_create(
+            product_parameters.values(),
+            update_conflicts=True,
+            unique_fields=['product', 'parameter'],
+            update_fields=['value'],
+        )
+        update_search_vectors(product_ids.values())
+        return set(product_ids.values())
+
+
+def import_price_list(stream, batch_size=DEFAULT_BATCH_SIZE, incremental=False, missing=MISSING_ZERO,
+                      user=None, progress=None):
+    importer = PriceListImporter(batch_size=batch_size, incremental=incremental, missing=missing,
+                                 user=user, progress=progress)
+    return importer.run(stream)
@@ -0,0 +1,71 @@
+"""
+Product search.
+
+Full-text search runs on the stored `Product.search_vector` (name, model and
+parameter values) through a GIN index. When the pg_trgm extension is installed,
+products whose name is similar to the query are found too, so typos still match;
+the trigram GIN index on the name is created by migration 0011 in that case.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection, models
+
+from core.models import Product, ProductParameter
+from core.services.shop_state import get_paused_shop_ids
+
+SEARCH_CONFIG = 'russian'
+
+_trigram_available = {}
+
+
+def get_search_vector():
+    parameter_values = (
+        ProductParameter.objects.filter(product=models.OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(values=StringAgg('value', ' '))
+        .values('values')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('model', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(models.Subquery(parameter_values), weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(product_ids):
+    """
+    Recompute the search vectors of the given products with one UPDATE.
+    """
+    Product.objects.filter(pk__in=list(product_ids)).update(search_vector=get_search_vector())
+
+
+def trigram_available():
+    """
+    Whether pg_trgm is installed in the database; checked once per database.
+    """
+    alias = connection.alias
+    if alias not in _trigram_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[alias] = cursor.fetchone() is not None
+    return _trigram_available[alias]
+
+
+def search_products(text):
+    """
+    Products matching `text`, best matches first. Like the catalog, products offered
+    by paused shops only are hidden.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    condition = models.Q(search_vector=query)
+    rank = SearchRank(models.F('search_vector'), query)
+    if trigram_available():
+        condition |= models.Q(name__trigram_word_similar=text)
+        rank = rank + TrigramWordSimilarity(text, 'name')
+    return (
+        Product.objects.filter_catalog(exclude_shops=get_paused_shop_ids())
+        .filter(condition)
+        .annotate(rank=rank)
+        .order_by('-rank', 'id')
+    )
@@ -0,0 +1,88 @@
+"""
+Shops that paused accepting orders.
+
+The set of their ids is read on every catalog, basket and checkout request, so it is
+cached twice: in Redis, shared by all processes, and in process memory for a few
+seconds. It is kept instead of the set of active shops because it is usually empty,
+and then the read paths need no shop filter at all.
+
+Catalog pages are cached for much longer than the process cache, under generations
+that a toggle bumps at once, so they are computed from the shared set: a page computed
+from a stale process copy would be cached under the new generations.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from config.db_router import use_primary
+from core.models import Shop
+from core.services import async_cache
+from core.services.catalog_cache import bump_on_commit
+
+PAUSED_SHOPS_KEY = 'shops:paused'
+
+LOCAL_TIMEOUT = 5
+
+_local = {'ids': None, 'expires_at': 0.0}
+
+
+class ShopsNotAcceptingOrders(Exception):
+    def __init__(self, shop_ids):
+        self.shop_ids = sorted(shop_ids)
+        super().__init__(f'Shops {self.shop_ids} do not accept orders')
+
+
+def get_paused_shop_ids(shared=False):
+    """
+    Ids of the shops not accepting orders. With `shared` the process cache is skipped,
+    so a toggle made by another process is seen at once.
+    """
+    now = time.monotonic()
+    if not shared and _local['ids'] is not None and now < _local['expires_at']:
+        return _local['ids']
+    ids = cache.get(PAUSED_SHOPS_KEY)
+    if ids is None:
+        # cached until the next toggle, so never read from a replica that may lag behind it
+        with use_primary():
+            ids = frozenset(Shop.objects.filter(accepts_orders=False).values_list('id', flat=True))
+        cache.set(PAUSED_SHOPS_KEY, ids, timeout=None)
+    _local.update(ids=ids, expires_at=now + LOCAL_TIMEOUT)
+    return ids
+
+
+async def aget_paused_shop_ids(shared=False):
+    """
+    get_paused_shop_ids for async views.
+    """
+    now = time.monotonic()
+    if not shared and _local['ids'] is not None and now < _local['expires_at']:
+        return _local['ids']
+    ids = await async_cache.get(PAUSED_SHOPS_KEY)
+    if ids is None:
+        return await sync_to_async(get_paused_shop_ids)(shared=True)
+    _local.update(ids=ids, expires_at=now + LOCAL_TIMEOUT)
+    return ids
+
+
+def invalidate():
+    cache.delete(PAUSED_SHOPS_KEY)
+    _local.update(ids=None, expires_at=0.0)
+
+
+def check_accepting_orders(shop_ids, shared=False):
+    paused = get_paused_shop_ids(shared=shared) & set(shop_ids)
+    if paused:
+        raise ShopsNotAcceptingOrders(paused)
+
+
+def set_accepts_orders(shop, accepts_orders):
+    """
+    Flip the toggle. The paused shops are invalidated by the Shop post_save signal after commit,
+    the catalog lists with the shop's goods are invalidated here.
+    """
+    with transaction.atomic():
+        shop.accepts_orders = accepts_orders
+        shop.save(update_fields=['accepts_orders', 'updated_at'])
+        bump_on_commit(shops=[shop.pk], categories=list(shop.categories.values_list('id', flat=True)))
@@ -0,0 +1,145 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.models import Category, Product, ProductInfo, ProductParameter, Shop
+from core.services import shop_state
+from core.services.catalog_cache import bump_on_commit
+from core.services.catalog_entries import in_batch_refresh, refresh_entries
+from core.services.product_search import update_search_vectors
+
+
+def _shops_of(product_ids):
+    return list(ProductInfo.objects.filter(product_id__in=product_ids).values_list('shop_id', flat=True).distinct())
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    # the offers and category links are gone by post_delete
+    instance._shop_ids = _shops_of([instance.pk])
+    instance._category_ids = list(instance.categories.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    if hasattr(instance, '_shop_ids'):
+        bump_on_commit(shops=instance._shop_ids, categories=instance._category_ids)
+    else:
+        bump_on_commit(shops=_shops_of([instance.pk]), categories=list(instance.categories.values_list('id', flat=True)))
+
+
+def _deleted_with(origin, *models):
+    if isinstance(origin, QuerySet):
+        return origin.model in models
+    return isinstance(origin, models)
+
+
+def _deleting_products(origin):
+    # rows deleted along with their product must not write the entry the product delete removed
+    return _deleted_with(origin, Product)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'model'} & set(update_fields):
+        update_search_vectors([instance.pk])
+    refresh_entries([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_changed(sender, instance, origin=None, **kwargs):
+    update_search_vectors([instance.product_id])
+    if not _deleting_products(origin):
+        refresh_entries([instance.product_id])
+
+
+def _offers_changed(shop_ids, product_ids):
+    bump_on_commit(
+        shops=shop_ids,
+        categories=list(Product.categories.through.objects.filter(product_id__in=product_ids)
+                        .values_list('category_id', flat=True).distinct()),
+    )
+    refresh_entries(product_ids)
+
+
+@receiver(pre_delete, sender=ProductInfo)
+def product_info_deleting(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet) and origin.model is ProductInfo and not in_batch_refresh():
+        # every offer of a queryset delete is collected before the first of them is deleted
+        shop_ids, product_ids = origin.__dict__.setdefault('_deleted_offers', (set(), set()))
+        shop_ids.add(instance.shop_id)
+        product_ids.add(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def product_info_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet) and origin.model is ProductInfo:
+        # post_delete is sent once all the offers are deleted: the first call refreshes them all,
+        # unless the caller declared it refreshes them itself, like the importer
+        deleted = origin.__dict__.pop('_deleted_offers', None)
+        if deleted is not None:
+            _offers_changed(*deleted)
+    elif origin is None or origin is instance or not _deleted_with(origin, Product, Shop):
+        # offers deleted along with their product or shop are bumped and refreshed once by their receivers
+        _offers_changed([instance.shop_id], [instance.product_id])
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # the product links are gone once the category is deleted
+    instance._product_ids = list(instance.products.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, created=False, **kwargs):
+    if created:
+        bump_on_commit(categories=[instance.pk])
+        return
+    # a renamed or deleted category changes the category names of its products, also on the lists of their shops
+    if hasattr(instance, '_product_ids'):
+        product_ids = instance._product_ids
+    else:
+        product_ids = list(instance.products.values_list('id', flat=True))
+    bump_on_commit(shops=_shops_of(product_ids), categories=[instance.pk])
+    refresh_entries(product_ids)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_entries(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_product_ids = list(instance.products.values_list('id', flat=True))
+    elif action == 'post_clear':
+        refresh_entries(instance._cleared_product_ids if reverse else [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        refresh_entries(pk_set if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    # the lists of the products' shops show their categories too
+    if reverse:
+        product_ids = instance.products.values('id') if action == 'pre_clear' else pk_set
+        bump_on_commit(shops=_shops_of(product_ids), categories=[instance.pk])
+    elif action == 'pre_clear':
+        bump_on_commit(shops=_shops_of([instance.pk]), categories=list(instance.categories.values_list('id', flat=True)))
+    else:
+        bump_on_commit(shops=_shops_of([instance.pk]), categories=list(pk_set))
+
+
+@receiver(pre_delete, sender=Shop)
+def shop_deleting(sender, instance, **kwargs):
+    # the offers and category links are gone by post_delete
+    instance._product_ids = list(ProductInfo.objects.filter(shop=instance).values_list('product_id', flat=True).distinct())
+    instance._category_ids = list(instance.categories.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def shop_changed(sender, instance, **kwargs):
+    # also covers the accepts_orders toggle changed in the admin
+    transaction.on_commit(shop_state.invalidate)
+    if hasattr(instance, '_product_ids'):
+        bump_on_commit(shops=[instance.pk], categories=instance._category_ids)
+        refresh_entries(instance._product_ids)
@@ -0,0 +1,146 @@
+"""
+Slow operations moved out of the request/response cycle.
+
+Task state can be polled at /api/tasks/<task_id>/ by the user who queued the task.
+Import reports its progress in the PROGRESS state after every saved batch.
+"""
+import tempfile
+from smtplib import SMTPException
+from urllib.error import URLError
+
+from celery import group, shared_task
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import OperationalError
+from django.template.loader import get_template, render_to_string
+
+from config.db_router import pin_primary, use_replica
+from core.models import Order, Shop
+from core.services.downloads import open_url
+from core.services.invoices import send_invoices
+from core.services.price_list_export import YAML, iter_export
+from core.services.price_list_import import DEFAULT_BATCH_SIZE, MISSING_ZERO, import_price_list
+
+PROGRESS = 'PROGRESS'
+
+URL_TIMEOUT = 60
+
+# orders notified by one task
+NOTIFICATION_CHUNK_SIZE = 500
+
+
+def _open_price_list(url, path):
+    if url:
+        return open_url(url, timeout=URL_TIMEOUT, max_size=settings.PRICE_LIST_MAX_SIZE)
+    return default_storage.open(path, 'rb')
+
+
+IMPORT_RETRY_FOR = (URLError, OperationalError)
+
+
+@shared_task(bind=True, autoretry_for=IMPORT_RETRY_FOR, retry_backoff=True, retry_backoff_max=600, max_retries=5)
+def import_price_list_task(self, user_id, url=None, path=None, incremental=False, missing=MISSING_ZERO,
+                           batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import a price list downloaded from `url` or uploaded to the default storage at `path`.
+    A batch is committed on its own, so a retried import picks up where the failed one stopped
+    and does not write the same goods twice in incremental mode.
+    """
+    user = get_user_model().objects.get(pk=user_id)
+
+    def progress(stats):
+        self.update_state(state=PROGRESS, meta={'goods': stats.goods, 'batches': stats.batches})
+
+    retried = False
+    try:
+        with _open_price_list(url, path) as stream:
+            stats = import_price_list(stream, batch_size=batch_size, incremental=incremental, missing=missing,
+                                      user=user, progress=progress)
+    except IMPORT_RETRY_FOR:
+        retried = self.request.retries < self.max_retries
+        raise
+    finally:
+        # the upload is kept only for a retry
+        if path and not retried:
+            default_storage.delete(path)
+    # the supplier reads the catalog next, and the replica may not have the import yet
+    pin_primary(user)
+    return {
+        'shop': stats.shop.name,
+        'goods': stats.goods,
+        'inserted': stats.inserted,
+        'updated': stats.updated,
+        'unchanged': stats.unchanged,
+        'removed': stats.removed,
+    }
+
+
+@shared_task(bind=True, autoretry_for=(OperationalError,), retry_backoff=True, max_retries=5)
+def export_price_list_task(self, shop_id, export_format=YAML):
+    """
+    Write the shop's price list to the default storage and return where it is.
+    """
+    shop = Shop.objects.get(pk=shop_id)
+    with tempfile.TemporaryFile() as export, use_replica():
+        for chunk in iter_export(shop, export_format):
+            export.write(chunk.encode())
+        export.seek(0)
+        path = default_storage.save(f'exports/shop-{shop.pk}-{self.request.id}.{export_format}', File(export))
+    return {'path': path, 'url': default_storage.url(path)}
+
+
+@shared_task(autoretry_for=(SMTPException, OSError), retry_backoff=True, max_retries=5)
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').get(pk=order_id)
+    items = list(order.ordered_items.select_related('product_info__product', 'product_info__shop').order_by('id'))
+    message = render_to_string('core/email/order_confirmation.txt', {
+        'order': order,
+        'items': items,
+        'total': sum(item.price * item.quantity for item in items),
+    })
+    send_mail(f'Order #{order.number} accepted', message, None, [order.user.email])
+
+
+@shared_task(bind=True, max_retries=5)
+def send_status_notifications(self, order_ids):
+    """
+    Tell the clients the new status of their orders, over one SMTP connection.
+    When sending fails, only the orders not notified yet are retried.
+    """
+    template = get_template('core/email/order_status.txt')
+    orders = list(Order.objects.filter(pk__in=order_ids).select_related('user').order_by('pk'))
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for order in orders:
+                connection.send_messages([EmailMessage(
+                    f'Order #{order.number}: {order.get_status_display().lower()}',
+                    template.render({'order': order}), to=[order.user.email],
+                )])
+                sent += 1
+    except (SMTPException, OSError) as exc:
+        countdown = get_exponential_backoff_interval(factor=1, retries=self.request.retries, maximum=600,
+                                                     full_jitter=True)
+        raise self.retry(args=[[order.pk for order in orders[sent:]]], exc=exc, countdown=countdown)
+
+
+def queue_status_notifications(order_ids):
+    """
+    Queue the notifications of many orders at once, NOTIFICATION_CHUNK_SIZE orders per task.
+    """
+    chunks = [order_ids[i:i + NOTIFICATION_CHUNK_SIZE] for i in range(0, len(order_ids), NOTIFICATION_CHUNK_SIZE)]
+    if chunks:
+        group(send_status_notifications.s(chunk) for chunk in chunks).apply_async()
+
+
+@shared_task(autoretry_for=(SMTPException, OSError), retry_backoff=True, max_retries=5)
+def send_invoices_task(order_ids=None):
+    """
+    Send the invoices of the orders not invoiced yet, e.g. every morning from celery beat or cron.
+    """
+    stats = send_invoices(order_ids)
+    return {'orders': stats.orders, 'invoices': stats.invoices}
@@ -1,21 +1,65 @@
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
 from decimal import Decimal
+from smtplib import SMTPException
+from unittest import mock
+from urllib.error import URLError
 
+import yaml
+from asgiref.sync import sync_to_async
+from celery.exceptions import Retry
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, router, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import resolve
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from core.models import Product, ShoppingBasket, Category, Shop, ProductInfo, ItemInShoppingBasket
-from core.serializers.products import ProductSerializer
-from core.views import ProductsView, BasketView
+from config.db_router import iter_replica, use_primary, use_replica
+from core import instrumentation, tasks
+from core.benchmarks import api as api_benchmarks, data as benchmark_data
+from core.benchmarks.checkout import checkout_concurrently, create_buyers
+from core.models import Product, ShoppingBasket, Category, Shop, ProductInfo, ItemInShoppingBasket, ProductParameter, \
+    Order, ItemInOrder, Parameter, ParameterFacet, ProductCatalogEntry
+from core.serializers.fast import BASKET_ITEM_FIELDS, CATALOG_ENTRY_FIELDS, PRODUCT_FIELDS, serialize_basket, \
+    serialize_products
+from core.serializers.products import PREFETCH_CATEGORIES, ProductSerializer
+from core.serializers.shopping_basket import BasketSerializer
+from core.services import basket, basket_optimizer, catalog_cache, catalog_entries, downloads, invoices, shop_state
+from core.services.checkout import place_order
+from core.services.facets import refresh_facets
+from core.services.price_list_export import JSONL, iter_export, iter_yaml
+from core.services.price_list_import import import_price_list
+from core.services.product_search import trigram_available
+from core.views import ProductsView, BasketView, OrderView
 
 User = get_user_model()
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class TestListProductsView(TestCase):
     def setUp(self):
         self.endpoint_url = '/api/products/'
         self.client = APIClient()
+        cache.clear()
+        # load the paused shops up front, so query counts do not depend on a cold cache
+        shop_state.get_paused_shop_ids(shared=True)
 
     def test_route_resolves_to_correct_view(self):
         found = resolve(self.endpoint_url)
@@ -59,10 +103,551 @@ class TestListProductsView(TestCase):
         response = self.client.get(self.endpoint_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        response_data = {p['id']: p for p in response.json()}
+        response_data = {p['id']: p for p in response.json()['results']}
         self.assertEqual(len(response_data), 2)
         self.assertEqual(response_data, expected_data)
 
+    def test_query_count_does_not_depend_on_products_count(self):
+        categories = [Category.objects.create(name=f'category_{i}') for i in range(3)]
+        user = User.objects.create(username='john.doe')
+        self.client.force_login(user)
+
+        for products_count in (2, 20):
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(Product.objects.count(), products_count):
+                    product = Product.objects.create(name=f'product_{i}', price_rrc=Decimal('100.00'))
+                    product.categories.set(categories[:i % 4])
+            with self.assertNumQueries(3):
+                response = self.client.get(self.endpoint_url)
+            self.assertEqual(len(response.json()['results']), products_count)
+
+    def test_pages_follow_name_and_id_order(self):
+        products = [
+            Product.objects.create(name=f'product_{i % 3}', model=f'model_{i}', price_rrc=Decimal('100.00'))
+            for i in range(7)
+        ]
+        user = User.objects.create(username='john.doe')
+        self.client.force_login(user)
+
+        ids = []
+        url = f'{self.endpoint_url}?limit=3'
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertLessEqual(len(response.json()['results']), 3)
+            ids.extend(p['id'] for p in response.json()['results'])
+            url = response.json()['next']
+
+        self.assertEqual(ids, [p.id for p in sorted(products, key=lambda p: (p.name, p.id))])
+
+    def test_invalid_cursor_returns_404(self):
+        self.client.force_login(User.objects.create(username='john.doe'))
+        response = self.client.get(f'{self.endpoint_url}?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_products_are_filtered_by_offers_and_category(self):
+        tv = Category.objects.create(name='TV')
+        eldorado = Shop.objects.create(name='Eldorado')
+        mvideo = Shop.objects.create(name='MVideo')
+        cheap = Product.objects.create(name='cheap', price_rrc=Decimal('100.00'))
+        cheap.categories.add(tv)
+        expensive = Product.objects.create(name='expensive', price_rrc=Decimal('900.00'))
+        sold_out = Product.objects.create(name='sold out', price_rrc=Decimal('500.00'))
+        ProductInfo.objects.create(shop=eldorado, product=cheap, external_id=1, price=Decimal('90.00'), quantity=3)
+        ProductInfo.objects.create(shop=mvideo, product=expensive, external_id=2, price=Decimal('950.00'), quantity=1)
+        ProductInfo.objects.create(shop=eldorado, product=sold_out, external_id=3, price=Decimal('450.00'), quantity=0)
+        self.client.force_login(User.objects.create(username='john.doe'))
+
+        cases = [
+            ({'category': tv.id}, {cheap.id}),
+            ({'shop': eldorado.id}, {cheap.id, sold_out.id}),
+            ({'price_min': '100', 'price_max': '1000'}, {expensive.id, sold_out.id}),
+            ({'in_stock': 'true'}, {cheap.id, expensive.id}),
+            ({'shop': eldorado.id, 'in_stock': 'true'}, {cheap.id}),
+        ]
+        for params, expected_ids in cases:
+            with self.subTest(params=params):
+                response = self.client.get(self.endpoint_url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual({p['id'] for p in response.json()['results']}, expected_ids)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestParameterFacets(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/products/'
+        self.client = APIClient()
+        self.client.force_login(User.objects.create(username='john.doe'))
+        cache.clear()
+        with open(settings.BASE_DIR / 'data' / 'shop1.yaml', 'rb') as stream:
+            import_price_list(stream)
+        self.color = Parameter.objects.get(name='Цвет').id
+        self.memory = Parameter.objects.get(name='Встроенная память (Гб)').id
+
+    def get(self, params):
+        response = self.client.get(self.endpoint_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_products_are_filtered_by_parameter_values(self):
+        cases = [
+            ([f'{self.color}:черный'], {'Смартфон Apple iPhone XR 256GB (черный)'}),
+            ([f'{self.color}:черный', f'{self.color}:синий'],
+             {'Смартфон Apple iPhone XR 256GB (черный)', 'Смартфон Apple iPhone XR 128GB (синий)'}),
+            ([f'{self.color}:черный', f'{self.color}:золотистый', f'{self.memory}:512'],
+             {'Смартфон Apple iPhone XS Max 512GB (золотистый)'}),
+            ([f'{self.color}:белый'], set()),
+        ]
+        for param, expected_names in cases:
+            with self.subTest(param=param):
+                data = self.get({'param': param})
+                self.assertEqual({product['name'] for product in data['results']}, expected_names)
+
+    def test_malformed_parameter_filter_returns_400(self):
+        response = self.client.get(self.endpoint_url, {'param': 'color=black'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_catalog_facets_are_read_from_materialized_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            facets = self.get({'facets': 'true'})['facets']
+
+        memory = next(facet for facet in facets if facet['parameter'] == self.memory)
+        self.assertEqual(memory['values'], [{'value': '256', 'count': 3}, {'value': '512', 'count': 1}])
+        self.assertFalse(any('core_productparameter' in query['sql'] for query in queries))
+
+    def test_facets_are_counted_over_filtered_products(self):
+        facets = self.get({'facets': 'true', 'param': f'{self.memory}:256'})['facets']
+
+        color = next(facet for facet in facets if facet['parameter'] == self.color)
+        self.assertEqual(color['values'], [{'value': 'красный', 'count': 1}, {'value': 'синий', 'count': 1},
+                                           {'value': 'черный', 'count': 1}])
+
+    def test_facets_skip_products_of_paused_shops(self):
+        shop = Shop.objects.create(name='Eldorado')
+        product = Product.objects.create(name='Paused phone', price_rrc=Decimal('100.00'))
+        ProductParameter.objects.create(product=product, parameter_id=self.memory, value='1024')
+        ProductInfo.objects.create(shop=shop, product=product, external_id=1, price=Decimal('90.00'), quantity=1)
+        refresh_facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            shop_state.set_accepts_orders(shop, False)
+
+        data = self.get({'facets': 'true'})
+        self.assertNotIn(product.id, [p['id'] for p in data['results']])
+        memory = next(facet for facet in data['facets'] if facet['parameter'] == self.memory)
+        self.assertEqual(memory['values'], [{'value': '256', 'count': 3}, {'value': '512', 'count': 1}])
+
+    def test_facets_are_refreshed_after_import(self):
+        goods = make_goods(3)
+        for good in goods:
+            good['parameters'] = {'Цвет': 'черный'}
+        import_price_list(make_price_list(goods=goods))
+
+        self.assertEqual(ParameterFacet.objects.get(parameter_id=self.color, value='черный').product_count, 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestProductCatalogEntries(TestCase):
+    def entry(self, product):
+        return ProductCatalogEntry.objects.get(product=product)
+
+    def test_entries_follow_orm_changes(self):
+        tv = Category.objects.create(name='TV')
+        audio = Category.objects.create(name='Audio')
+        shop = Shop.objects.create(name='Eldorado')
+        product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        product.categories.set([tv, audio])
+        ProductParameter.objects.create(product=product, parameter=Parameter.objects.create(name='Color'), value='black')
+        offer = ProductInfo.objects.create(shop=shop, product=product, external_id=1, price=Decimal('90.00'), quantity=3)
+        ProductInfo.objects.create(shop=shop, product=product, external_id=2, price=Decimal('80.00'), quantity=0)
+
+        entry = self.entry(product)
+        self.assertEqual(entry.categories, ['Audio', 'TV'])
+        self.assertEqual(entry.parameters, {str(Parameter.objects.get().pk): 'black'})
+        self.assertEqual((entry.min_price, entry.max_price, entry.total_stock), (Decimal('80.00'), Decimal('90.00'), 3))
+        self.assertEqual((entry.shop_ids, entry.shop_count), ([shop.pk], 1))
+
+        tv.name = 'Televisions'
+        tv.save()
+        audio.delete()
+        offer.delete()
+        entry = self.entry(product)
+        self.assertEqual(entry.categories, ['Televisions'])
+        self.assertEqual((entry.min_price, entry.total_stock), (Decimal('80.00'), 0))
+
+        product.delete()
+        connection.check_constraints()
+        self.assertFalse(ProductCatalogEntry.objects.exists())
+
+    def test_shop_delete_refreshes_entries_once(self):
+        few = import_price_list(make_price_list(2, shop='Few')).shop
+        many = import_price_list(make_price_list(20, shop='Many')).shop
+        with CaptureQueriesContext(connection) as queries:
+            few.delete()
+
+        with self.assertNumQueries(len(queries)):
+            many.delete()
+
+        self.assertFalse(ProductCatalogEntry.objects.filter(shop_count__gt=0).exists())
+
+    def test_queryset_delete_of_offers_refreshes_entries_once(self):
+        few = import_price_list(make_price_list(2, shop='Few')).shop
+        many = import_price_list(make_price_list(20, shop='Many')).shop
+        self.assertEqual(ProductCatalogEntry.objects.filter(shop_count=2).count(), 2)
+        with CaptureQueriesContext(connection) as queries:
+            ProductInfo.objects.filter(shop=few).delete()
+        self.assertEqual(ProductCatalogEntry.objects.filter(shop_count=2).count(), 0)
+
+        with self.assertNumQueries(len(queries)):
+            ProductInfo.objects.filter(shop=many).delete()
+
+        self.assertFalse(ProductCatalogEntry.objects.filter(shop_count__gt=0).exists())
+
+    def test_import_and_checkout_refresh_entries(self):
+        stats = import_price_list(make_price_list(3))
+        product_info = ProductInfo.objects.filter(shop=stats.shop).order_by('-quantity').first()
+        self.assertEqual(self.entry(product_info.product_id).total_stock, product_info.quantity)
+
+        user = User.objects.create(username='john.doe')
+        ItemInShoppingBasket.objects.create(
+            shopping_basket=ShoppingBasket.objects.create(user=user), product_info=product_info,
+            shop=stats.shop, quantity=1,
+        )
+        place_order(user)
+        self.assertEqual(self.entry(product_info.product_id).total_stock, product_info.quantity - 1)
+
+        # the only good left has no stock, the missing ones are zeroed out
+        import_price_list(make_price_list(1), incremental=True)
+        self.assertFalse(ProductCatalogEntry.objects.filter(total_stock__gt=0).exists())
+
+    def test_entries_give_the_same_products_as_the_normalized_tables(self):
+        with open(settings.BASE_DIR / 'data' / 'shop1.yaml', 'rb') as stream:
+            first = import_price_list(stream).shop
+        second = import_price_list(make_price_list(4)).shop
+        color = Parameter.objects.get(name='Цвет').id
+        tv = Category.objects.get(name='TV').id
+        cases = [
+            {},
+            {'category': tv},
+            {'shop': first.id},
+            {'price_min': Decimal('1000.00')},
+            {'price_max': Decimal('1000.00')},
+            {'in_stock': True},
+            {'parameters': {color: ['черный', 'синий']}},
+            {'category': tv, 'exclude_shops': {second.id}},
+        ]
+        for params in cases:
+            with self.subTest(params=params):
+                self.assertTrue(catalog_entries.can_filter(**params))
+                self.assertEqual(
+                    set(ProductCatalogEntry.objects.filter_catalog(**params).values_list('pk', flat=True)),
+                    set(Product.objects.filter_catalog(**params).values_list('pk', flat=True)),
+                )
+        self.assertFalse(catalog_entries.can_filter(shop=first.id, in_stock=True))
+        self.assertFalse(catalog_entries.can_filter(in_stock=True, exclude_shops={second.id}))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCatalogCache(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/products/'
+        self.client = APIClient()
+        self.client.force_login(User.objects.create(username='john.doe'))
+        cache.clear()
+
+    def test_cached_response_is_served_without_catalog_queries(self):
+        Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        first = self.client.get(self.endpoint_url)
+
+        with self.assertNumQueries(2):
+            second = self.client.get(self.endpoint_url)
+
+        self.assertEqual(first.json(), second.json())
+
+    def test_product_change_invalidates_cached_lists(self):
+        self.client.get(self.endpoint_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+
+        response = self.client.get(self.endpoint_url)
+        self.assertEqual([p['id'] for p in response.json()['results']], [product.id])
+
+    def test_deleted_product_leaves_the_lists_of_its_categories_and_shops(self):
+        tv = Category.objects.create(name='TV')
+        shop = Shop.objects.create(name='Eldorado')
+        product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        product.categories.add(tv)
+        ProductInfo.objects.create(shop=shop, product=product, external_id=1, price=Decimal('90.00'), quantity=3)
+        urls = [f'{self.endpoint_url}?category={tv.id}', f'{self.endpoint_url}?shop={shop.id}']
+        for url in urls:
+            self.assertEqual(len(self.client.get(url).json()['results']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+
+        for url in urls:
+            self.assertEqual(self.client.get(url).json()['results'], [], url)
+
+    def test_category_changes_invalidate_the_lists_of_the_shops(self):
+        tv = Category.objects.create(name='TV')
+        audio = Category.objects.create(name='Audio')
+        shop = Shop.objects.create(name='Eldorado')
+        product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        product.categories.add(tv)
+        ProductInfo.objects.create(shop=shop, product=product, external_id=1, price=Decimal('90.00'), quantity=3)
+        url = f'{self.endpoint_url}?shop={shop.id}'
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tv.name = 'Televisions'
+            tv.save()
+        self.assertEqual(self.client.get(url).json()['results'][0]['categories'], ['Televisions'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.categories.add(audio)
+        self.assertEqual(self.client.get(url).json()['results'][0]['categories'], ['Audio', 'Televisions'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            audio.products.clear()
+        self.assertEqual(self.client.get(url).json()['results'][0]['categories'], ['Televisions'])
+
+    def test_import_invalidates_lists_of_the_shop(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = import_price_list(make_price_list(3))
+        other_shop = Shop.objects.create(name='Other')
+        url = f'{self.endpoint_url}?shop={stats.shop.id}&price_max=1001'
+        other_url = f'{self.endpoint_url}?shop={other_shop.id}'
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+        self.client.get(other_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(make_price_list(3, price=500), incremental=True)
+
+        self.assertEqual(len(self.client.get(url).json()['results']), 3)
+        with self.assertNumQueries(2):
+            self.client.get(other_url)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        instrumentation.stats.reset()
+        cache.clear()
+
+    def test_stats_are_admin_only(self):
+        self.client.force_login(User.objects.create(username='john.doe'))
+        self.assertEqual(self.client.get('/api/stats/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_requests_are_aggregated_per_url_name(self):
+        Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        self.client.force_login(User.objects.create(username='john.doe'))
+        for _ in range(3):
+            cache.clear()
+            self.client.get('/api/products/')
+        self.client.force_login(User.objects.create(username='admin', email='admin@nyan.local', is_staff=True))
+
+        data = self.client.get('/api/stats/').json()
+
+        products = data['endpoints']['products']
+        self.assertEqual((products['requests'], products['n_plus_one']), (3, 0))
+        self.assertEqual(set(products['latency_ms']), {'p50', 'p95', 'p99'})
+        self.assertGreater(products['queries']['p50'], 0)
+        self.assertGreater(products['serializer_ms']['p99'], 0)
+        self.assertLessEqual(products['latency_ms']['p50'], products['latency_ms']['p99'])
+
+    def test_repeated_statements_are_flagged_as_n_plus_one(self):
+        products = [Product.objects.create(name=f'product_{i}', price_rrc=Decimal('100.00')) for i in range(12)]
+
+        def get_response(request):
+            for product in products:
+                list(product.categories.all())
+            return HttpResponse()
+
+        request = RequestFactory().get('/api/products/')
+        request.resolver_match = resolve('/api/products/')
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            instrumentation.InstrumentationMiddleware(get_response)(request)
+
+        self.assertIn('N+1 queries in products: 12 x', logs.output[0])
+        stats = instrumentation.stats.snapshot()['endpoints']['products']
+        self.assertEqual(stats['n_plus_one'], 1)
+        self.assertEqual(stats['queries']['p50'], 12)
+
+    def test_statement_shape_ignores_values_and_list_lengths(self):
+        self.assertEqual(
+            instrumentation.statement_shape('SELECT 1 FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            instrumentation.statement_shape('SELECT 1 FROM t WHERE id IN (%s) LIMIT 5'),
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestAsyncViews(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username='john.doe', email='john.doe@mail.local')
+        self.client = AsyncClient()
+        # the async client of this Django version takes headers per request
+        self.headers = {'authorization': f'Token {Token.objects.create(user=user).key}'}
+        shops = [Shop.objects.create(name=name) for name in ('Eldorado', 'MVideo')]
+        category = Category.objects.create(name='TVs')
+        parameter = Parameter.objects.create(name='Color')
+        self.products = []
+        for i in range(5):
+            product = Product.objects.create(name=f'product {i}', price_rrc=Decimal('100.00'))
+            product.categories.add(category)
+            ProductParameter.objects.create(product=product, parameter=parameter, value=['black', 'white'][i % 2])
+            for shop in shops[:i % 2 + 1]:
+                ProductInfo.objects.create(shop=shop, product=product, external_id=i, price=Decimal(90 + i),
+                                           quantity=i)
+            self.products.append(product)
+        basket = ShoppingBasket.objects.create(user=user)
+        for product_info in ProductInfo.objects.filter(quantity__gt=0)[:3]:
+            ItemInShoppingBasket.objects.create(shopping_basket=basket, product_info=product_info,
+                                                shop_id=product_info.shop_id, quantity=2)
+        self.category = category
+
+    async def request(self, url, data, method):
+        if method == 'post':
+            return await self.client.post(url, data, content_type='application/json', **self.headers)
+        return await self.client.get(url, data, **self.headers)
+
+    async def assertSameResponse(self, sync_url, async_url, data=None, method='get'):
+        sync_response = await self.request(sync_url, data, method)
+        async_response = await self.request(async_url, data, method)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # next page links point to the view that served the page
+        self.assertEqual(json.loads(async_response.content.replace(b'/api/async/', b'/api/')), sync_response.json())
+        return async_response
+
+    async def test_catalog_matches_sync_view(self):
+        for params in [{}, {'facets': 'true'}, {'category': self.category.pk, 'facets': 'true', 'limit': 2},
+                       {'in_stock': 'true', 'price_max': 92}, {'cursor': 'broken'}, {'limit': 'x', 'shop': 'x'}]:
+            with self.subTest(params=params):
+                await self.assertSameResponse('/api/products/', '/api/async/products/', params)
+
+
+    async def test_catalog_facets_skip_products_of_paused_shops(self):
+        # products 0, 2 and 4 are black and offered by Eldorado only
+        await sync_to_async(refresh_facets)()
+        await sync_to_async(shop_state.set_accepts_orders)(await Shop.objects.aget(name='Eldorado'), False)
+
+        response = await self.assertSameResponse('/api/products/', '/api/async/products/', {'facets': 'true'})
+        facet, = json.loads(response.content)['facets']
+        self.assertEqual(facet['values'], [{'value': 'white', 'count': 2}])
+    async def test_offers_and_basket_match_sync_views(self):
+        product = self.products[3]
+        response = await self.assertSameResponse(f'/api/products/{product.pk}/offers/',
+                                                 f'/api/async/products/{product.pk}/offers/')
+        self.assertEqual(len(response.json()['offers']), 2)
+        response = await self.assertSameResponse('/api/products/1000000/offers/',
+                                                 '/api/async/products/1000000/offers/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        ids = [product.pk for product in self.products]
+        await self.assertSameResponse('/api/products/offers/', '/api/async/products/offers/',
+                                      {'products': ids}, method='post')
+        response = await self.assertSameResponse('/api/products/offers/', '/api/async/products/offers/',
+                                                 {'products': []}, method='post')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.assertSameResponse('/api/basket/', '/api/async/basket/')
+        self.assertEqual(len(response.json()['items']), 3)
+
+    async def test_requires_authentication(self):
+        for headers in ({}, {'authorization': 'Token unknown'}):
+            response = await self.client.get('/api/async/products/', **headers)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = await self.client.post('/api/async/basket/', **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_queries_of_worker_threads_are_instrumented(self):
+        instrumentation.stats.reset()
+
+        await self.request('/api/async/products/', {'facets': 'true', 'category': self.category.pk}, 'get')
+
+        endpoint = instrumentation.stats.snapshot()['endpoints']['async-products']
+        self.assertEqual(endpoint['requests'], 1)
+        # token, paused shops, page and facets
+        self.assertGreaterEqual(endpoint['queries']['p50'], 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestReplicaRouting(TransactionTestCase):
+    # the replica is a test mirror of the primary: a second connection to the same database
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='buyer', email='buyer@mail.local')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shop = Shop.objects.create(name='Eldorado')
+        product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        self.product_info = ProductInfo.objects.create(shop=self.shop, product=product, external_id=1,
+                                                       price=Decimal('90.00'), quantity=5)
+        basket = ShoppingBasket.objects.create(user=self.user)
+        ItemInShoppingBasket.objects.create(shopping_basket=basket, product_info=self.product_info, shop=self.shop,
+                                            quantity=1)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_catalog_reads_go_to_the_replica(self):
+        urls = ['/api/products/', '/api/products/search/?q=TV', f'/api/products/{self.product_info.product_id}/offers/']
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                primary, replica = self.get(url)
+                self.assertTrue(replica)
+                self.assertFalse([sql for sql in primary if 'core_product' in sql])
+
+    def test_lists_are_computed_from_the_primary_right_after_a_change(self):
+        catalog_cache.bump()
+
+        _, replica = self.get('/api/products/')
+
+        self.assertEqual(replica, [])
+
+    def test_basket_reads_stay_on_the_primary(self):
+        primary, replica = self.get('/api/basket/')
+
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+
+    def test_reads_in_transactions_and_pinned_users_stay_on_the_primary(self):
+        with use_replica():
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Product), 'default')
+            with use_primary():
+                self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertEqual(router.db_for_write(Product), 'default')
+
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # as if the replica caught up, so pages of other users are computed from it again
+        cache.delete(catalog_cache.CHANGED_KEY)
+
+        # the buyer sees the stock left after the order
+        primary, replica = self.get('/api/products/', in_stock='true')
+        self.assertEqual(replica, [])
+        self.assertTrue([sql for sql in primary if 'core_product' in sql])
+        self.client.force_authenticate(User.objects.create(username='other', email='other@mail.local'))
+        _, replica = self.get('/api/products/', in_stock='true', limit=10)
+        self.assertTrue(replica)
+
+    def test_streamed_export_reads_from_the_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            lines = list(iter_replica(iter_export(self.shop, JSONL)))
+
+        self.assertEqual(len(lines), 1)
+        self.assertTrue([q for q in replica if 'core_productinfo' in q['sql']])
+
 
 class TestProductSerializer(TestCase):
     def test_all_data(self):
@@ -78,6 +663,157 @@ class TestProductSerializer(TestCase):
         self.assertEqual(serializer.data['price_rrc'], str(product.price_rrc))
 
 
+class TestFastSerializers(TestCase):
+    def test_products_are_rendered_like_product_serializer(self):
+        # mixed case and Cyrillic names, whose order depends on the collation
+        names = ('TV', 'audio', 'Sale', 'Телевизоры', 'аудио', 'Ёлки')
+        categories = [Category.objects.create(name=name) for name in names]
+        for i in range(7):
+            product = Product.objects.create(name=f'product_{i}', model=f'model_{i}', price_rrc=Decimal(f'{i}99.5'))
+            product.categories.set(categories[:i])
+        queryset = Product.objects.order_by('id')
+
+        expected = JSONRenderer().render(
+            ProductSerializer(queryset.prefetch_related(PREFETCH_CATEGORIES), many=True).data,
+        )
+
+        self.assertEqual(JSONRenderer().render(serialize_products(queryset.values(*PRODUCT_FIELDS))), expected)
+        entries = ProductCatalogEntry.objects.order_by('product_id').values(*CATALOG_ENTRY_FIELDS, id=F('product_id'))
+        self.assertEqual(JSONRenderer().render(serialize_products(entries)), expected)
+        self.assertEqual(ProductSerializer(queryset.last()).data['categories'],
+                         list(Category.objects.order_by('name').values_list('name', flat=True)))
+
+    def test_basket_is_rendered_like_basket_serializer(self):
+        user = User.objects.create(email='buyer@mail.local')
+        shopping_basket = ShoppingBasket.objects.create(user=user)
+        shop = Shop.objects.create(name='Eldorado')
+        for i in range(3):
+            product = Product.objects.create(name=f'product_{i}', price_rrc=Decimal('100.00'))
+            product_info = ProductInfo.objects.create(shop=shop, product=product, external_id=i,
+                                                      price=Decimal('10.50') * (i + 1), quantity=10)
+            ItemInShoppingBasket.objects.create(shopping_basket=shopping_basket, product_info=product_info,
+                                                shop=shop, quantity=i + 1)
+        items = ItemInShoppingBasket.objects.filter(shopping_basket=shopping_basket).with_totals().order_by('id')
+
+        expected = JSONRenderer().render(BasketSerializer(shopping_basket).data)
+
+        self.assertEqual(JSONRenderer().render(serialize_basket(items.values_list(*BASKET_ITEM_FIELDS))), expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestProductSearch(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/products/search/'
+        self.client = APIClient()
+        self.client.force_login(User.objects.create(username='john.doe'))
+        with open(settings.BASE_DIR / 'data' / 'shop1.yaml', 'rb') as stream:
+            import_price_list(stream)
+
+    def search(self, text):
+        response = self.client.get(self.endpoint_url, {'q': text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_name_words_are_matched_by_stem(self):
+        self.assertEqual(len(self.search('смартфоны apple')), 4)
+        self.assertEqual(self.search('iphone xs'), ['Смартфон Apple iPhone XS Max 512GB (золотистый)'])
+
+    def test_parameter_values_are_searched(self):
+        Product.objects.filter(name__contains='красный').update(name='Смартфон Apple iPhone XR 256GB')
+        product = Product.objects.get(name='Смартфон Apple iPhone XR 256GB')
+        product.save()
+
+        self.assertEqual(self.search('красный'), ['Смартфон Apple iPhone XR 256GB'])
+
+    def test_name_matches_rank_above_parameter_matches(self):
+        product = Product.objects.get(name__contains='черный')
+        ProductParameter.objects.filter(product=product, parameter__name='Цвет').update(value='синий')
+        ProductParameter.objects.get(product=product, parameter__name='Цвет').save()
+
+        self.assertEqual(self.search('синий'), [
+            'Смартфон Apple iPhone XR 128GB (синий)', 'Смартфон Apple iPhone XR 256GB (черный)',
+        ])
+
+    def test_search_vector_follows_renames(self):
+        product = Product.objects.get(name__contains='синий')
+        product.name = 'Смартфон Apple iPhone XR 128GB (голубой)'
+        product.save()
+
+        self.assertEqual(self.search('голубой'), ['Смартфон Apple iPhone XR 128GB (голубой)'])
+
+    def test_typos_are_matched_by_trigrams(self):
+        if not trigram_available():
+            self.skipTest('pg_trgm is not installed')
+        self.assertIn('Смартфон Apple iPhone XS Max 512GB (золотистый)', self.search('iphnoe'))
+
+    def test_unknown_words_return_nothing(self):
+        self.assertEqual(self.search('холодильник'), [])
+
+    def test_products_of_paused_shops_are_hidden(self):
+        paused = Shop.objects.create(name='Eldorado')
+        product = Product.objects.get(name__contains='золотистый')
+        ProductInfo.objects.filter(product=product).update(shop=paused)
+        with self.captureOnCommitCallbacks(execute=True):
+            shop_state.set_accepts_orders(paused, False)
+
+        self.assertEqual(self.search('iphone xs'), [])
+        self.assertEqual(len(self.search('смартфоны apple')), 3)
+
+    def test_query_is_required(self):
+        response = self.client.get(self.endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestProductOffers(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_login(User.objects.create(username='john.doe'))
+        self.shops = [Shop.objects.create(name=name) for name in ('Eldorado', 'MVideo', 'DNS')]
+
+    def create_product(self, prices):
+        product = Product.objects.create(name=f'product {Product.objects.count()}', price_rrc=Decimal('100.00'))
+        for shop, (price, quantity) in zip(self.shops, prices):
+            ProductInfo.objects.create(shop=shop, product=product, external_id=product.id, price=Decimal(price),
+                                       quantity=quantity)
+        return product
+
+    def test_offers_are_sorted_by_price_without_sold_out_ones(self):
+        product = self.create_product([('120.00', 1), ('90.00', 5), ('80.00', 0)])
+
+        response = self.client.get(f'/api/products/{product.id}/offers/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual([offer['shop']['name'] for offer in data['offers']], ['MVideo', 'Eldorado'])
+        self.assertEqual(data['best'], {
+            'id': ProductInfo.objects.get(product=product, shop=self.shops[1]).id,
+            'shop': {'id': self.shops[1].id, 'name': 'MVideo'},
+            'price': '90.00',
+            'quantity': 5,
+        })
+
+    def test_unknown_product_returns_404(self):
+        response = self.client.get('/api/products/1000000/offers/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_batch_is_read_with_one_query(self):
+        products = [self.create_product([('100.00', 1), (f'{50 + i}.00', 2)]) for i in range(20)]
+        sold_out = self.create_product([('100.00', 0)])
+        ids = [product.id for product in reversed(products)] + [sold_out.id]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/products/offers/', {'products': ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in queries if 'core_productinfo' in q['sql']]), 1)
+        data = response.json()
+        self.assertEqual([item['product'] for item in data], ids)
+        self.assertEqual(data[0]['best']['price'], '69.00')
+        self.assertEqual(len(data[0]['offers']), 2)
+        self.assertEqual(data[-1], {'product': sold_out.id, 'best': None, 'offers': []})
+
+
 class TestBasketView(TestCase):
     def setUp(self):
         self.endpoint_url = '/api/basket/'
@@ -95,7 +831,7 @@ class TestBasketView(TestCase):
         self.client.force_login(self.user)
         expected_data = {'items': [], 'total_quantity': 0, 'total_price': '0.00'}
 
-        with self.assertNumQueries(4):
+        with self.assertNumQueries(3):
             response = self.client.get(self.endpoint_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -126,8 +862,1042 @@ class TestBasketView(TestCase):
             'total_price': '1300.00'
         }
 
-        # with self.assertNumQueries(6):
-        response = self.client.get(self.endpoint_url)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.endpoint_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertDictEqual(response.json(), expected_data)
+
+    def test_user_without_basket_gets_empty_basket(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(self.endpoint_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual(response.json(), {'items': [], 'total_quantity': 0, 'total_price': '0.00'})
+
+    def test_totals_are_computed_in_one_query(self):
+        self.client.force_login(self.user)
+        shopping_basket = ShoppingBasket.objects.create(user=self.user)
+        shops = [Shop.objects.create(name=f'shop_{i}') for i in range(3)]
+        for i in range(12):
+            product = Product.objects.create(name=f'product_{i}', price_rrc=Decimal('100.00'))
+            product_info = ProductInfo.objects.create(shop=shops[i % 3], product=product, external_id=i,
+                                                      price=Decimal('10.25') + i, quantity=100)
+            ItemInShoppingBasket.objects.create(shopping_basket=shopping_basket, product_info=product_info,
+                                                shop=shops[i % 3], quantity=i + 1)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(self.endpoint_url)
+
+        data = response.json()
+        self.assertEqual(len(data['items']), 12)
+        self.assertEqual(data['total_quantity'], sum(range(1, 13)))
+        self.assertEqual(data['total_price'], '{:.2f}'.format(sum((Decimal('10.25') + i) * (i + 1) for i in range(12))))
+        self.assertEqual(data['items'][1]['total_price'], '22.50')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestBasketMutations(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/basket/'
+        self.user = User.objects.create(email='buyer@mail.local')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        shop = Shop.objects.create(name='Eldorado')
+        self.product_infos = []
+        for i in range(50):
+            product = Product.objects.create(name=f'product_{i}', price_rrc=Decimal('100.00'))
+            self.product_infos.append(ProductInfo.objects.create(shop=shop, product=product, external_id=i,
+                                                                 price=Decimal('10.00'), quantity=100))
+        # load the paused shops up front, so query counts do not depend on a cold cache
+        shop_state.get_paused_shop_ids(shared=True)
+
+    def basket_quantities(self):
+        return dict(ItemInShoppingBasket.objects.filter(shopping_basket__user=self.user)
+                    .values_list('product_info_id', 'quantity'))
+
+    def test_add_creates_basket_and_increments_quantities(self):
+        first, second = self.product_infos[:2]
+
+        response = self.client.post(self.endpoint_url, {'items': [
+            {'product_info': first.id, 'quantity': 1},
+            {'product_info': first.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(self.endpoint_url, {'items': [
+            {'product_info': first.id, 'quantity': 1},
+            {'product_info': second.id, 'quantity': 5},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['total_quantity'], 9)
+        self.assertEqual(self.basket_quantities(), {first.id: 4, second.id: 5})
+
+    def test_put_sets_quantities_and_delete_removes_lines(self):
+        first, second, third = self.product_infos[:3]
+        self.client.post(self.endpoint_url, {'items': [
+            {'product_info': first.id, 'quantity': 3},
+            {'product_info': second.id, 'quantity': 3},
+        ]}, format='json')
+
+        self.client.put(self.endpoint_url, {'items': [
+            {'product_info': first.id, 'quantity': 1},
+            {'product_info': third.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(self.basket_quantities(), {first.id: 1, second.id: 3, third.id: 2})
+
+        response = self.client.delete(self.endpoint_url, {'items': [first.id, second.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.basket_quantities(), {third.id: 2})
+
+    def test_unknown_offer_returns_400_and_changes_nothing(self):
+        response = self.client.post(self.endpoint_url, {'items': [
+            {'product_info': self.product_infos[0].id, 'quantity': 1},
+            {'product_info': 0, 'quantity': 1},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['product_infos'], [0])
+        self.assertEqual(self.basket_quantities(), {})
+
+    def test_quantities_are_bounded(self):
+        first, second = self.product_infos[:2]
+        for quantity in (0, basket.MAX_QUANTITY + 1, 2 ** 31):
+            for method in (self.client.post, self.client.put):
+                response = method(self.endpoint_url, {'items': [{'product_info': first.id, 'quantity': quantity}]},
+                                  format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.basket_quantities(), {})
+
+        items = [{'product_info': first.id, 'quantity': basket.MAX_QUANTITY}] * 3
+        items.append({'product_info': second.id, 'quantity': basket.MAX_QUANTITY})
+        for _ in range(2):
+            response = self.client.post(self.endpoint_url, {'items': items}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.basket_quantities(), {first.id: basket.MAX_QUANTITY, second.id: basket.MAX_QUANTITY})
+
+    def test_query_count_does_not_depend_on_lines_count(self):
+        ShoppingBasket.objects.create(user=self.user)
+        counts = []
+        for lines in (self.product_infos[:2], self.product_infos[2:]):
+            items = [{'product_info': product_info.id, 'quantity': 1} for product_info in lines]
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.endpoint_url, {'items': items}, format='json')
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(len(self.basket_quantities()), 50)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestBasketOptimizer(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/basket/optimize/'
+        self.user = User.objects.create(email='buyer@mail.local')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def create_shop(self, name, delivery_price):
+        return Shop.objects.create(name=name, delivery_price=Decimal(delivery_price))
+
+    def create_offer(self, shop, product, price, quantity):
+        return ProductInfo.objects.create(shop=shop, product=product, external_id=product.id, price=Decimal(price),
+                                          quantity=quantity)
+
+    def create_product(self):
+        return Product.objects.create(name=f'product {Product.objects.count()}', price_rrc=Decimal('100.00'))
+
+    def optimize(self, items, **params):
+        response = self.client.post(self.endpoint_url, {
+            'items': [{'product': product.id, 'quantity': quantity} for product, quantity in items], **params,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_goods_are_bought_in_one_shop_when_delivery_costs_more_than_savings(self):
+        cheap, free = self.create_shop('Cheap', '500.00'), self.create_shop('Free delivery', '0.00')
+        first, second = self.create_product(), self.create_product()
+        for product in (first, second):
+            self.create_offer(cheap, product, '100.00', 10)
+            self.create_offer(free, product, '120.00', 10)
+
+        plan = self.optimize([(first, 1), (second, 2)])
+
+        self.assertEqual(plan['shops'], [free.id])
+        self.assertEqual((plan['items_price'], plan['delivery_price'], plan['total_price']),
+                         ('360.00', '0.00', '360.00'))
+        self.assertTrue(plan['optimal'])
+
+    def test_quantity_is_split_when_the_cheapest_shop_lacks_stock(self):
+        eldorado, mvideo = self.create_shop('Eldorado', '10.00'), self.create_shop('MVideo', '10.00')
+        product = self.create_product()
+        cheap = self.create_offer(eldorado, product, '100.00', 3)
+        expensive = self.create_offer(mvideo, product, '150.00', 5)
+
+        plan = self.optimize([(product, 5)])
+
+        self.assertEqual([(item['product_info'], item['quantity']) for item in plan['items']],
+                         [(cheap.id, 3), (expensive.id, 2)])
+        self.assertEqual(plan['total_price'], '620.00')
+
+    def test_missing_stock_returns_409(self):
+        product = self.create_product()
+        self.create_offer(self.create_shop('Eldorado', '0'), product, '100.00', 1)
+
+        response = self.client.post(self.endpoint_url, {'items': [{'product': product.id, 'quantity': 2}]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['products'], [product.id])
+
+    def test_basket_is_optimized_and_replaced(self):
+        expensive, cheap = self.create_shop('Expensive', '0'), self.create_shop('Cheap', '0')
+        product = self.create_product()
+        old = self.create_offer(expensive, product, '200.00', 5)
+        new = self.create_offer(cheap, product, '100.00', 5)
+        shopping_basket = ShoppingBasket.objects.create(user=self.user)
+        ItemInShoppingBasket.objects.create(shopping_basket=shopping_basket, product_info=old, shop=expensive,
+                                            quantity=2)
+
+        response = self.client.post(self.endpoint_url, {'apply': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(ItemInShoppingBasket.objects.values_list('product_info_id', 'shop_id', 'quantity')),
+                         [(new.id, cheap.id, 2)])
+
+    def test_local_search_finds_the_best_shop_set(self):
+        shops = [self.create_shop(f'shop {i}', '300.00') for i in range(4)]
+        products = [self.create_product() for _ in range(4)]
+        for i, product in enumerate(products):
+            for j, shop in enumerate(shops):
+                # every shop is the cheapest for one product, shop 0 is the best overall
+                self.create_offer(shop, product, '100.00' if i == j else f'{110 + 10 * j}.00', 10)
+        quantities = {product.id: 1 for product in products}
+
+        with mock.patch.object(basket_optimizer, 'EXACT_SEARCH_LIMIT', 0):
+            heuristic = basket_optimizer.optimize(quantities)
+        exact = basket_optimizer.optimize(quantities)
+
+        self.assertTrue(exact.optimal)
+        self.assertEqual(exact.shop_ids, [shops[0].id])
+        self.assertEqual(heuristic.total_price, exact.total_price)
+
+    def test_large_basket_is_optimized_within_time_budget(self):
+        shops = Shop.objects.bulk_create([Shop(name=f'shop {i}', delivery_price=Decimal(100 + i)) for i in range(30)])
+        products = Product.objects.bulk_create(
+            [Product(name=f'product {i}', model='', price_rrc=Decimal('100.00')) for i in range(300)]
+        )
+        ProductInfo.objects.bulk_create([
+            ProductInfo(shop=shop, product=product, external_id=product.id, price=Decimal(100 + (i * 7 + j) % 13),
+                        quantity=5)
+            for i, product in enumerate(products) for j, shop in enumerate(shops)
+        ])
+
+        started = time.monotonic()
+        plan = basket_optimizer.optimize({product.id: 3 for product in products}, time_budget=0.5)
+
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(sum(allocation.quantity for allocation in plan.allocations), 900)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestOrderView(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/orders/'
+        self.user = User.objects.create(email='buyer@mail.local')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.shop = Shop.objects.create(name='Eldorado')
+        self.shopping_basket = ShoppingBasket.objects.create(user=self.user)
+        # load the paused shops up front, so query counts do not depend on a cold cache
+        shop_state.get_paused_shop_ids(shared=True)
+
+    def add_to_basket(self, quantity, stock, price='100.00'):
+        product = Product.objects.create(name=f'product_{Product.objects.count()}', price_rrc=Decimal('100.00'))
+        product_info = ProductInfo.objects.create(shop=self.shop, product=product, external_id=product.id,
+                                                  price=Decimal(price), quantity=stock)
+        ItemInShoppingBasket.objects.create(shopping_basket=self.shopping_basket, product_info=product_info,
+                                            shop=self.shop, quantity=quantity)
+        return product_info
+
+    def test_route_resolves_to_correct_view(self):
+        self.assertEqual(resolve(self.endpoint_url).func.view_class, OrderView)
+
+    def test_basket_becomes_an_order(self):
+        first = self.add_to_basket(quantity=1, stock=3)
+        second = self.add_to_basket(quantity=2, stock=2, price='50.00')
+
+        response = self.client.post(self.endpoint_url)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(response.json()['id'], order.id)
+        self.assertEqual(order.number, order.id)
+        self.assertEqual(
+            set(order.ordered_items.values_list('product_info_id', 'quantity', 'price')),
+            {(first.id, 1, Decimal('100.00')), (second.id, 2, Decimal('50.00'))},
+        )
+        self.assertEqual(ProductInfo.objects.get(pk=first.pk).quantity, 2)
+        self.assertEqual(ProductInfo.objects.get(pk=second.pk).quantity, 0)
+        self.assertFalse(ItemInShoppingBasket.objects.exists())
+
+    def test_confirmation_is_emailed_after_commit(self):
+        self.add_to_basket(quantity=2, stock=3, price='150.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.endpoint_url)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@mail.local'])
+        self.assertIn(f"#{response.json()['number']}", mail.outbox[0].subject)
+        self.assertIn('Total: 300.00', mail.outbox[0].body)
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        for lines in (2, 20):
+            for _ in range(lines):
+                self.add_to_basket(quantity=1, stock=5)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.endpoint_url)
+            if lines == 2:
+                expected = len(queries)
+        self.assertEqual(len(queries), expected)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_empty_basket_returns_400(self):
+        response = self.client.post(self.endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_out_of_stock_returns_409_and_changes_nothing(self):
+        available = self.add_to_basket(quantity=1, stock=1)
+        missing = self.add_to_basket(quantity=3, stock=2)
+
+        response = self.client.post(self.endpoint_url)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['product_infos'], [missing.id])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ProductInfo.objects.get(pk=available.pk).quantity, 1)
+        self.assertEqual(ItemInShoppingBasket.objects.count(), 2)
+
+
+class TestInvoices(TestCase):
+    def setUp(self):
+        self.shops = [Shop.objects.create(name=name) for name in ('Eldorado', 'MVideo')]
+        self.users = [User.objects.create(username=f'buyer{i}', email=f'buyer{i}@mail.local') for i in range(2)]
+
+    def create_order(self, user, lines):
+        order = Order.objects.create(user=user, number=Order.objects.count() + 1)
+        for shop, price, quantity in lines:
+            product = Product.objects.create(name=f'product {Product.objects.count()}', price_rrc=Decimal('100.00'))
+            product_info = ProductInfo.objects.create(shop=shop, product=product, external_id=product.id,
+                                                      price=Decimal(price), quantity=10)
+            ItemInOrder.objects.create(order=order, product_info=product_info, shop=shop, quantity=quantity,
+                                       price=product_info.price)
+        return order
+
+    def test_one_invoice_per_shop_with_its_lines(self):
+        eldorado, mvideo = self.shops
+        first = self.create_order(self.users[0], [(eldorado, '100.00', 2), (mvideo, '50.00', 1)])
+        second = self.create_order(self.users[1], [(eldorado, '10.00', 3)])
+
+        stats = invoices.send_invoices()
+
+        self.assertEqual((stats.orders, stats.invoices), (2, 2))
+        messages = {message.subject: message for message in mail.outbox}
+        self.assertEqual(set(messages), {'Invoice: Eldorado', 'Invoice: MVideo'})
+        body = messages['Invoice: Eldorado'].body
+        self.assertIn(f'Order #{first.number}', body)
+        self.assertIn(f'Order #{second.number}', body)
+        self.assertIn('buyer1@mail.local', body)
+        self.assertIn('Total: 230.00', body)
+        self.assertNotIn('50.00', body)
+        self.assertEqual(messages['Invoice: MVideo'].to, settings.INVOICE_RECIPIENTS)
+        self.assertFalse(Order.objects.filter(invoiced_at=None).exists())
+
+        # invoiced orders are not sent again
+        self.assertEqual(invoices.send_invoices().orders, 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_invoice_bills_the_prices_at_checkout(self):
+        order = self.create_order(self.users[0], [(self.shops[0], '100.00', 2)])
+        ProductInfo.objects.update(price=Decimal('150.00'))
+
+        invoices.send_invoices()
+
+        self.assertIn('2 x 100.00', mail.outbox[0].body)
+        self.assertIn('Total: 200.00', mail.outbox[0].body)
+        self.assertNotIn('150.00', mail.outbox[0].body)
+        self.assertEqual(order.ordered_items.get().price, Decimal('100.00'))
+
+    def test_batch_costs_a_fixed_number_of_queries(self):
+        for lines in (1, 10):
+            for user in self.users:
+                self.create_order(user, [(self.shops[i % 2], '10.00', 1) for i in range(lines)])
+            with CaptureQueriesContext(connection) as queries:
+                invoices.send_invoices()
+            # orders with their users, items with offers, products and shops, the UPDATE,
+            # besides the savepoint of the batch transaction within the test's
+            self.assertEqual(len([q for q in queries if 'SAVEPOINT' not in q['sql']]), 3)
+
+    def test_batches_are_sent_over_one_connection(self):
+        for user in self.users * 3:
+            self.create_order(user, [(shop, '10.00', 1) for shop in self.shops])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            stats = invoices.send_invoices(batch_size=2)
+
+        self.assertEqual((stats.orders, stats.invoices), (6, 6))
+        self.assertEqual(len(mail.outbox), 6)
+        open_connection.assert_called_once()
+
+
+    def test_failed_run_does_not_send_the_sent_invoices_again(self):
+        eldorado, mvideo = self.shops
+        only_eldorado = self.create_order(self.users[0], [(eldorado, '10.00', 1)])
+        both = self.create_order(self.users[1], [(eldorado, '10.00', 1), (mvideo, '10.00', 1)])
+        only_mvideo = self.create_order(self.users[0], [(mvideo, '10.00', 1)])
+        send_messages = mail.get_connection().send_messages
+
+        def fail_on_mvideo(messages):
+            if messages[0].subject == 'Invoice: MVideo':
+                raise SMTPException('connection lost')
+            return send_messages(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=fail_on_mvideo), \
+                self.assertRaises(SMTPException):
+            invoices.send_invoices()
+        self.assertEqual(list(Order.objects.filter(invoiced_at=None).order_by('pk')), [both, only_mvideo])
+        self.assertEqual([message.subject for message in mail.outbox], ['Invoice: Eldorado'])
+
+        # the retry sends the invoice of Eldorado again only for the order that has MVideo lines too
+        stats = invoices.send_invoices()
+        self.assertEqual((stats.orders, stats.invoices), (2, 2))
+        retried = {message.subject: message.body for message in mail.outbox[1:]}
+        self.assertNotIn(f'Order #{only_eldorado.number}', retried['Invoice: Eldorado'])
+        self.assertIn(f'Order #{both.number}', retried['Invoice: Eldorado'])
+
+
+class TestOrderAdmin(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='admin', email='admin@nyan.local', is_staff=True,
+                                                    is_superuser=True))
+        self.shop = Shop.objects.create(name='Eldorado')
+        self.buyers = [User.objects.create(username=f'buyer{i}', email=f'buyer{i}@mail.local') for i in range(3)]
+
+    def create_orders(self, count):
+        product = Product.objects.create(name=f'product {Product.objects.count()}', price_rrc=Decimal('100.00'))
+        product_info = ProductInfo.objects.create(shop=self.shop, product=product, external_id=product.id,
+                                                  price=Decimal('25.00'), quantity=10)
+        orders = []
+        for i in range(count):
+            order = Order.objects.create(user=self.buyers[i % 3], number=Order.objects.count() + 1)
+            ItemInOrder.objects.create(order=order, product_info=product_info, shop=self.shop, quantity=i % 3 + 1,
+                                       price=product_info.price)
+            orders.append(order)
+        return orders
+
+    def test_changelist_annotates_items_and_totals_with_a_fixed_number_of_queries(self):
+        self.create_orders(3)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get('/admin/core/order/')
+        self.assertEqual(response.status_code, 200)
+        self.create_orders(30)
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/admin/core/order/')
+
+        self.assertEqual(len(many), len(few))
+        orders = {order.pk: order for order in response.context['cl'].result_list}
+        last = Order.objects.order_by('-id').first()
+        self.assertEqual((orders[last.pk].item_count, orders[last.pk].total), (1, Decimal('75.00')))
+
+    def test_bulk_status_change_is_one_update_with_bulk_notifications(self):
+        orders = self.create_orders(5)
+        orders[0].status = Order.StatusChoices.DELIVERED
+        orders[0].save()
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/core/order/', {
+                'action': 'mark_delivered', '_selected_action': [order.pk for order in orders],
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len([q for q in queries if 'UPDATE core_order' in q['sql']]), 1)
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "core_order"."id" FROM')])
+        self.assertFalse(Order.objects.filter(status=Order.StatusChoices.NOT_DELIVERED).exists())
+        self.assertEqual(Order.objects.filter(delivered_at=None).count(), 1)
+        # the order that was delivered already is not notified again
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         sorted(order.user.email for order in orders[1:]))
+        self.assertIn('is now: delivered', mail.outbox[0].body)
+
+    def test_failed_notifications_retry_only_the_orders_not_notified(self):
+        orders = self.create_orders(5)
+        send_messages = mail.get_connection().send_messages
+
+        def fail_on_third(messages):
+            if len(mail.outbox) == 2:
+                raise SMTPException('connection lost')
+            return send_messages(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=fail_on_third), \
+                mock.patch.object(tasks.send_status_notifications, 'retry', side_effect=Retry) as retry, \
+                self.assertRaises(Retry):
+            tasks.send_status_notifications([order.pk for order in orders])
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(retry.call_args.kwargs['args'], [[order.pk for order in orders[2:]]])
+
+    def test_notifications_are_queued_in_chunks(self):
+        orders = self.create_orders(5)
+
+        with mock.patch('core.tasks.NOTIFICATION_CHUNK_SIZE', 2), \
+                mock.patch('core.tasks.send_status_notifications.run', return_value=None) as send:
+            tasks.queue_status_notifications([order.pk for order in orders])
+
+        self.assertEqual([call.args[0] for call in send.call_args_list],
+                         [[orders[0].pk, orders[1].pk], [orders[2].pk, orders[3].pk], [orders[4].pk]])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestSupplierOrders(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/shop/orders/'
+        self.user = User.objects.create(email='shop@mail.local', username='shop', type=User.TypeChoices.SHOP)
+        self.shop = Shop.objects.create(name='Eldorado', user=self.user)
+        self.other_shop = Shop.objects.create(name='MVideo')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.buyers = 0
+
+    def place_order(self, lines):
+        self.buyers += 1
+        buyer = User.objects.create(email=f'buyer{self.buyers}@mail.local', username=f'buyer{self.buyers}')
+        shopping_basket = ShoppingBasket.objects.create(user=buyer)
+        for shop, quantity in lines:
+            product = Product.objects.create(name=f'product {Product.objects.count()}', price_rrc=Decimal('100.00'))
+            product_info = ProductInfo.objects.create(shop=shop, product=product, external_id=product.id,
+                                                      price=Decimal('90.00'), quantity=10)
+            ItemInShoppingBasket.objects.create(shopping_basket=shopping_basket, product_info=product_info,
+                                                shop=shop, quantity=quantity)
+        return place_order(buyer)
+
+    def test_orders_contain_only_lines_of_the_shop(self):
+        order = self.place_order([(self.shop, 2), (self.other_shop, 1), (self.shop, 3)])
+        self.place_order([(self.other_shop, 1)])
+
+        response = self.client.get(self.endpoint_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results], [order.id])
+        self.assertEqual(results[0]['buyer'], 'buyer1@mail.local')
+        self.assertEqual([item['quantity'] for item in results[0]['items']], [2, 3])
+        self.assertEqual(set(ItemInOrder.objects.values_list('shop_id', flat=True)), {self.shop.id, self.other_shop.id})
+
+    def test_pages_follow_newest_orders_first(self):
+        orders = [self.place_order([(self.shop, 1), (self.other_shop, 1)]) for _ in range(5)]
+
+        ids = []
+        url = f'{self.endpoint_url}?limit=2'
+        while url:
+            data = self.client.get(url).json()
+            ids += [result['id'] for result in data['results']]
+            url = data['next']
+
+        self.assertEqual(ids, [order.id for order in reversed(orders)])
+
+    def test_query_count_does_not_depend_on_orders_count(self):
+        for orders in (2, 10):
+            for _ in range(orders):
+                self.place_order([(self.shop, 1), (self.shop, 2)])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.endpoint_url)
+            if orders == 2:
+                expected = len(queries)
+        self.assertEqual(len(response.json()['results']), 12)
+        self.assertEqual(len(queries), expected)
+
+    def test_buyer_gets_403(self):
+        self.client.force_login(User.objects.create(email='buyer@mail.local', username='buyer'))
+        response = self.client.get(self.endpoint_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestShopState(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/shop/state/'
+        self.supplier = User.objects.create(email='shop@mail.local', username='shop', type=User.TypeChoices.SHOP)
+        self.paused = Shop.objects.create(name='Eldorado', user=self.supplier)
+        self.active = Shop.objects.create(name='MVideo')
+        self.buyer = User.objects.create(email='buyer@mail.local', username='buyer')
+        self.client = APIClient()
+        cache.clear()
+        self.addCleanup(shop_state.invalidate)
+        self.only_paused = self.create_product({self.paused: '90.00'})
+        self.both = self.create_product({self.paused: '80.00', self.active: '100.00'})
+
+    def create_product(self, prices):
+        product = Product.objects.create(name=f'product {Product.objects.count()}', price_rrc=Decimal('100.00'))
+        for shop, price in prices.items():
+            ProductInfo.objects.create(shop=shop, product=product, external_id=product.id, price=Decimal(price),
+                                       quantity=5)
+        return product
+
+    def pause(self):
+        self.client.force_login(self.supplier)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(self.endpoint_url, {'accepts_orders': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'id': self.paused.id, 'name': 'Eldorado', 'accepts_orders': False})
+        self.client.force_login(self.buyer)
+
+    def test_buyer_cannot_change_state(self):
+        self.client.force_login(self.buyer)
+        response = self.client.put(self.endpoint_url, {'accepts_orders': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_catalog_hides_goods_and_offers_of_paused_shop(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(len(self.client.get('/api/products/').json()['results']), 2)
+
+        self.pause()
+
+        self.assertEqual([p['id'] for p in self.client.get('/api/products/').json()['results']], [self.both.id])
+        self.assertEqual(self.client.get('/api/products/', {'price_max': '90'}).json()['results'], [])
+        offers = self.client.get(f'/api/products/{self.both.id}/offers/').json()['offers']
+        self.assertEqual([offer['shop']['name'] for offer in offers], ['MVideo'])
+
+    def test_goods_of_paused_shop_cannot_be_added_or_ordered(self):
+        product_info = ProductInfo.objects.get(shop=self.paused, product=self.both)
+        self.client.force_login(self.buyer)
+        self.client.post('/api/basket/', {'items': [{'product_info': product_info.id, 'quantity': 1}]}, format='json')
+
+        self.pause()
+        added = self.client.post('/api/basket/', {'items': [{'product_info': product_info.id, 'quantity': 1}]},
+                                 format='json')
+        ordered = self.client.post('/api/orders/')
+
+        self.assertEqual(added.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(added.json()['shops'], [self.paused.id])
+        self.assertEqual(ordered.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ItemInShoppingBasket.objects.get().quantity, 1)
+
+    def test_cached_catalog_follows_a_toggle_made_by_another_process(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(len(self.client.get('/api/products/').json()['results']), 2)
+        stale = dict(shop_state._local)
+
+        self.pause()
+        # this process still has the paused shops from before the toggle in memory
+        shop_state._local.update(stale)
+
+        self.assertEqual([p['id'] for p in self.client.get('/api/products/').json()['results']], [self.both.id])
+
+    def test_paused_shops_are_read_from_cache(self):
+        shop_state.get_paused_shop_ids()
+        with self.assertNumQueries(0):
+            self.assertEqual(shop_state.get_paused_shop_ids(), frozenset())
+            self.assertEqual(shop_state.get_paused_shop_ids(shared=True), frozenset())
+        self.pause()
+        with self.assertNumQueries(1):
+            self.assertEqual(shop_state.get_paused_shop_ids(), {self.paused.id})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestConcurrentCheckout(TransactionTestCase):
+    def test_hot_offer_is_never_oversold(self):
+        shop = Shop.objects.create(name='Eldorado')
+        product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        product_info = ProductInfo.objects.create(shop=shop, product=product, external_id=1,
+                                                  price=Decimal('90.00'), quantity=5)
+        users = create_buyers(product_info, 20)
+
+        placed, rejected, _ = checkout_concurrently(users, workers=8)
+
+        self.assertEqual((placed, rejected), (5, 15))
+        self.assertEqual(ProductInfo.objects.get(pk=product_info.pk).quantity, 0)
+        self.assertEqual(sum(ItemInOrder.objects.values_list('quantity', flat=True)), 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestConcurrentInvoices(TransactionTestCase):
+    def test_overlapping_runs_send_every_order_once(self):
+        shops = [Shop.objects.create(name=name) for name in ('Eldorado', 'MVideo')]
+        user = User.objects.create(username='buyer', email='buyer@mail.local')
+        product = Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        for number in range(1, 4):
+            order = Order.objects.create(user=user, number=number)
+            for shop in shops:
+                product_info, _ = ProductInfo.objects.get_or_create(
+                    shop=shop, product=product, external_id=1, defaults={'price': Decimal('90.00'), 'quantity': 5},
+                )
+                ItemInOrder.objects.create(order=order, product_info=product_info, shop=shop, quantity=1,
+                                           price=product_info.price)
+        overlapping = []
+        send_messages = mail.get_connection().send_messages
+
+        def run_again():
+            try:
+                overlapping.append(invoices.send_invoices())
+            finally:
+                connections.close_all()
+
+        def send_while_another_run_starts(messages):
+            if not overlapping:
+                thread = threading.Thread(target=run_again)
+                thread.start()
+                thread.join()
+            return send_messages(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=send_while_another_run_starts):
+            stats = invoices.send_invoices()
+
+        self.assertEqual((stats.orders, stats.invoices), (3, 2))
+        self.assertEqual((overlapping[0].orders, overlapping[0].invoices), (0, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(Order.objects.filter(invoiced_at=None).exists())
+
+
+def make_goods(goods_count, price=1000):
+    return [
+        {
+            'id': i,
+            'category': i % 2 + 1,
+            'model': f'model-{i}',
+            'name': f'product {i}',
+            'price': price + i,
+            'price_rrc': price + i + 100,
+            'quantity': i % 7,
+            'parameters': {'Color': 'black', 'Weight': i},
+        }
+        for i in range(goods_count)
+    ]
+
+
+def make_price_list(goods_count=0, shop='Eldorado', price=1000, goods=None, categories=('TV', 'Audio')):
+    data = {
+        'shop': shop,
+        'categories': [{'id': i, 'name': name} for i, name in enumerate(categories, start=1)],
+        'goods': make_goods(goods_count, price) if goods is None else goods,
+    }
+    return io.BytesIO(yaml.safe_dump(data, allow_unicode=True, sort_keys=False).encode())
+
+
+class TestPriceListImport(TestCase):
+    def test_sample_price_list_is_imported(self):
+        with open(settings.BASE_DIR / 'data' / 'shop1.yaml', 'rb') as stream:
+            stats = import_price_list(stream)
+
+        self.assertEqual(stats.goods, 4)
+        self.assertEqual(stats.shop.name, 'Связной')
+        self.assertEqual(ProductInfo.objects.filter(shop=stats.shop).count(), 4)
+        product_info = ProductInfo.objects.select_related('product').get(external_id=4216292)
+        self.assertEqual(product_info.price, Decimal('110000'))
+        self.assertEqual(product_info.quantity, 14)
+        self.assertEqual(product_info.product.price_rrc, Decimal('116990'))
+        self.assertEqual(list(product_info.product.categories.values_list('name', flat=True)), ['Смартфоны'])
+        self.assertEqual(
+            dict(ProductParameter.objects.filter(product=product_info.product).values_list('parameter__name', 'value')),
+            {'Диагональ (дюйм)': '6.5', 'Разрешение (пикс)': '2688x1242', 'Встроенная память (Гб)': '512', 'Цвет': 'золотистый'},
+        )
+        self.assertEqual(set(stats.shop.categories.values_list('name', flat=True)), {'Смартфоны', 'Аксессуары', 'Flash-накопители'})
+
+    def test_reimport_updates_existing_rows(self):
+        import_price_list(make_price_list(10))
+        import_price_list(make_price_list(10, price=2000))
+
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertEqual(ProductInfo.objects.count(), 10)
+        self.assertEqual(ProductParameter.objects.count(), 20)
+        self.assertEqual(ProductInfo.objects.get(external_id=3).price, Decimal('2003'))
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        import_price_list(make_price_list(1))
+        with CaptureQueriesContext(connection) as small:
+            import_price_list(make_price_list(20, shop='Small'), batch_size=10)
+        with CaptureQueriesContext(connection) as large:
+            import_price_list(make_price_list(200, shop='Large'), batch_size=100)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_incremental_reimport_writes_only_changed_goods(self):
+        import_price_list(make_price_list(10))
+        goods = make_goods(11)
+        goods[3]['price'] = 5000
+        del goods[9]
+
+        stats = import_price_list(make_price_list(goods=goods), incremental=True)
+
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.removed), (1, 1, 8, 1))
+        self.assertEqual(ProductInfo.objects.get(external_id=3).price, Decimal('5000'))
+        self.assertEqual(ProductInfo.objects.get(external_id=9).quantity, 0)
+        self.assertTrue(ProductInfo.objects.filter(external_id=10).exists())
+
+    def test_incremental_reimport_of_unchanged_price_list_does_not_write(self):
+        import_price_list(make_price_list(10))
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = import_price_list(make_price_list(10), incremental=True)
+
+        self.assertEqual(stats.unchanged, 10)
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+
+    def test_incremental_reimport_can_delete_missing_goods(self):
+        import_price_list(make_price_list(10))
+
+        stats = import_price_list(make_price_list(8), incremental=True, missing='delete')
+
+        self.assertEqual(stats.removed, 2)
+        self.assertEqual(ProductInfo.objects.count(), 8)
+
+    def test_deleting_missing_goods_keeps_the_ordered_ones(self):
+        shop = import_price_list(make_price_list(3)).shop
+        ordered = ProductInfo.objects.get(external_id=2)
+        order = Order.objects.create(user=User.objects.create(username='buyer', email='buyer@mail.local'), number=1)
+        ItemInOrder.objects.create(order=order, product_info=ordered, shop=shop, quantity=1, price=ordered.price)
+
+        stats = import_price_list(make_price_list(1), incremental=True, missing='delete')
+
+        self.assertEqual(stats.removed, 2)
+        self.assertEqual(set(ProductInfo.objects.values_list('external_id', 'quantity')), {(0, 0), (2, 0)})
+        self.assertEqual(order.ordered_items.get().product_info, ordered)
+
+    def test_renamed_category_is_written_in_incremental_mode(self):
+        import_price_list(make_price_list(2))
+
+        stats = import_price_list(make_price_list(2, categories=('Televisions', 'Audio')), incremental=True)
+
+        self.assertEqual((stats.updated, stats.unchanged), (1, 1))
+        self.assertTrue(Product.objects.filter(name='product 0', categories__name='Televisions').exists())
+
+    def test_deleting_missing_goods_takes_the_same_queries_for_any_batch(self):
+        import_price_list(make_price_list(30, shop='Few'))
+        import_price_list(make_price_list(30, shop='Many'))
+        with CaptureQueriesContext(connection) as few:
+            import_price_list(make_price_list(28, shop='Few'), incremental=True, missing='delete', batch_size=50)
+
+        with self.assertNumQueries(len(few)):
+            stats = import_price_list(make_price_list(10, shop='Many'), incremental=True, missing='delete',
+                                      batch_size=50)
+
+        self.assertEqual(stats.removed, 20)
+        self.assertEqual(ProductCatalogEntry.objects.filter(shop_count=2).count(), 10)
+
+    def test_progress_is_reported_after_every_batch(self):
+        reported = []
+
+        import_price_list(make_price_list(25), batch_size=10, progress=lambda stats: reported.append(stats.goods))
+
+        self.assertEqual(reported, [10, 20, 25])
+
+    def test_shop_of_another_user_is_not_imported(self):
+        owner = User.objects.create(email='owner@mail.local', username='owner', type=User.TypeChoices.SHOP)
+        other = User.objects.create(email='other@mail.local', username='other', type=User.TypeChoices.SHOP)
+        import_price_list(make_price_list(1), user=owner)
+
+        with self.assertRaises(ValueError):
+            import_price_list(make_price_list(1), user=other)
+        self.assertEqual(Shop.objects.get(name='Eldorado').user, owner)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestPriceListTasks(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(email='shop@mail.local', username='shop', type=User.TypeChoices.SHOP)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def test_buyer_cannot_import(self):
+        self.client.force_login(User.objects.create(email='buyer@mail.local', username='buyer'))
+        response = self.client.post('/api/shop/import/', {'url': 'http://example.com/shop.yaml'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_uploaded_price_list_is_imported_in_background(self):
+        upload = SimpleUploadedFile('shop.yaml', make_price_list(5).getvalue())
+
+        response = self.client.post('/api/shop/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        task = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(task['state'], 'SUCCESS')
+        self.assertEqual(task['result']['goods'], 5)
+        self.assertEqual(ProductInfo.objects.filter(shop__user=self.user).count(), 5)
+
+    def test_task_is_visible_only_to_the_user_who_queued_it(self):
+        upload = SimpleUploadedFile('shop.yaml', make_price_list(1).getvalue())
+        response = self.client.post('/api/shop/import/', {'file': upload}, format='multipart')
+        other = User.objects.create(email='other@mail.local', username='other', type=User.TypeChoices.SHOP)
+        self.client.force_login(other)
+
+        self.assertEqual(self.client.get(response.json()['status_url']).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/tasks/unknown/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_only_public_http_urls_are_fetched(self):
+        response = self.client.post('/api/shop/import/', {'url': 'file:///etc/passwd'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for url in ('http://127.0.0.1:6379/', 'http://169.254.169.254/latest/meta-data/', 'http://10.0.0.1/'):
+            with self.subTest(url=url), self.assertRaises(downloads.ForbiddenURL):
+                tasks.import_price_list_task.apply([self.user.pk], {'url': url})
+        with self.assertRaises(downloads.ForbiddenURL):
+            downloads._RedirectHandler().redirect_request(None, None, 302, 'Found', {}, 'file:///etc/passwd')
+
+    def test_downloaded_price_list_is_cut_off_at_max_size(self):
+        stream = downloads.LimitedStream(io.BytesIO(b'x' * 11), max_size=10)
+
+        self.assertEqual(stream.read(4), b'xxxx')
+        with self.assertRaises(downloads.TooLarge):
+            stream.read()
+
+    def test_failed_import_is_reported(self):
+        Shop.objects.create(name='Eldorado', user=User.objects.create(email='owner@mail.local', username='owner'))
+        upload = SimpleUploadedFile('shop.yaml', make_price_list(1).getvalue())
+
+        with self.assertRaises(ValueError):
+            self.client.post('/api/shop/import/', {'file': upload}, format='multipart')
+        self.assertFalse(ProductInfo.objects.exists())
+        self.assertEqual(default_storage.listdir('imports'), ([], []))
+
+    def test_upload_is_kept_for_retries_and_deleted_after_the_last_one(self):
+        upload = SimpleUploadedFile('shop.yaml', make_price_list(1).getvalue())
+        unreachable = mock.patch('core.tasks._open_price_list', side_effect=URLError('unreachable'))
+
+        with unreachable, self.assertRaises(Retry):
+            self.client.post('/api/shop/import/', {'file': upload}, format='multipart')
+        _, (name,) = default_storage.listdir('imports')
+
+        with unreachable, self.assertRaises(URLError):
+            tasks.import_price_list_task.apply(
+                [self.user.pk], {'path': f'imports/{name}'}, retries=tasks.import_price_list_task.max_retries,
+            )
+        self.assertEqual(default_storage.listdir('imports'), ([], []))
+
+    def test_exported_price_list_can_be_imported_again(self):
+        import_price_list(make_price_list(5), user=self.user)
+
+        response = self.client.post('/api/shop/export/')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        task = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(task['state'], 'SUCCESS')
+        with open(f"{settings.MEDIA_ROOT}/{task['result']['path']}", 'rb') as export:
+            before = set(ProductInfo.objects.values_list('external_id', 'product_id', 'price', 'quantity'))
+            stats = import_price_list(export)
+        self.assertEqual(stats.shop.user, self.user)
+        self.assertEqual(stats.goods, 5)
+        self.assertEqual(set(ProductInfo.objects.values_list('external_id', 'product_id', 'price', 'quantity')), before)
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_yaml_export_of_empty_shop_is_valid(self):
+        shop = Shop.objects.create(name='Empty')
+        self.assertEqual(yaml.safe_load(''.join(iter_yaml(shop))), {'shop': 'Empty', 'categories': [], 'goods': []})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestPriceListExport(TestCase):
+    def setUp(self):
+        self.endpoint_url = '/api/shop/export/'
+        self.user = User.objects.create(email='shop@mail.local', username='shop', type=User.TypeChoices.SHOP)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.shop = import_price_list(make_price_list(5), user=self.user).shop
+
+    def download(self, file_format):
+        response = self.client.get(self.endpoint_url, {'file_format': file_format})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_yaml_export_has_price_list_schema(self):
+        data = yaml.safe_load(self.download('yaml'))
+
+        self.assertEqual(data['shop'], 'Eldorado')
+        self.assertEqual({category['name'] for category in data['categories']}, {'TV', 'Audio'})
+        self.assertEqual(len(data['goods']), 5)
+        category_names = {category['id']: category['name'] for category in data['categories']}
+        self.assertEqual({**data['goods'][3], 'category': category_names[data['goods'][3]['category']]}, {
+            'id': 3, 'category': 'Audio', 'model': 'model-3', 'name': 'product 3', 'price': 1003,
+            'price_rrc': 1103, 'quantity': 3, 'parameters': {'Color': 'black', 'Weight': '3'},
+        })
+
+    def test_jsonl_export_has_a_good_per_line(self):
+        goods = [json.loads(line) for line in self.download('jsonl').splitlines()]
+
+        self.assertEqual([good['id'] for good in goods], [0, 1, 2, 3, 4])
+        self.assertEqual(goods[1]['shop'], 'Eldorado')
+        self.assertEqual(goods[1]['category_name'], 'Audio')
+        self.assertEqual(goods[1]['parameters'], {'Color': 'black', 'Weight': '1'})
+
+    def test_csv_export_has_a_header_and_a_good_per_row(self):
+        rows = list(csv.DictReader(io.StringIO(self.download('csv'))))
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[2]['name'], 'product 2')
+        self.assertEqual(rows[2]['price'], '1002')
+        self.assertEqual(json.loads(rows[2]['parameters']), {'Color': 'black', 'Weight': '2'})
+
+    def test_unknown_format_returns_400(self):
+        response = self.client.get(self.endpoint_url, {'file_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_does_not_depend_on_goods_count(self):
+        large = import_price_list(make_price_list(50, shop='Large')).shop
+        with CaptureQueriesContext(connection) as small_queries:
+            ''.join(iter_export(self.shop, 'jsonl', chunk_size=100))
+        with CaptureQueriesContext(connection) as large_queries:
+            ''.join(iter_export(large, 'jsonl', chunk_size=100))
+
+        self.assertEqual(len(small_queries), len(large_queries))
+
+
+class TestBenchmarks(TestCase):
+    def test_generated_price_lists_are_deterministic_and_importable(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            paths = benchmark_data.write_price_lists(first, 40)
+            again = benchmark_data.write_price_lists(second, 40)
+            self.assertEqual(
+                [open(path, 'rb').read() for path in paths], [open(path, 'rb').read() for path in again],
+            )
+            for path in paths:
+                with open(path, 'rb') as stream:
+                    import_price_list(stream)
+
+        with open(settings.BASE_DIR / 'data' / 'shop1.yaml', 'rb') as stream:
+            sample = yaml.safe_load(stream)
+        good = next(benchmark_data.iter_shop_goods(40, 0))
+        self.assertEqual(good.keys(), sample['goods'][0].keys())
+        self.assertEqual(Product.objects.count(), 40)
+        # every product is offered by two shops
+        self.assertEqual(ProductInfo.objects.count(), 80)
+
+    def test_api_benchmarks_report_latency_queries_and_memory(self):
+        results = api_benchmarks.run([40], repeat=2)
+
+        json.dumps(results)
+        result, = results['results']
+        self.assertEqual(result['scale'], 40)
+        self.assertEqual(set(result['benchmarks']), {
+            'products_first_page', 'products_deep_page', 'products_category', 'products_shop_in_stock',
+            'products_facets', 'basket', 'export_jsonl', 'import',
+        })
+        for benchmark in result['benchmarks'].values():
+            self.assertGreater(benchmark['queries'], 0)
+            self.assertGreater(benchmark['peak_memory_kb'], 0)
+            self.assertLessEqual(benchmark['latency_ms']['min'], benchmark['latency_ms']['p99'])
+        # the data is rolled back
+        self.assertFalse(Product.objects.exists())
+
+        slower = json.loads(json.dumps(results))
+        slower['results'][0]['benchmarks']['basket']['latency_ms']['p50'] *= 2
+        regressed = [name for _, name, _, _, _, regressed in api_benchmarks.compare(results, slower) if regressed]
+        self.assertEqual(regressed, ['basket'])
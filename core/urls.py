@@ -1,9 +1,27 @@
 from django.urls import path
 
-from core.views import ProductsView, BasketView
+from core import async_views
+from core.views import (
+    BasketOptimizeView, BasketView, OrderView, PriceListExportView, PriceListImportView, ProductOffersBatchView,
+    ProductOffersView, ProductSearchView, ProductsView, ShopStateView, StatsView, SupplierOrdersView, TaskView,
+)
 
 urlpatterns = [
-    path('products/', ProductsView.as_view()),
-    path('basket/', BasketView.as_view()),
-
-]
\ No newline at end of file
+    path('products/', ProductsView.as_view(), name='products'),
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
+    path('products/offers/', ProductOffersBatchView.as_view(), name='product-offers-batch'),
+    path('products/<int:pk>/offers/', ProductOffersView.as_view(), name='product-offers'),
+    path('basket/', BasketView.as_view(), name='basket'),
+    path('basket/optimize/', BasketOptimizeView.as_view(), name='basket-optimize'),
+    path('orders/', OrderView.as_view(), name='orders'),
+    path('shop/import/', PriceListImportView.as_view(), name='shop-import'),
+    path('shop/export/', PriceListExportView.as_view(), name='shop-export'),
+    path('shop/orders/', SupplierOrdersView.as_view(), name='shop-orders'),
+    path('shop/state/', ShopStateView.as_view(), name='shop-state'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('tasks/<str:task_id>/', TaskView.as_view(), name='task'),
+    path('async/products/', async_views.products, name='async-products'),
+    path('async/products/offers/', async_views.product_offers_batch, name='async-product-offers-batch'),
+    path('async/products/<int:pk>/offers/', async_views.product_offers, name='async-product-offers'),
+    path('async/basket/', async_views.basket, name='async-basket'),
+]
@@ -1,26 +1,389 @@
-from drf_yasg.utils import swagger_auto_schema
-from rest_framework import views
-from rest_framework.permissions import IsAuthenticated
+import uuid
+
+from celery.result import AsyncResult
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from drf_yasg.utils import no_body, swagger_auto_schema
+from rest_framework import status, views
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from core.models import Product, ShoppingBasket
-from core.serializers.products import ProductSerializer
-from core.serializers.shopping_basket import BasketSerializer
+from config.db_router import iter_replica, pin_primary, replica_reads
+from core import instrumentation, tasks
+from core.models import ItemInOrder, ItemInShoppingBasket, Order, Product
+from core.pagination import KeysetPagination, SupplierOrderPagination
+from core.permissions import IsShop
+from core.serializers.fast import BASKET_ITEM_FIELDS, PRODUCT_FIELDS, serialize_basket, serialize_products
+from core.serializers.orders import OrderSerializer, SupplierOrderSerializer
+from core.serializers.products import (
+    ProductFilterSerializer, ProductOffersRequestSerializer, ProductOffersSerializer, ProductSearchSerializer,
+    ProductSerializer,
+)
+from core.serializers.shops import ShopStateSerializer
+from core.serializers.shopping_basket import (
+    BasketLinesSerializer, BasketOptimizeSerializer, BasketPlanSerializer, BasketRemoveSerializer, BasketSerializer,
+)
+from core.serializers.tasks import PriceListExportSerializer, PriceListImportSerializer, TaskSerializer
+from core.services import basket, catalog_cache, catalog_entries, shop_state
+from core.services.basket_optimizer import InsufficientStock, optimize
+from core.services.checkout import EmptyBasket, OutOfStock, place_order
+from core.services.facets import get_facets
+from core.services.offers import compare_offers
+from core.services.price_list_export import EXPORT_FORMATS, iter_export
+from core.services.product_search import search_products
 
 
 class ProductsView(views.APIView):
     permission_classes = [IsAuthenticated]
-    @swagger_auto_schema(responses={200: ProductSerializer()})
+    pagination_class = KeysetPagination
+
+    @swagger_auto_schema(query_serializer=ProductFilterSerializer, responses={200: ProductSerializer(many=True)})
+    @replica_reads
+    def get(self, request, *args, **kwargs):
+        filters = ProductFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+        facets = params.pop('facets', False)
+        data = catalog_cache.get_or_set(
+            request,
+            lambda: self.get_page_data(request, params, facets),
+            shops=[params['shop']] if 'shop' in params else (),
+            categories=[params['category']] if 'category' in params else (),
+        )
+        return Response(data)
+
+    def get_page_data(self, request, params, facets=False):
+        # the shared set: a page computed from a stale process copy would be cached for the whole cache timeout
+        paused_shops = shop_state.get_paused_shop_ids(shared=True)
+        products, rows = catalog_entries.get_catalog_rows(params, paused_shops)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        data = paginator.get_paginated_response(serialize_products(page)).data
+        if facets:
+            # in_stock is False rather than missing when it is not given;
+            # the materialized view also counts the products only paused shops offer
+            data['facets'] = get_facets(products if paused_shops or any(params.values()) else None)
+        return data
+
+
+class ProductSearchView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(query_serializer=ProductSearchSerializer, responses={200: ProductSerializer(many=True)})
+    @replica_reads
     def get(self, request, *args, **kwargs):
-        queryset = Product.objects.all()
-        serializer = ProductSerializer(queryset, many=True)
-        return Response(serializer.data)
+        """
+        Full-text search over product names, models and parameter values, best matches first.
+        """
+        serializer = ProductSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        rows = search_products(params['q']).values(*PRODUCT_FIELDS)[:params['limit']]
+        return Response({'results': serialize_products(rows)})
+
+
+class ProductOffersView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(responses={200: ProductOffersSerializer()})
+    @replica_reads
+    def get(self, request, pk, *args, **kwargs):
+        """
+        In-stock offers of a product from all shops, cheapest first.
+        """
+        data, = compare_offers([pk])
+        if not data['offers'] and not Product.objects.filter(pk=pk).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+
+class ProductOffersBatchView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(request_body=ProductOffersRequestSerializer, responses={200: ProductOffersSerializer(many=True)})
+    @replica_reads
+    def post(self, request, *args, **kwargs):
+        """
+        In-stock offers of many products, read with one query whatever the number of products.
+        """
+        serializer = ProductOffersRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(compare_offers(serializer.validated_data['products']))
 
 
 class BasketView(views.APIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BasketSerializer
+
+    @swagger_auto_schema(responses={200: BasketSerializer()})
     def get(self, request, *args, **kwargs):
-        shopping_basket = ShoppingBasket.objects.prefetch_related('items__product_info', 'items__shop').get(user=request.user)
-        serializer = BasketSerializer(shopping_basket)
-        return Response(serializer.data)
+        items = ItemInShoppingBasket.objects.filter(shopping_basket__user=request.user).with_totals().order_by('id')
+        return Response(serialize_basket(items.values_list(*BASKET_ITEM_FIELDS)))
+
+    @swagger_auto_schema(request_body=BasketLinesSerializer, responses={200: BasketSerializer()})
+    def post(self, request, *args, **kwargs):
+        """
+        Add offers to the basket, incrementing the quantities of offers already there.
+        """
+        serializer = BasketLinesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantities = {}
+        for line in serializer.validated_data['items']:
+            quantities[line['product_info']] = min(
+                quantities.get(line['product_info'], 0) + line['quantity'], basket.MAX_QUANTITY,
+            )
+        return self.mutate(basket.add_items, request, quantities)
+
+    @swagger_auto_schema(request_body=BasketLinesSerializer, responses={200: BasketSerializer()})
+    def put(self, request, *args, **kwargs):
+        """
+        Set the quantities of offers in the basket.
+        """
+        serializer = BasketLinesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantities = {line['product_info']: line['quantity'] for line in serializer.validated_data['items']}
+        return self.mutate(basket.set_items, request, quantities)
+
+    @swagger_auto_schema(request_body=BasketRemoveSerializer, responses={200: BasketSerializer()})
+    def delete(self, request, *args, **kwargs):
+        """
+        Remove offers from the basket.
+        """
+        serializer = BasketRemoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.mutate(basket.remove_items, request, serializer.validated_data['items'])
+
+    def mutate(self, action, request, items):
+        try:
+            action(request.user, items)
+        except basket.UnknownOffers as e:
+            return Response({'detail': str(e), 'product_infos': e.product_info_ids}, status=status.HTTP_400_BAD_REQUEST)
+        except shop_state.ShopsNotAcceptingOrders as e:
+            return Response({'detail': str(e), 'shops': e.shop_ids}, status=status.HTTP_409_CONFLICT)
+        return self.get(request)
+
+
+class BasketOptimizeView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(request_body=BasketOptimizeSerializer, responses={200: BasketPlanSerializer()})
+    def post(self, request, *args, **kwargs):
+        """
+        Choose the offers of the given products, or of the products in the basket,
+        with the lowest price of the goods plus delivery from every shop used.
+        """
+        serializer = BasketOptimizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if 'items' in params:
+            quantities = {}
+            for item in params['items']:
+                quantities[item['product']] = min(quantities.get(item['product'], 0) + item['quantity'], basket.MAX_QUANTITY)
+        else:
+            quantities = basket.get_product_quantities(request.user)
+        if not quantities:
+            return Response({'detail': 'The basket is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            plan = optimize(quantities, time_budget=params['time_budget'])
+        except InsufficientStock as e:
+            return Response({'detail': str(e), 'products': e.product_ids}, status=status.HTTP_409_CONFLICT)
+        if params['apply']:
+            try:
+                basket.replace_items(
+                    request.user, {allocation.product_info_id: allocation.quantity for allocation in plan.allocations},
+                )
+            except shop_state.ShopsNotAcceptingOrders as e:
+                return Response({'detail': str(e), 'shops': e.shop_ids}, status=status.HTTP_409_CONFLICT)
+        return Response(BasketPlanSerializer(plan).data)
+
+
+class OrderView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(request_body=no_body, responses={201: OrderSerializer()})
+    def post(self, request, *args, **kwargs):
+        """
+        Place an order with everything in the user's basket.
+        """
+        try:
+            order = place_order(request.user)
+        except EmptyBasket as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OutOfStock as e:
+            return Response({'detail': str(e), 'product_infos': e.product_info_ids}, status=status.HTTP_409_CONFLICT)
+        except shop_state.ShopsNotAcceptingOrders as e:
+            return Response({'detail': str(e), 'shops': e.shop_ids}, status=status.HTTP_409_CONFLICT)
+        transaction.on_commit(lambda: tasks.send_order_confirmation.delay(order.pk))
+        # the order changed the stock the user sees in the catalog
+        pin_primary(request.user)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class ShopStateView(views.APIView):
+    permission_classes = [IsShop]
+
+    @swagger_auto_schema(responses={200: ShopStateSerializer()})
+    def get(self, request, *args, **kwargs):
+        shop = getattr(request.user, 'shop', None)
+        if shop is None:
+            return Response({'detail': 'The user has no shop'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ShopStateSerializer(shop).data)
+
+    @swagger_auto_schema(request_body=ShopStateSerializer, responses={200: ShopStateSerializer()})
+    def put(self, request, *args, **kwargs):
+        """
+        Enable or disable accepting orders. A shop that does not accept orders is hidden
+        from the catalog, and its goods cannot be added to baskets or ordered.
+        """
+        shop = getattr(request.user, 'shop', None)
+        if shop is None:
+            return Response({'detail': 'The user has no shop'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = ShopStateSerializer(shop, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        shop_state.set_accepts_orders(shop, serializer.validated_data['accepts_orders'])
+        pin_primary(request.user)
+        return Response(ShopStateSerializer(shop).data)
+
+
+class SupplierOrdersView(views.APIView):
+    permission_classes = [IsShop]
+    pagination_class = SupplierOrderPagination
+
+    @swagger_auto_schema(responses={200: SupplierOrderSerializer(many=True)})
+    def get(self, request, *args, **kwargs):
+        """
+        Orders with goods of the supplier's shop, newest first, with the lines of that shop only.
+        """
+        shop = getattr(request.user, 'shop', None)
+        if shop is None:
+            return Response({'detail': 'The user has no shop'}, status=status.HTTP_404_NOT_FOUND)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(
+            ItemInOrder.objects.filter(shop=shop).values('order_id').distinct(), request, view=self,
+        )
+        orders = (
+            Order.objects.filter(pk__in=[row['order_id'] for row in page])
+            .select_related('user')
+            .prefetch_related(Prefetch(
+                'ordered_items',
+                queryset=ItemInOrder.objects.filter(shop=shop).select_related('product_info__product').order_by('id'),
+                to_attr='shop_items',
+            ))
+            .order_by('-id')
+        )
+        return paginator.get_paginated_response(SupplierOrderSerializer(orders, many=True).data)
+
+
+class StatsView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(responses={200: 'Request stats per URL name'})
+    def get(self, request, *args, **kwargs):
+        """
+        Latency, query count, query time and serializer time percentiles of the latest
+        requests per URL name, and the requests flagged for N+1 queries. The stats are
+        those of the process that serves the request.
+        """
+        return Response(instrumentation.stats.snapshot())
+
+    @swagger_auto_schema(responses={204: 'Stats are reset'})
+    def delete(self, request, *args, **kwargs):
+        instrumentation.stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def _task_owner_key(task_id):
+    return f'task:owner:{task_id}'
+
+
+def task_accepted(request, result):
+    # the results name the shop and the export files, so only the user who queued the task may read them
+    cache.set(_task_owner_key(result.id), request.user.pk, settings.CELERY_RESULT_EXPIRES)
+    return Response({
+        'task_id': result.id,
+        'status_url': request.build_absolute_uri(reverse('core.urls:task', args=[result.id])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+class PriceListImportView(views.APIView):
+    permission_classes = [IsShop]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    @swagger_auto_schema(request_body=PriceListImportSerializer, responses={202: 'Import task is queued'})
+    def post(self, request, *args, **kwargs):
+        """
+        Queue an import of the supplier's price list from a url or an uploaded file.
+        """
+        serializer = PriceListImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        path = None
+        if 'file' in params:
+            path = default_storage.save(f'imports/{uuid.uuid4().hex}.yaml', params['file'])
+        result = tasks.import_price_list_task.delay(
+            request.user.pk, url=params.get('url'), path=path,
+            incremental=params['incremental'], missing=params['missing'],
+        )
+        return task_accepted(request, result)
+
+
+class PriceListExportView(views.APIView):
+    permission_classes = [IsShop]
+
+    @swagger_auto_schema(query_serializer=PriceListExportSerializer, responses={200: 'Price list file'})
+    def get(self, request, *args, **kwargs):
+        """
+        Download the supplier's price list. The file is streamed while the goods are read.
+        """
+        shop, export_format = self.get_params(request, request.query_params)
+        if shop is None:
+            return self.no_shop()
+        _, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(iter_replica(iter_export(shop, export_format), request.user),
+                                         content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="shop-{shop.pk}.{export_format}"'
+        # let nginx pass the chunks through instead of buffering the whole file
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @swagger_auto_schema(request_body=PriceListExportSerializer, responses={202: 'Export task is queued'})
+    def post(self, request, *args, **kwargs):
+        """
+        Queue an export of the supplier's price list to a file.
+        """
+        shop, export_format = self.get_params(request, request.data)
+        if shop is None:
+            return self.no_shop()
+        return task_accepted(request, tasks.export_price_list_task.delay(shop.pk, export_format))
+
+    def get_params(self, request, data):
+        serializer = PriceListExportSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return getattr(request.user, 'shop', None), serializer.validated_data['file_format']
+
+    def no_shop(self):
+        return Response({'detail': 'The user has no shop'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class TaskView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(responses={200: TaskSerializer()})
+    def get(self, request, task_id, *args, **kwargs):
+        if cache.get(_task_owner_key(task_id)) != request.user.pk:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        result = AsyncResult(task_id)
+        data = {'id': task_id, 'state': result.state}
+        if result.state == tasks.PROGRESS:
+            data['progress'] = result.info
+        elif result.successful():
+            data['result'] = result.result
+        elif result.failed():
+            data['error'] = str(result.result)
+        return Response(data)
@@ -0,0 +1,104 @@
+"""
+Token authentication with cached token lookups.
+
+Resolving a token costs a query on every request, so resolved tokens (with their
+user) are cached twice: in Redis for AUTH_TOKEN_CACHE_TIMEOUT, and in a small
+in-process LRU for AUTH_TOKEN_LOCAL_TIMEOUT seconds. Changing or deleting a user or
+deleting a token clears the Redis entries and the LRU of the process doing it;
+other processes see the change once their short-lived local entry expires.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+LOCAL_SIZE = 10_000
+
+
+class LocalCache:
+    """
+    Least recently used entries with an expiry time, safe to share between threads.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalCache(LOCAL_SIZE)
+
+
+def _cache_key(token_key):
+    # the raw token is a credential, it is not written to Redis in clear
+    return 'auth:token:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+
+def invalidate(token_keys):
+    token_keys = list(token_keys)
+    for token_key in token_keys:
+        _local.delete(_cache_key(token_key))
+    cache.delete_many([_cache_key(token_key) for token_key in token_keys])
+
+
+def _user_fields(user):
+    # the password hash is left out, it is loaded on access if ever needed
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname != 'password'
+    }
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    DRF token authentication (`Authorization: Token <key>`) answered from the caches when possible.
+    Every request gets its own user instance built from the cached field values,
+    so objects cached on one request's user never leak into another request.
+    """
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        fields = _local.get(cache_key)
+        if fields is None:
+            fields = cache.get(cache_key)
+            if fields is None:
+                # raises AuthenticationFailed for unknown tokens and inactive users
+                user, _ = super().authenticate_credentials(key)
+                fields = _user_fields(user)
+                cache.set(cache_key, fields, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            _local.set(cache_key, fields, settings.AUTH_TOKEN_LOCAL_TIMEOUT)
+        User = get_user_model()
+        user = User.from_db(None, list(fields), list(fields.values()))
+        token = self.get_model().from_db(None, ['key', 'user_id'], [key, user.pk])
+        token.user = user
+        return user, token
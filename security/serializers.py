@@ -0,0 +1,43 @@
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from rest_framework import serializers
+
+from security.models import User
+
+
+class UserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'email', 'first_name', 'last_name', 'company', 'position', 'type']
+        read_only_fields = fields
+
+
+class RegisterSerializer(serializers.ModelSerializer):
+    password = serializers.CharField(write_only=True, style={'input_type': 'password'})
+
+    class Meta:
+        model = User
+        fields = ['email', 'password', 'first_name', 'last_name', 'company', 'position', 'type']
+
+    def validate(self, attrs):
+        password = attrs.pop('password')
+        try:
+            validate_password(password, User(**attrs))
+        except ValidationError as e:
+            raise serializers.ValidationError({'password': list(e.messages)})
+        attrs['password'] = password
+        return attrs
+
+    def create(self, validated_data):
+        # the username is unique too, the email is used for it
+        return User.objects.create_user(username=validated_data['email'], **validated_data)
+
+
+class LoginSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    password = serializers.CharField(style={'input_type': 'password'})
+
+
+class TokenSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    user = UserSerializer()
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from security import authentication
+from security.models import User
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # e.g. a deactivated user or a changed user type must not be served from the token cache
+    authentication.invalidate(Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    authentication.invalidate([instance.key])
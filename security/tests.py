@@ -1,3 +1,75 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Product
+from core.services import shop_state
+from security import authentication
+from security.models import User
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestTokenAuthentication(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        authentication._local.clear()
+        shop_state.get_paused_shop_ids(shared=True)
+
+    def register(self, **data):
+        return self.client.post('/api/auth/register/', {
+            'email': 'john.doe@mail.local', 'password': 'correct-horse-battery', 'first_name': 'John', **data,
+        })
+
+    def test_registered_user_logs_in_and_gets_a_token(self):
+        response = self.register(type='shop')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['user']['type'], 'shop')
+        token = response.json()['token']
+
+        response = self.client.post('/api/auth/login/', {
+            'email': 'john.doe@mail.local', 'password': 'correct-horse-battery',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['token'], token)
+
+    def test_weak_password_and_wrong_credentials_are_rejected(self):
+        response = self.register(password='12345')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.json())
+
+        self.register()
+        response = self.client.post('/api/auth/login/', {'email': 'john.doe@mail.local', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cached_token_makes_no_auth_queries(self):
+        Product.objects.create(name='TV', price_rrc=Decimal('100.00'))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.register().json()['token']}")
+
+        with self.assertNumQueries(2):
+            # the token lookup and the catalog page
+            self.assertEqual(self.client.get('/api/products/').status_code, status.HTTP_200_OK)
+        authentication._local.clear()
+        with self.assertNumQueries(0):
+            # the token is read from the shared cache and the page from the catalog cache
+            self.assertEqual(self.client.get('/api/products/').status_code, status.HTTP_200_OK)
+
+    def test_deactivated_user_and_revoked_token_are_rejected_at_once(self):
+        token = self.register().json()['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(self.client.get('/api/basket/').status_code, status.HTTP_200_OK)
+
+        user = User.objects.get(email='john.doe@mail.local')
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get('/api/basket/').status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_active = True
+        user.save()
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get('/api/basket/').status_code, status.HTTP_403_FORBIDDEN)
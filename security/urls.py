@@ -0,0 +1,9 @@
+from django.urls import path
+
+from security.views import LoginView, LogoutView, RegisterView
+
+urlpatterns = [
+    path('register/', RegisterView.as_view(), name='register'),
+    path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+]
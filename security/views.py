@@ -1,3 +1,55 @@
-from django.shortcuts import render
+from django.contrib.auth import authenticate
+from drf_yasg.utils import no_body, swagger_auto_schema
+from rest_framework import status, views
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
 
-# Create your views here.
+from security.serializers import LoginSerializer, RegisterSerializer, TokenSerializer
+
+
+def token_response(user, status_code=status.HTTP_200_OK):
+    token, _ = Token.objects.get_or_create(user=user)
+    return Response(TokenSerializer({'token': token.key, 'user': user}).data, status=status_code)
+
+
+class RegisterView(views.APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(request_body=RegisterSerializer, responses={201: TokenSerializer()})
+    def post(self, request, *args, **kwargs):
+        """
+        Register a buyer or a supplier and get an API token.
+        """
+        serializer = RegisterSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return token_response(serializer.save(), status.HTTP_201_CREATED)
+
+
+class LoginView(views.APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(request_body=LoginSerializer, responses={200: TokenSerializer()})
+    def post(self, request, *args, **kwargs):
+        """
+        Get the API token of a user, to be sent as `Authorization: Token <token>`.
+        """
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = authenticate(request, email=serializer.validated_data['email'],
+                            password=serializer.validated_data['password'])
+        if user is None:
+            return Response({'detail': 'Invalid email or password'}, status=status.HTTP_400_BAD_REQUEST)
+        return token_response(user)
+
+
+class LogoutView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(request_body=no_body, responses={204: 'The token is revoked'})
+    def post(self, request, *args, **kwargs):
+        """
+        Revoke the user's API token.
+        """
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)